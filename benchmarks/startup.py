@@ -0,0 +1,70 @@
+"""
+Measures how long it takes to import the CLI entry-point, using `python -X importtime` (requires Python >= 3.7), and
+checks that heavy libraries are not imported until they are needed.
+
+Usage (from the project directory):
+    PYTHONPATH=. python benchmarks/startup.py [--repeats 5] [--top 10]
+"""
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+from typing import Dict, List, Tuple
+
+_ENTRYPOINT_MODULE = "openstacktenantcleaner.entrypoint"
+
+# Libraries that should only be imported when a manager or tracker backend that requires them is first used
+LAZILY_IMPORTED_MODULES = ["apscheduler", "sqlalchemy", "novaclient", "glanceclient", "keystoneclient", "dateutil",
+                           "kombu"]
+
+_IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def _measure_import_times() -> Dict[str, Tuple[int, int, int]]:
+    """
+    Imports the entry-point in a new interpreter and gets the time taken to import each module that it imported
+    (excluding those imported by the interpreter on start-up).
+    :return: map between each imported module and the time in microseconds taken to import it, excluding and including
+    the modules that it imported, and the depth of the import (0 for the entry-point, 1 for its direct imports...)
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {_ENTRYPOINT_MODULE}"],
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    import_times: Dict[str, Tuple[int, int, int]] = {}
+    for line in process.stderr.splitlines():
+        match = _IMPORT_TIME_PATTERN.match(line)
+        if match is None:
+            continue
+        # Imports are listed after the modules that they import, with their depth shown by indentation
+        depth = len(match.group(3)) // 2
+        import_times[match.group(4)] = (int(match.group(1)), int(match.group(2)), depth)
+        if depth == 0 and match.group(4) != _ENTRYPOINT_MODULE:
+            import_times.clear()
+    return import_times
+
+
+def main():
+    parser = ArgumentParser(description="Entry-point import time benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="number of times to import the entry-point")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest direct imports to show")
+    arguments = parser.parse_args()
+
+    runs = [_measure_import_times() for _ in range(arguments.repeats)]
+    totals: List[int] = sorted(run[_ENTRYPOINT_MODULE][1] for run in runs)
+    print(f"Import of {_ENTRYPOINT_MODULE}: median {totals[len(totals) // 2] / 1000:.1f}ms, "
+          f"min {totals[0] / 1000:.1f}ms, max {totals[-1] / 1000:.1f}ms")
+
+    fastest = runs[[run[_ENTRYPOINT_MODULE][1] for run in runs].index(totals[0])]
+    top_level = {module: cumulative for module, (_, cumulative, depth) in fastest.items() if depth == 1}
+    print("Slowest direct imports:")
+    for module, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:arguments.top]:
+        print(f"  {module}: {cumulative / 1000:.1f}ms")
+
+    eagerly_imported = [module for module in LAZILY_IMPORTED_MODULES if module in fastest]
+    if len(eagerly_imported) > 0:
+        print(f"Modules that should be imported lazily were imported on start-up: {eagerly_imported}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the throughput of the tracker backends.
+
+Usage (from the project directory):
+    PYTHONPATH=. python benchmarks/tracking.py [--items 10000] [--cycles 10]
+"""
+import os
+import tempfile
+import timeit
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+
+from typing import Callable, List, Dict
+
+from openstacktenantcleaner._logstore.tracking import LogTracker
+from openstacktenantcleaner._sqlalchemy.migrations import migrate
+from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
+from openstacktenantcleaner.models import OpenstackImage, OpenstackKeypair, OpenstackItem
+from openstacktenantcleaner.tracking import Tracker
+
+_CHURN_PER_CYCLE = 0.05
+
+
+def _create_sql_tracker(directory: str) -> Tracker:
+    location = f"sqlite:///{os.path.join(directory, 'tracking.sqlite')}"
+    migrate(location)
+    return SqlTracker(location)
+
+
+def _create_log_tracker(directory: str) -> Tracker:
+    return LogTracker(os.path.join(directory, "tracking.log"))
+
+
+def _create_listings(number_of_items: int, number_of_cycles: int) -> List[List[OpenstackItem]]:
+    """
+    Creates listings of items for each cycle, where a fraction of the items are replaced each cycle.
+    """
+    listings: List[List[OpenstackItem]] = []
+    created = datetime(2017, 1, 1)
+    next_identifier = 0
+    items: List[OpenstackItem] = []
+    for cycle in range(number_of_cycles):
+        number_to_replace = number_of_items if cycle == 0 else int(number_of_items * _CHURN_PER_CYCLE)
+        items = items[number_to_replace:]
+        for i in range(number_to_replace):
+            items.append(OpenstackImage(identifier=str(next_identifier), created_at=created + timedelta(seconds=i)))
+            next_identifier += 1
+        listings.append(list(items))
+    return listings
+
+
+def _benchmark(create_tracker: Callable[[str], Tracker], listings: List[List[OpenstackItem]]) -> Dict[str, float]:
+    """
+    Benchmarks the tracker created by the given factory.
+    :return: map between the operation and the time that it took in seconds
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = create_tracker(directory)
+        results = dict(
+            synchronise=timeit.timeit(
+                lambda: [tracker.synchronise(listing, OpenstackImage) for listing in listings], number=1),
+            get_registered_identifiers=timeit.timeit(
+                lambda: tracker.get_registered_identifiers(item_type=OpenstackImage), number=len(listings)),
+            get_age=timeit.timeit(lambda: [tracker.get_age(item) for item in listings[-1]], number=1),
+            register=timeit.timeit(lambda: tracker.register(
+                [OpenstackKeypair(identifier=str(i)) for i in range(len(listings[-1]) // 10)]), number=1)
+        )
+        return results
+
+
+def main():
+    parser = ArgumentParser(description="Tracker backend benchmark")
+    parser.add_argument("--items", type=int, default=10000, help="number of items in each listing")
+    parser.add_argument("--cycles", type=int, default=10, help="number of synchronisation cycles")
+    arguments = parser.parse_args()
+
+    listings = _create_listings(arguments.items, arguments.cycles)
+    print(f"{arguments.items} items, {arguments.cycles} cycles, {_CHURN_PER_CYCLE:.0%} churn per cycle")
+    for name, create_tracker in (("SqlTracker", _create_sql_tracker), ("LogTracker", _create_log_tracker)):
+        for operation, seconds in _benchmark(create_tracker, listings).items():
+            print(f"{name:<12}{operation:<28}{seconds:>10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+from datetime import datetime
+from threading import Lock
+
+from typing import Collection, Iterable, List, Dict, BinaryIO
+
+from openstacktenantcleaner._logstore.tracking import RecordLog
+from openstacktenantcleaner.journal import DeleteJournal, JournalEntry, DeleteState, JournalKey, get_journal_key
+from openstacktenantcleaner.models import PlannedDelete
+
+_FORGET_STATE = "forgotten"
+
+
+class LogDeleteJournal(DeleteJournal):
+    """
+    Delete journal stored in an append-only, checksummed record log (in the same format as the tracker's record log),
+    with an in-memory index of the latest entry for each delete that is rebuilt from the log when opened.
+    """
+    def __init__(self, location: str):
+        """
+        Constructor.
+        :param location: location of the journal's log file, which is created if it does not exist
+        """
+        self.location = location
+        self._entries: Dict[JournalKey, JournalEntry] = {}
+        self._lock = Lock()
+        self._file = self._open()
+
+    def forget(self, planned_deletes: Iterable[PlannedDelete]):
+        self._append([self._create_record(planned_delete, _FORGET_STATE, datetime.now())
+                      for planned_delete in planned_deletes])
+
+    def get_unconfirmed(self) -> List[JournalEntry]:
+        with self._lock:
+            return [entry for entry in self._entries.values() if entry.state != DeleteState.CONFIRMED]
+
+    def compact(self):
+        """
+        Rewrites the log so that it only contains the entries of deletes that have not been confirmed.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.state == DeleteState.CONFIRMED]:
+                del self._entries[key]
+            temp_location = f"{self.location}.compacting"
+            with open(temp_location, "wb") as file:
+                for entry in self._entries.values():
+                    file.write(RecordLog._encode(self._create_record(
+                        entry.planned_delete, entry.state.value, entry.updated)))
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(temp_location, self.location)
+            self._file = open(self.location, "ab")
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        with self._lock:
+            self._file.close()
+
+    def _write(self, entries: Collection[JournalEntry]):
+        self._append([self._create_record(entry.planned_delete, entry.state.value, entry.updated)
+                      for entry in entries])
+
+    def _append(self, records: List[Dict]):
+        """
+        Durably appends the given records to the log, in a single write, and applies them to the index.
+        :param records: the records to append
+        """
+        if len(records) == 0:
+            return
+        with self._lock:
+            self._file.write(b"".join(RecordLog._encode(record) for record in records))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for record in records:
+                self._apply(record)
+
+    def _open(self) -> BinaryIO:
+        """
+        Opens the log file and rebuilds the index from it. A partially written record at the end of the log (e.g. from
+        a crash mid-write) is truncated.
+        :return: the log file, opened for appending
+        """
+        valid_length = 0
+        if os.path.exists(self.location):
+            with open(self.location, "rb") as file:
+                for record, end_position in RecordLog._read(file):
+                    self._apply(record)
+                    valid_length = end_position
+        file = open(self.location, "ab")
+        file.truncate(valid_length)
+        return file
+
+    def _apply(self, record: Dict):
+        """
+        Applies the given record to the index.
+        :param record: the record to apply
+        """
+        planned_delete = PlannedDelete(
+            auth_url=record["auth_url"], tenant=record["tenant"], username=record["username"],
+            item_type=record["type"], identifier=record["id"], name=record["name"],
+            fingerprint=record["fingerprint"])
+        key = get_journal_key(planned_delete)
+        if record["state"] == _FORGET_STATE:
+            self._entries.pop(key, None)
+        else:
+            self._entries[key] = JournalEntry(
+                planned_delete, DeleteState(record["state"]), datetime.fromtimestamp(record["updated"]))
+
+    @staticmethod
+    def _create_record(planned_delete: PlannedDelete, state: str, updated: datetime) -> Dict:
+        """
+        Creates a log record of a delete reaching a state.
+        :param planned_delete: the delete
+        :param state: the value of the state, or `_FORGET_STATE` if the delete's entry is to be removed
+        :param updated: when the delete reached the state
+        :return: the created record
+        """
+        return dict(auth_url=planned_delete.auth_url, tenant=planned_delete.tenant, username=planned_delete.username,
+                    type=planned_delete.item_type, id=planned_delete.identifier, name=planned_delete.name,
+                    fingerprint=planned_delete.fingerprint, state=state, updated=updated.timestamp())
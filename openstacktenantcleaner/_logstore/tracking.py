@@ -0,0 +1,388 @@
+import copy
+import json
+import os
+import struct
+import zlib
+from datetime import timedelta, datetime
+from threading import Lock
+
+from typing import Callable, List, Optional, Type, Collection, Iterable, Dict, Tuple, BinaryIO, Iterator, Set, \
+    TYPE_CHECKING
+
+from openstacktenantcleaner.models import OpenstackItem, OpenstackIdentifier
+from openstacktenantcleaner.tracking import Tracker, get_created, UNPARTITIONED, DEFAULT_GRACE_PERIOD, \
+    TrackerSynchronisation
+
+if TYPE_CHECKING:
+    from openstacktenantcleaner._logstore.journal import LogDeleteJournal
+
+# Each record is prefixed with a header containing the length of the record and its CRC-32 checksum
+_RECORD_HEADER = struct.Struct(">II")
+
+_REGISTER_OPERATION = "r"
+_UNREGISTER_OPERATION = "u"
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Suffix of the location of the delete journal, which is stored next to the record log
+JOURNAL_SUFFIX = ".journal"
+
+# The log is compacted when it holds more than this many records per live item...
+DEFAULT_COMPACTION_RATIO = 4
+# ...and has at least this many records
+DEFAULT_MINIMUM_RECORDS_TO_COMPACT = 1024
+
+_IndexKey = Tuple[str, str]
+# Created timestamp and, if the item no longer exists, when it was unregistered
+_IndexEntry = Tuple[float, Optional[float]]
+
+
+def _to_timestamp(value: datetime) -> float:
+    """
+    Converts the given datetime to a timestamp. Timezone information is discarded, mirroring how the SQL tracker stores
+    times.
+    :param value: the datetime to convert
+    :return: the timestamp
+    """
+    return (value.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def _from_timestamp(value: float) -> datetime:
+    """
+    Converts the given timestamp, created by `_to_timestamp`, to a datetime.
+    :param value: the timestamp to convert
+    :return: the datetime
+    """
+    return _EPOCH + timedelta(seconds=value)
+
+
+class RecordLog:
+    """
+    Append-only, checksummed log of tracking records, with an in-memory hash index of the tracked items (including
+    tombstones) that is rebuilt from the log when opened.
+    """
+    def __init__(self, location: str, grace_period: timedelta=DEFAULT_GRACE_PERIOD,
+                 compaction_ratio: int=DEFAULT_COMPACTION_RATIO,
+                 minimum_records_to_compact: int=DEFAULT_MINIMUM_RECORDS_TO_COMPACT):
+        """
+        Constructor.
+        :param location: location of the log file, which is created if it does not exist
+        :param grace_period: how long tombstones are retained for
+        :param compaction_ratio: see `DEFAULT_COMPACTION_RATIO`
+        :param minimum_records_to_compact: see `DEFAULT_MINIMUM_RECORDS_TO_COMPACT`
+        """
+        self.location = location
+        self.grace_period = grace_period
+        self.compaction_ratio = compaction_ratio
+        self.minimum_records_to_compact = minimum_records_to_compact
+        self.index: Dict[_IndexKey, Dict[OpenstackIdentifier, _IndexEntry]] = {}
+        self._number_of_records = 0
+        self._lock = Lock()
+        self._file = self._open()
+
+    def append(self, records: Iterable[Dict]):
+        """
+        Appends the given records to the log and applies them to the index.
+        :param records: the records to append
+        """
+        self.update(lambda: records)
+
+    def update(self, create_records: Callable[[], Iterable[Dict]]):
+        """
+        Appends the records created by the given function to the log and applies them to the index. The function is
+        called whilst holding the log's lock, so records that depend on the index (e.g. a registration that revives a
+        tombstone) are not invalidated by a concurrent append.
+        :param create_records: creates the records to append from the current index
+        """
+        with self._lock:
+            data = bytearray()
+            for record in create_records():
+                self._apply(record)
+                data += self._encode(record)
+                self._number_of_records += 1
+            if len(data) > 0:
+                self._file.write(data)
+                self._file.flush()
+
+            live_items = sum(len(identifiers) for identifiers in self.index.values())
+            if self._number_of_records >= max(self.minimum_records_to_compact, self.compaction_ratio * live_items):
+                self._compact()
+
+    def compact(self):
+        """
+        Rewrites the log so that it only contains a record for each item, dropping tombstones that are older than the
+        grace period.
+        """
+        with self._lock:
+            self._compact()
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        with self._lock:
+            self._file.close()
+
+    def _open(self) -> BinaryIO:
+        """
+        Opens the log file and rebuilds the index from it. A partially written record at the end of the log (e.g. from
+        a crash mid-write) is truncated.
+        :return: the log file, opened for appending
+        """
+        valid_length = 0
+        if os.path.exists(self.location):
+            with open(self.location, "rb") as file:
+                for record, end_position in self._read(file):
+                    self._apply(record)
+                    self._number_of_records += 1
+                    valid_length = end_position
+        file = open(self.location, "ab")
+        file.truncate(valid_length)
+        return file
+
+    def _compact(self):
+        """
+        Compacts the log. Must be called whilst holding the lock.
+        """
+        temp_location = f"{self.location}.compacting"
+        purge_before = _to_timestamp(datetime.now() - self.grace_period)
+        number_of_records = 0
+        with open(temp_location, "wb") as file:
+            for (tenant, item_type), identifiers in self.index.items():
+                for identifier, (created, deleted) in list(identifiers.items()):
+                    if deleted is not None and deleted < purge_before:
+                        del identifiers[identifier]
+                        continue
+                    file.write(self._encode(dict(op=_REGISTER_OPERATION, tenant=tenant, type=item_type,
+                                                 identifier=identifier, created=created, deleted=deleted)))
+                    number_of_records += 1
+            file.flush()
+            os.fsync(file.fileno())
+        self._file.close()
+        os.replace(temp_location, self.location)
+        self._file = open(self.location, "ab")
+        self._number_of_records = number_of_records
+
+    def _apply(self, record: Dict):
+        """
+        Applies the given record to the index.
+        :param record: the record to apply
+        """
+        index_key = (record["tenant"], record["type"])
+        if record["op"] == _REGISTER_OPERATION:
+            self.index.setdefault(index_key, {})[record["identifier"]] = (record["created"], record.get("deleted"))
+        else:
+            identifiers = self.index.get(index_key, {})
+            if record["identifier"] in identifiers:
+                identifiers[record["identifier"]] = (identifiers[record["identifier"]][0], record["deleted"])
+
+    @staticmethod
+    def _encode(record: Dict) -> bytes:
+        """
+        Encodes the given record, with its header.
+        :param record: the record to encode
+        :return: the encoded record
+        """
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @staticmethod
+    def _read(file: BinaryIO) -> Iterator[Tuple[Dict, int]]:
+        """
+        Reads records from the given file until the end of the file or the first corrupt record.
+        :param file: the file to read from
+        :return: generator of each valid record and the position in the file at which it ends
+        """
+        while True:
+            header = file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            length, checksum = _RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            yield json.loads(payload.decode()), file.tell()
+
+
+class _LogTrackerSynchronisation(TrackerSynchronisation):
+    """
+    Synchronisation of a log tracker, which appends the records for each page of items in a single write.
+    """
+    def add(self, items: Iterable[OpenstackItem]):
+        now = datetime.now()
+        items = {item.identifier: item for item in items}
+        self._seen.update(items.keys())
+
+        def create_records() -> List[Dict]:
+            tracked = self.tracker._log.index.get((self.tracker._partition, self.item_type.__name__), {})
+            return [self.tracker._create_registration(self.item_type.__name__, identifier, get_created(item, now), now)
+                    for identifier, item in items.items() if tracked.get(identifier, (None, True))[1] is not None]
+
+        self.tracker._log.update(create_records)
+
+    def finish(self):
+        now = datetime.now()
+
+        def create_records() -> List[Dict]:
+            tracked = self.tracker._log.index.get((self.tracker._partition, self.item_type.__name__), {})
+            return [self.tracker._create_record(_UNREGISTER_OPERATION, self.item_type.__name__, identifier, deleted=now)
+                    for identifier, (_, deleted) in tracked.items() if deleted is None and identifier not in self._seen]
+
+        self.tracker._log.update(create_records)
+
+
+class LogTracker(Tracker):
+    """
+    Tracker implementation backed by an append-only record log.
+    """
+    def __init__(self, log_location: str, partition: str=UNPARTITIONED, grace_period: timedelta=DEFAULT_GRACE_PERIOD):
+        """
+        Constructor.
+        :param log_location: location of the record log
+        :param partition: the partition of tracked items that this tracker is a view of
+        :param grace_period: how long items that no longer exist are retained as tombstones, during which time they
+        keep their created time if they reappear
+        """
+        self._log = RecordLog(log_location, grace_period)
+        self._partition = partition
+
+    @property
+    def grace_period(self) -> timedelta:
+        """
+        How long items that no longer exist are retained as tombstones.
+        """
+        return self._log.grace_period
+
+    @grace_period.setter
+    def grace_period(self, grace_period: timedelta):
+        self._log.grace_period = grace_period
+
+    def get_partition(self, partition: str) -> "LogTracker":
+        tracker = copy.copy(self)
+        tracker._partition = partition
+        return tracker
+
+    def get_age(self, item: OpenstackItem) -> Optional[timedelta]:
+        created, deleted = self._log.index.get((self._partition, type(item).__name__), {}).get(
+            item.identifier, (None, None))
+        if created is None or deleted is not None:
+            return None
+        return datetime.now() - _from_timestamp(created)
+
+    def get_registered_identifiers(self, item_type: Optional[Type[OpenstackItem]]=None) \
+            -> Collection[OpenstackIdentifier]:
+        identifiers = []
+        for (tenant, partition_item_type), partition in list(self._log.index.items()):
+            if tenant == self._partition and (item_type is None or partition_item_type == item_type.__name__):
+                identifiers.extend(identifier for identifier, (_, deleted) in list(partition.items())
+                                   if deleted is None)
+        return identifiers
+
+    def get_created_before(self, item_type: Type[OpenstackItem], cutoff: datetime,
+                           identifiers: Collection[OpenstackIdentifier]=None) -> Set[OpenstackIdentifier]:
+        cutoff_timestamp = _to_timestamp(cutoff)
+        return {identifier for identifier, (created, deleted) in self._get_tracked(item_type, identifiers)
+                if deleted is None and created < cutoff_timestamp}
+
+    def get_created_times(self, item_type: Type[OpenstackItem], identifiers: Collection[OpenstackIdentifier]=None) \
+            -> Dict[OpenstackIdentifier, datetime]:
+        return {identifier: _from_timestamp(created)
+                for identifier, (created, deleted) in self._get_tracked(item_type, identifiers) if deleted is None}
+
+    def synchronise(self, items: Iterable[OpenstackItem], item_type: Type[OpenstackItem]):
+        now = datetime.now()
+        items = {item.identifier: item for item in items}
+
+        def create_records() -> List[Dict]:
+            tracked = self._log.index.get((self._partition, item_type.__name__), {})
+            registered_identifiers = {identifier for identifier, (_, deleted) in tracked.items() if deleted is None}
+            records = [self._create_record(_UNREGISTER_OPERATION, item_type.__name__, identifier, deleted=now)
+                       for identifier in registered_identifiers - items.keys()]
+            return records + [
+                self._create_registration(item_type.__name__, identifier, get_created(items[identifier], now), now)
+                for identifier in items.keys() - registered_identifiers]
+
+        self._log.update(create_records)
+
+    def create_synchronisation(self, item_type: Type[OpenstackItem]) -> TrackerSynchronisation:
+        return _LogTrackerSynchronisation(self, item_type)
+
+    def create_delete_journal(self) -> "LogDeleteJournal":
+        """
+        Creates a journal of deletes that is stored in a record log alongside the tracker's record log.
+        :return: the created journal
+        """
+        # Imported here as the journal reuses the record format of this module
+        from openstacktenantcleaner._logstore.journal import LogDeleteJournal
+        return LogDeleteJournal(f"{self._log.location}{JOURNAL_SUFFIX}")
+
+    def compact(self):
+        """
+        Compacts the underlying record log, purging tombstones that are older than the grace period.
+        """
+        self._log.compact()
+
+    def _get_tracked(self, item_type: Type[OpenstackItem], identifiers: Optional[Collection[OpenstackIdentifier]]) \
+            -> List[Tuple[OpenstackIdentifier, _IndexEntry]]:
+        """
+        Gets the index entries of the tracked items of the given type, looking up the given items rather than scanning
+        every item of the type.
+        :param item_type: the type of the items
+        :param identifiers: the identifiers of the items of interest (all tracked items of the type if `None`)
+        :return: the identifiers of the tracked items and their created and deleted timestamps
+        """
+        tracked = self._log.index.get((self._partition, item_type.__name__), {})
+        if identifiers is None:
+            return list(tracked.items())
+        return [(identifier, tracked[identifier]) for identifier in identifiers if identifier in tracked]
+
+    def _register(self, item: OpenstackItem, created: datetime):
+        now = datetime.now()
+        self._log.update(lambda: [self._create_registration(type(item).__name__, item.identifier, created, now)])
+
+    def _unregister(self, item: OpenstackItem):
+        item_type = type(item).__name__
+
+        def create_records() -> List[Dict]:
+            tracked = self._log.index.get((self._partition, item_type), {})
+            if item.identifier not in tracked or tracked[item.identifier][1] is not None:
+                return []
+            return [self._create_record(_UNREGISTER_OPERATION, item_type, item.identifier, deleted=datetime.now())]
+
+        self._log.update(create_records)
+
+    def _create_registration(self, item_type: str, identifier: OpenstackIdentifier, created: datetime,
+                             now: datetime) -> Dict:
+        """
+        Creates a log record that registers an item. If the item has a tombstone within the grace period, the item keeps
+        its original created time. Must be called whilst holding the log's lock (see `RecordLog.update`), so that the
+        item's entry in the index does not change in the meantime.
+        :param item_type: the name of the item's type
+        :param identifier: the item's identifier
+        :param created: when the item was created, if it is to be treated as new
+        :param now: the current time
+        :return: the created record
+        """
+        tombstone = self._log.index.get((self._partition, item_type), {}).get(identifier)
+        if tombstone is not None and tombstone[1] is not None \
+                and tombstone[1] >= _to_timestamp(now - self.grace_period):
+            created = _from_timestamp(tombstone[0])
+        return self._create_record(_REGISTER_OPERATION, item_type, identifier, created=created)
+
+    def _create_record(self, operation: str, item_type: str, identifier: OpenstackIdentifier,
+                       created: datetime=None, deleted: datetime=None) -> Dict:
+        """
+        Creates a log record for an item in this tracker's partition.
+        :param operation: the operation that the record represents
+        :param item_type: the name of the item's type
+        :param identifier: the item's identifier
+        :param created: when the item was created (registrations only)
+        :param deleted: when the item was unregistered (un-registrations only)
+        :return: the created record
+        """
+        record = dict(op=operation, tenant=self._partition, type=item_type, identifier=identifier)
+        if created is not None:
+            record["created"] = _to_timestamp(created)
+        if deleted is not None:
+            record["deleted"] = _to_timestamp(deleted)
+        return record
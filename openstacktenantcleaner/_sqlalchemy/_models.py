@@ -1,9 +1,9 @@
 import enum
 
-from sqlalchemy import Column, ForeignKey, Enum, DateTime, String
+from sqlalchemy import Column, Enum, DateTime, String, Integer, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, backref
 
+from openstacktenantcleaner.journal import DeleteState
 from openstacktenantcleaner.models import OpenstackItem
 
 _item_types = {cls.__name__ for cls in OpenstackItem.__subclasses__()}
@@ -14,15 +14,54 @@ _OpenstackItemTypes = enum.Enum("OpenStackItemTypes", _item_types_dict)
 SqlAlchemyModel = declarative_base()
 
 
-class SqlAlchemyItem(SqlAlchemyModel):
-    __tablename__ = "Item"
-    id = Column(String, primary_key=True)
-    type = Column(Enum(_OpenstackItemTypes))
+class SqlAlchemyTrackedItem(SqlAlchemyModel):
+    __tablename__ = "TrackedItem"
+    tenant = Column(String, primary_key=True)
+    type = Column(Enum(_OpenstackItemTypes), primary_key=True)
+    identifier = Column(String, primary_key=True)
+    created = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    # Set (making the row a tombstone) when the item no longer exists
+    deleted = Column(DateTime, nullable=True)
+    __table_args__ = (
+        # Covers age queries, which only need the identifier and created time of a tenant's items of a given type
+        Index(f"ix_{__tablename__}_tenant_type_created", tenant, type, created, identifier),
+        Index(f"ix_{__tablename__}_deleted", deleted),
+    )
 
 
-class SqlAlchemyItemTracking(SqlAlchemyModel):
-    __tablename__ = "ItemTracking"
-    item = relationship(SqlAlchemyItem.__name__, single_parent=True, backref=backref(
-        "tracking", cascade="all, delete-orphan"))
-    id = Column(String, ForeignKey(f"{SqlAlchemyItem.__tablename__}.id"), primary_key=True)
-    created = Column(DateTime)
+class SqlAlchemyJournalEntry(SqlAlchemyModel):
+    __tablename__ = "DeleteJournalEntry"
+    auth_url = Column(String, primary_key=True)
+    tenant = Column(String, primary_key=True)
+    username = Column(String, primary_key=True)
+    type = Column(Enum(_OpenstackItemTypes), primary_key=True)
+    identifier = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    fingerprint = Column(String, nullable=False)
+    state = Column(Enum(DeleteState), nullable=False)
+    updated = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index(f"ix_{__tablename__}_state", state),
+    )
+
+
+class SqlAlchemyShardNode(SqlAlchemyModel):
+    __tablename__ = "ShardNode"
+    node = Column(String, primary_key=True)
+    expires = Column(DateTime, nullable=False)
+
+
+class SqlAlchemyTenantLease(SqlAlchemyModel):
+    __tablename__ = "TenantLease"
+    tenant = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index(f"ix_{__tablename__}_owner", owner),
+    )
+
+
+class SqlAlchemySchemaVersion(SqlAlchemyModel):
+    __tablename__ = "SchemaVersion"
+    version = Column(Integer, primary_key=True)
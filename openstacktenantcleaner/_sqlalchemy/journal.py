@@ -0,0 +1,56 @@
+from typing import Collection, Iterable, List
+
+from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyJournalEntry
+from openstacktenantcleaner.external.sequencescape.database_connector import SQLAlchemyDatabaseConnector
+from openstacktenantcleaner.journal import DeleteJournal, JournalEntry, DeleteState
+from openstacktenantcleaner.models import PlannedDelete
+
+
+class SqlDeleteJournal(DeleteJournal):
+    """
+    Delete journal stored in the SQL tracking database.
+    """
+    def __init__(self, database_location: str):
+        """
+        Constructor.
+        :param database_location: location of the SQL database
+        """
+        self._database_connector = SQLAlchemyDatabaseConnector(database_location)
+
+    def forget(self, planned_deletes: Iterable[PlannedDelete]):
+        session = self._database_connector.create_session()
+        for planned_delete in planned_deletes:
+            session.query(SqlAlchemyJournalEntry).filter_by(
+                auth_url=planned_delete.auth_url, tenant=planned_delete.tenant, username=planned_delete.username,
+                type=planned_delete.item_type, identifier=planned_delete.identifier).delete(synchronize_session=False)
+        session.commit()
+        session.close()
+
+    def get_unconfirmed(self) -> List[JournalEntry]:
+        session = self._database_connector.create_session()
+        rows = session.query(SqlAlchemyJournalEntry).filter(
+            SqlAlchemyJournalEntry.state != DeleteState.CONFIRMED).all()
+        entries = [JournalEntry(
+            PlannedDelete(auth_url=row.auth_url, tenant=row.tenant, username=row.username, item_type=row.type.value,
+                          identifier=row.identifier, name=row.name, fingerprint=row.fingerprint),
+            row.state, row.updated) for row in rows]
+        session.close()
+        return entries
+
+    def compact(self):
+        session = self._database_connector.create_session()
+        session.query(SqlAlchemyJournalEntry).filter_by(state=DeleteState.CONFIRMED).delete(
+            synchronize_session=False)
+        session.commit()
+        session.close()
+
+    def _write(self, entries: Collection[JournalEntry]):
+        session = self._database_connector.create_session()
+        for entry in entries:
+            planned_delete = entry.planned_delete
+            session.merge(SqlAlchemyJournalEntry(
+                auth_url=planned_delete.auth_url, tenant=planned_delete.tenant, username=planned_delete.username,
+                type=planned_delete.item_type, identifier=planned_delete.identifier, name=planned_delete.name,
+                fingerprint=planned_delete.fingerprint, state=entry.state, updated=entry.updated))
+        session.commit()
+        session.close()
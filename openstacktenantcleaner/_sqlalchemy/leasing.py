@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from typing import Collection, Dict, Set
+
+from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyShardNode, SqlAlchemyTenantLease
+from openstacktenantcleaner.external.sequencescape.database_connector import SQLAlchemyDatabaseConnector
+from openstacktenantcleaner.leasing import LeaseStore
+
+
+class SqlLeaseStore(LeaseStore):
+    """
+    Lease store in the SQL tracking database. Leases are taken with conditional inserts and updates, so that only one
+    node can take a lease, without relying on locking that differs between databases.
+    """
+    def __init__(self, database_location: str):
+        """
+        Constructor.
+        :param database_location: location of the SQL database
+        """
+        self._database_connector = SQLAlchemyDatabaseConnector(database_location)
+
+    def heartbeat(self, node: str, now: datetime, expires: datetime):
+        session = self._database_connector.create_session()
+        session.query(SqlAlchemyShardNode).filter(SqlAlchemyShardNode.expires <= now).delete(
+            synchronize_session=False)
+        session.merge(SqlAlchemyShardNode(node=node, expires=expires))
+        session.commit()
+        session.close()
+
+    def get_live_nodes(self, now: datetime) -> Set[str]:
+        session = self._database_connector.create_session()
+        rows = session.query(SqlAlchemyShardNode.node).filter(SqlAlchemyShardNode.expires > now).all()
+        session.close()
+        return {row.node for row in rows}
+
+    def get_owners(self, now: datetime) -> Dict[str, str]:
+        session = self._database_connector.create_session()
+        rows = session.query(SqlAlchemyTenantLease.tenant, SqlAlchemyTenantLease.owner).filter(
+            SqlAlchemyTenantLease.expires > now).all()
+        session.close()
+        return {row.tenant: row.owner for row in rows}
+
+    def acquire(self, tenant: str, node: str, now: datetime, expires: datetime) -> bool:
+        session = self._database_connector.create_session()
+        try:
+            updated = session.query(SqlAlchemyTenantLease).filter(
+                SqlAlchemyTenantLease.tenant == tenant,
+                (SqlAlchemyTenantLease.owner == node) | (SqlAlchemyTenantLease.expires <= now)).update(
+                dict(owner=node, expires=expires), synchronize_session=False)
+            if updated == 0:
+                session.add(SqlAlchemyTenantLease(tenant=tenant, owner=node, expires=expires))
+            session.commit()
+            return True
+        except IntegrityError:
+            # Another node holds the lease (or took it first)
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def renew(self, tenants: Collection[str], node: str, now: datetime, expires: datetime) -> Set[str]:
+        if len(tenants) == 0:
+            return set()
+        session = self._database_connector.create_session()
+        held = session.query(SqlAlchemyTenantLease).filter(
+            SqlAlchemyTenantLease.tenant.in_(tenants), SqlAlchemyTenantLease.owner == node,
+            SqlAlchemyTenantLease.expires > now)
+        held.update(dict(expires=expires), synchronize_session=False)
+        # Read in the same transaction as the update, rather than matching on the new expiry time, which databases may
+        # store with less precision
+        rows = held.with_entities(SqlAlchemyTenantLease.tenant).all()
+        session.commit()
+        session.close()
+        return {row.tenant for row in rows}
+
+    def release(self, tenants: Collection[str], node: str):
+        if len(tenants) == 0:
+            return
+        session = self._database_connector.create_session()
+        session.query(SqlAlchemyTenantLease).filter(
+            SqlAlchemyTenantLease.tenant.in_(tenants), SqlAlchemyTenantLease.owner == node).delete(
+            synchronize_session=False)
+        session.commit()
+        session.close()
+
+    def leave(self, node: str):
+        session = self._database_connector.create_session()
+        session.query(SqlAlchemyTenantLease).filter_by(owner=node).delete(synchronize_session=False)
+        session.query(SqlAlchemyShardNode).filter_by(node=node).delete(synchronize_session=False)
+        session.commit()
+        session.close()
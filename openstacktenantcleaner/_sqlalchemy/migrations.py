@@ -0,0 +1,131 @@
+import logging
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Connection, Engine
+from typing import Callable, Dict, Optional
+
+from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyModel, SqlAlchemySchemaVersion, \
+    SqlAlchemyTrackedItem
+
+# Version of the original schema, with `Item` and `ItemTracking` tables, which did not record its version
+LEGACY_SCHEMA_VERSION = 1
+
+_LEGACY_ITEM_TABLE = "Item"
+_LEGACY_ITEM_TRACKING_TABLE = "ItemTracking"
+_TRACKED_ITEM_TABLE = SqlAlchemyTrackedItem.__tablename__
+_DELETE_JOURNAL_TABLE = "DeleteJournalEntry"
+_SHARD_NODE_TABLE = "ShardNode"
+_TENANT_LEASE_TABLE = "TenantLease"
+
+_logger = logging.getLogger(__name__)
+
+
+def _migrate_from_legacy_schema(connection: Connection):
+    """
+    Migrates the legacy `Item` and `ItemTracking` tables into the `TrackedItem` table. Legacy items were not associated
+    to a tenant.
+    :param connection: connection to the database, within a transaction
+    """
+    # Table definition is as of this version of the schema (later versions are reached by later migrations)
+    connection.execute(
+        f"CREATE TABLE {_TRACKED_ITEM_TABLE} ("
+        f"tenant VARCHAR NOT NULL, type VARCHAR(17) NOT NULL, identifier VARCHAR NOT NULL, created DATETIME NOT NULL, "
+        f"last_seen DATETIME NOT NULL, PRIMARY KEY (tenant, type, identifier))")
+    connection.execute(
+        f"CREATE INDEX ix_{_TRACKED_ITEM_TABLE}_tenant_type_created "
+        f"ON {_TRACKED_ITEM_TABLE} (tenant, type, created, identifier)")
+    connection.execute(
+        f"INSERT INTO {_TRACKED_ITEM_TABLE} (tenant, type, identifier, created, last_seen) "
+        f"SELECT '', item.type, item.id, tracking.created, tracking.created "
+        f"FROM {_LEGACY_ITEM_TABLE} AS item JOIN {_LEGACY_ITEM_TRACKING_TABLE} AS tracking ON item.id = tracking.id "
+        f"WHERE tracking.created IS NOT NULL")
+    connection.execute(f"DROP TABLE {_LEGACY_ITEM_TRACKING_TABLE}")
+    connection.execute(f"DROP TABLE {_LEGACY_ITEM_TABLE}")
+
+
+def _add_tombstones(connection: Connection):
+    """
+    Adds the `deleted` column to the `TrackedItem` table, which marks items that no longer exist.
+    :param connection: connection to the database, within a transaction
+    """
+    connection.execute(f"ALTER TABLE {_TRACKED_ITEM_TABLE} ADD COLUMN deleted DATETIME")
+    connection.execute(f"CREATE INDEX ix_{_TRACKED_ITEM_TABLE}_deleted ON {_TRACKED_ITEM_TABLE} (deleted)")
+
+
+def _add_delete_journal(connection: Connection):
+    """
+    Adds the `DeleteJournalEntry` table, which journals the progress of deletes.
+    :param connection: connection to the database, within a transaction
+    """
+    connection.execute(
+        f"CREATE TABLE {_DELETE_JOURNAL_TABLE} ("
+        f"auth_url VARCHAR NOT NULL, tenant VARCHAR NOT NULL, username VARCHAR NOT NULL, type VARCHAR(17) NOT NULL, "
+        f"identifier VARCHAR NOT NULL, name VARCHAR, fingerprint VARCHAR NOT NULL, state VARCHAR(9) NOT NULL, "
+        f"updated DATETIME NOT NULL, PRIMARY KEY (auth_url, tenant, username, type, identifier))")
+    connection.execute(f"CREATE INDEX ix_{_DELETE_JOURNAL_TABLE}_state ON {_DELETE_JOURNAL_TABLE} (state)")
+
+
+def _add_leases(connection: Connection):
+    """
+    Adds the `ShardNode` and `TenantLease` tables, which coordinate the nodes that share tenants between them.
+    :param connection: connection to the database, within a transaction
+    """
+    connection.execute(
+        f"CREATE TABLE {_SHARD_NODE_TABLE} (node VARCHAR NOT NULL, expires DATETIME NOT NULL, PRIMARY KEY (node))")
+    connection.execute(
+        f"CREATE TABLE {_TENANT_LEASE_TABLE} ("
+        f"tenant VARCHAR NOT NULL, owner VARCHAR NOT NULL, expires DATETIME NOT NULL, PRIMARY KEY (tenant))")
+    connection.execute(f"CREATE INDEX ix_{_TENANT_LEASE_TABLE}_owner ON {_TENANT_LEASE_TABLE} (owner)")
+
+
+# Migrations that take the schema to the version that they are keyed by from the previous version
+_MIGRATIONS: Dict[int, Callable[[Connection], None]] = {
+    2: _migrate_from_legacy_schema,
+    3: _add_tombstones,
+    4: _add_delete_journal,
+    5: _add_leases
+}
+
+SCHEMA_VERSION = max(_MIGRATIONS.keys())
+
+
+def get_schema_version(engine: Engine) -> Optional[int]:
+    """
+    Gets the version of the schema used by the given database.
+    :param engine: engine connected to the database
+    :return: the schema version or `None` if the database has no schema
+    """
+    table_names = inspect(engine).get_table_names()
+    if SqlAlchemySchemaVersion.__tablename__ in table_names:
+        return engine.execute(f"SELECT MAX(version) FROM {SqlAlchemySchemaVersion.__tablename__}").scalar()
+    if _LEGACY_ITEM_TABLE in table_names:
+        return LEGACY_SCHEMA_VERSION
+    return None
+
+
+def migrate(database_location: str) -> Optional[int]:
+    """
+    Creates the tracking schema in the given database if it does not exist, else migrates the existing schema in-place
+    to the latest version. Each migration is applied in its own transaction.
+    :param database_location: location of the SQL database
+    :return: the version of the schema before the migration or `None` if the schema was created
+    """
+    engine = create_engine(database_location)
+    original_version = get_schema_version(engine)
+
+    if original_version is None:
+        SqlAlchemyModel.metadata.create_all(bind=engine)
+        engine.execute(SqlAlchemySchemaVersion.__table__.insert(), version=SCHEMA_VERSION)
+    elif original_version > SCHEMA_VERSION:
+        raise ValueError(f"Tracking database schema version {original_version} is newer than the latest known "
+                         f"version {SCHEMA_VERSION}")
+    else:
+        for version in range(original_version + 1, SCHEMA_VERSION + 1):
+            _logger.info(f"Migrating tracking database schema to version {version}")
+            with engine.begin() as connection:
+                _MIGRATIONS[version](connection)
+                SqlAlchemySchemaVersion.__table__.create(connection, checkfirst=True)
+                connection.execute(SqlAlchemySchemaVersion.__table__.insert(), version=version)
+
+    engine.dispose()
+    return original_version
@@ -1,53 +1,346 @@
+import copy
+import logging
 from datetime import timedelta, datetime
 
-from typing import Optional, Type, Collection, Union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, Session
+from typing import Optional, Type, Collection, Iterable, List, Dict, Tuple, Set, Callable
 
-from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyItemTracking, SqlAlchemyItem
+from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyTrackedItem
+from openstacktenantcleaner._sqlalchemy.journal import SqlDeleteJournal
+from openstacktenantcleaner._sqlalchemy.leasing import SqlLeaseStore
+from openstacktenantcleaner.common import chunk
 from openstacktenantcleaner.external.sequencescape.database_connector import SQLAlchemyDatabaseConnector
 from openstacktenantcleaner.models import OpenstackItem, OpenstackIdentifier
-from openstacktenantcleaner.tracking import Tracker
+from openstacktenantcleaner.tracking import Tracker, get_created, UNPARTITIONED, DEFAULT_GRACE_PERIOD, \
+    TrackerSynchronisation
+
+# Kept below SQLite's default limit of 999 bound parameters per statement
+_MAX_IDENTIFIERS_PER_QUERY = 500
+
+DEFAULT_PURGE_BATCH_SIZE = 10000
+
+# Number of times a synchronisation is attempted if items it inserts are concurrently registered
+_MAX_SYNCHRONISE_ATTEMPTS = 3
+
+_logger = logging.getLogger(__name__)
+
+
+
+class _SqlTrackerSynchronisation(TrackerSynchronisation):
+    """
+    Synchronisation of a SQL tracker, which records when each item was last seen in the database rather than
+    remembering the identifiers of the items in the listing.
+    """
+    def add(self, items: Iterable[OpenstackItem]):
+        self.tracker._synchronise_page(items, self.item_type, self.started)
+
+    def finish(self):
+        self.tracker._unregister_not_seen_since(self.item_type, self.started)
 
 
 class SqlTracker(Tracker):
     """
     SQL Tracker implementation.
     """
-    def __init__(self, database_location: str):
+    def __init__(self, database_location: str, partition: str=UNPARTITIONED,
+                 grace_period: timedelta=DEFAULT_GRACE_PERIOD):
         """
         Constructor.
-        :param database_location: location of the SQL database 
+        :param database_location: location of the SQL database
+        :param partition: the partition of tracked items that this tracker is a view of
+        :param grace_period: how long items that no longer exist are retained as tombstones, during which time they
+        keep their created time if they reappear
         """
+        self._database_location = database_location
         self._database_connector = SQLAlchemyDatabaseConnector(database_location)
+        self._partition = partition
+        self.grace_period = grace_period
+
+    def get_partition(self, partition: str) -> "SqlTracker":
+        tracker = copy.copy(self)
+        tracker._partition = partition
+        return tracker
 
     def get_age(self, item: OpenstackItem) -> Optional[timedelta]:
         session = self._database_connector.create_session()
-        tracking = session.query(SqlAlchemyItemTracking).get(item.identifier)
+        created = session.query(SqlAlchemyTrackedItem.created).filter_by(
+            tenant=self._partition, type=type(item).__name__, identifier=item.identifier, deleted=None).scalar()
         session.close()
-        if tracking is None:
+        if created is None:
             return None
-        return datetime.now() - tracking.created
+        return datetime.now() - created
 
     def get_registered_identifiers(self, item_type: Optional[Type[OpenstackItem]]=None) -> Collection[OpenstackIdentifier]:
         type_filter = dict(type=item_type.__name__) if item_type is not None else {}
         session = self._database_connector.create_session()
-        sql_alchemy_items = session.query(SqlAlchemyItem).filter_by(**type_filter).all()
+        rows = session.query(SqlAlchemyTrackedItem.identifier).filter_by(
+            tenant=self._partition, deleted=None, **type_filter).all()
+        session.close()
+        return [row.identifier for row in rows]
+
+    def get_created_before(self, item_type: Type[OpenstackItem], cutoff: datetime,
+                           identifiers: Collection[OpenstackIdentifier]=None) -> Set[OpenstackIdentifier]:
+        # A range scan of the (tenant, type, created, identifier) index, rather than a query per item
+        session = self._database_connector.create_session()
+        query = session.query(SqlAlchemyTrackedItem.identifier).filter_by(
+            tenant=self._partition, type=item_type.__name__, deleted=None).filter(
+            SqlAlchemyTrackedItem.created < cutoff)
+        rows = self._query_identifiers(query, identifiers)
+        session.close()
+        return {row.identifier for row in rows}
+
+    def get_created_times(self, item_type: Type[OpenstackItem], identifiers: Collection[OpenstackIdentifier]=None) \
+            -> Dict[OpenstackIdentifier, datetime]:
+        session = self._database_connector.create_session()
+        query = session.query(SqlAlchemyTrackedItem.identifier, SqlAlchemyTrackedItem.created).filter_by(
+            tenant=self._partition, type=item_type.__name__, deleted=None)
+        rows = self._query_identifiers(query, identifiers)
+        session.close()
+        return {row.identifier: row.created for row in rows}
+
+    def synchronise(self, items: Iterable[OpenstackItem], item_type: Type[OpenstackItem]):
+        items = {item.identifier: item for item in items}
+        self._retry_on_conflict(lambda session: self._synchronise(session, items, item_type))
+
+    def _synchronise(self, session: Session, items: Dict[OpenstackIdentifier, OpenstackItem],
+                     item_type: Type[OpenstackItem]):
+        """
+        Synchronises the tracked items of the given type with the given items, using the given session.
+        :param session: the database session
+        :param items: map between the identifiers of all of the items of the type that exist and the items
+        :param item_type: the type of the items
+        """
+        now = datetime.now()
+        registered_identifiers = set(self.get_registered_identifiers(item_type))
+        partition = session.query(SqlAlchemyTrackedItem).filter_by(tenant=self._partition, type=item_type.__name__)
+        live = partition.filter_by(deleted=None)
+
+        for identifiers in chunk(registered_identifiers - items.keys(), _MAX_IDENTIFIERS_PER_QUERY):
+            live.filter(SqlAlchemyTrackedItem.identifier.in_(identifiers)).update(
+                {SqlAlchemyTrackedItem.deleted: now}, synchronize_session=False)
+        live.update({SqlAlchemyTrackedItem.last_seen: now}, synchronize_session=False)
+
+        new_identifiers = items.keys() - registered_identifiers
+        existing_identifiers: Set[OpenstackIdentifier] = set()
+        for identifiers in chunk(new_identifiers, _MAX_IDENTIFIERS_PER_QUERY):
+            # Items registered since the registered identifiers were read are live, rather than tombstones
+            existing = partition.filter(SqlAlchemyTrackedItem.identifier.in_(identifiers)).with_entities(
+                SqlAlchemyTrackedItem.identifier, SqlAlchemyTrackedItem.deleted).all()
+            session.bulk_update_mappings(SqlAlchemyTrackedItem, [
+                self._create_revival(item_type, identifier, deleted, get_created(items[identifier], now), now)
+                for identifier, deleted in existing if deleted is not None])
+            existing_identifiers.update(identifier for identifier, _ in existing)
+        new_identifiers -= existing_identifiers
+
+        adopted_created = self._adopt_unpartitioned(session, item_type, new_identifiers)
+        session.bulk_insert_mappings(SqlAlchemyTrackedItem, [
+            dict(tenant=self._partition, type=item_type.__name__, identifier=identifier, last_seen=now,
+                 created=adopted_created.get(identifier, get_created(items[identifier], now)))
+            for identifier in new_identifiers])
+
+    def create_synchronisation(self, item_type: Type[OpenstackItem]) -> TrackerSynchronisation:
+        return _SqlTrackerSynchronisation(self, item_type)
+
+    def create_delete_journal(self) -> SqlDeleteJournal:
+        """
+        Creates a journal of deletes that is stored in the tracking database.
+        :return: the created journal
+        """
+        return SqlDeleteJournal(self._database_location)
+
+    def create_lease_store(self) -> SqlLeaseStore:
+        """
+        Creates a store of the leases that nodes sharing the tracking database hold on tenants, which is stored in the
+        tracking database.
+        :return: the created lease store
+        """
+        return SqlLeaseStore(self._database_location)
+
+    def compact(self, batch_size: int=DEFAULT_PURGE_BATCH_SIZE):
+        """
+        Purges, in batches, the tombstones of items (in all partitions) that have not existed for longer than the grace
+        period, then has the database reclaim space and update its statistics.
+        :param batch_size: the maximum number of tombstones to purge in each transaction
+        """
+        cutoff = datetime.now() - self.grace_period
+        number_purged = 0
+        while True:
+            session = self._database_connector.create_session()
+            tombstones = session.query(
+                SqlAlchemyTrackedItem.tenant, SqlAlchemyTrackedItem.type, SqlAlchemyTrackedItem.identifier).filter(
+                SqlAlchemyTrackedItem.deleted < cutoff).limit(batch_size).all()
+            identifiers_in_partitions: Dict[Tuple, List[OpenstackIdentifier]] = {}
+            for tenant, item_type, identifier in tombstones:
+                identifiers_in_partitions.setdefault((tenant, item_type), []).append(identifier)
+            for (tenant, item_type), identifiers in identifiers_in_partitions.items():
+                for identifiers_chunk in chunk(identifiers, _MAX_IDENTIFIERS_PER_QUERY):
+                    session.query(SqlAlchemyTrackedItem).filter_by(tenant=tenant, type=item_type).filter(
+                        SqlAlchemyTrackedItem.identifier.in_(identifiers_chunk)).delete(synchronize_session=False)
+            session.commit()
+            session.close()
+            number_purged += len(tombstones)
+            if len(tombstones) < batch_size:
+                break
+        _logger.info(f"Purged {number_purged} tracking tombstone(s)")
+
+        engine = self._database_connector.create_session().get_bind()
+        # Neither statement can run inside a transaction
+        connection = engine.connect() if engine.dialect.name == "sqlite" \
+            else engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute("VACUUM")
+        connection.execute("ANALYZE")
+        connection.close()
+
+    @staticmethod
+    def _query_identifiers(query: Query, identifiers: Optional[Collection[OpenstackIdentifier]]) -> List:
+        """
+        Gets the rows of the given query, restricted to the items with the given identifiers. The identifiers are
+        queried in chunks, so that only the rows of interest are fetched without exceeding the database's limit on the
+        number of bound parameters.
+        :param query: the query
+        :param identifiers: the identifiers of the items of interest (all of the query's rows if `None`)
+        :return: the rows
+        """
+        if identifiers is None:
+            return query.all()
+        rows = []
+        for identifiers_chunk in chunk(identifiers, _MAX_IDENTIFIERS_PER_QUERY):
+            rows += query.filter(SqlAlchemyTrackedItem.identifier.in_(identifiers_chunk)).all()
+        return rows
+
+    def _synchronise_page(self, items: Iterable[OpenstackItem], item_type: Type[OpenstackItem], started: datetime):
+        """
+        Registers the given page of items, from a listing that started at the given time, marking them as seen.
+        :param items: the page of items
+        :param item_type: the type of the items
+        :param started: when the listing started
+        """
+        items = {item.identifier: item for item in items}
+        self._retry_on_conflict(lambda session: self._synchronise_page_in_session(session, items, item_type))
+
+    def _synchronise_page_in_session(self, session: Session, items: Dict[OpenstackIdentifier, OpenstackItem],
+                                     item_type: Type[OpenstackItem]):
+        """
+        Registers the given page of items, marking them as seen, using the given session.
+        :param session: the database session
+        :param items: map between the identifiers of the items in the page and the items
+        :param item_type: the type of the items
+        """
+        now = datetime.now()
+        partition = session.query(SqlAlchemyTrackedItem).filter_by(tenant=self._partition, type=item_type.__name__)
+
+        new_identifiers = set(items.keys())
+        for identifiers in chunk(items.keys(), _MAX_IDENTIFIERS_PER_QUERY):
+            existing = partition.filter(SqlAlchemyTrackedItem.identifier.in_(identifiers)).with_entities(
+                SqlAlchemyTrackedItem.identifier, SqlAlchemyTrackedItem.deleted).all()
+            live_identifiers = [identifier for identifier, deleted in existing if deleted is None]
+            if len(live_identifiers) > 0:
+                partition.filter(SqlAlchemyTrackedItem.identifier.in_(live_identifiers)).update(
+                    {SqlAlchemyTrackedItem.last_seen: now}, synchronize_session=False)
+            session.bulk_update_mappings(SqlAlchemyTrackedItem, [
+                self._create_revival(item_type, identifier, deleted, get_created(items[identifier], now), now)
+                for identifier, deleted in existing if deleted is not None])
+            new_identifiers -= {identifier for identifier, _ in existing}
+
+        adopted_created = self._adopt_unpartitioned(session, item_type, new_identifiers)
+        session.bulk_insert_mappings(SqlAlchemyTrackedItem, [
+            dict(tenant=self._partition, type=item_type.__name__, identifier=identifier, last_seen=now,
+                 created=adopted_created.get(identifier, get_created(items[identifier], now)))
+            for identifier in new_identifiers])
+
+    def _retry_on_conflict(self, transaction: Callable[[Session], None]):
+        """
+        Runs the given transaction in a new session and commits it. The transaction is rolled back and run again if it
+        conflicts with a concurrent registration of an item that it inserts, as it then sees the item as registered.
+        :param transaction: the transaction, which is given the session to use
+        """
+        for attempt in range(1, _MAX_SYNCHRONISE_ATTEMPTS + 1):
+            session = self._database_connector.create_session()
+            try:
+                transaction(session)
+                session.commit()
+                return
+            except IntegrityError as e:
+                if attempt == _MAX_SYNCHRONISE_ATTEMPTS:
+                    raise
+                _logger.info(f"Synchronising tracked items again as they were registered concurrently: {e}")
+            finally:
+                session.close()
+
+    def _unregister_not_seen_since(self, item_type: Type[OpenstackItem], since: datetime):
+        """
+        Un-registers the items of the given type that have not been seen since the given time.
+        :param item_type: the type of the items
+        :param since: the time
+        """
+        session = self._database_connector.create_session()
+        session.query(SqlAlchemyTrackedItem).filter_by(
+            tenant=self._partition, type=item_type.__name__, deleted=None).filter(
+            SqlAlchemyTrackedItem.last_seen < since).update(
+            {SqlAlchemyTrackedItem.deleted: datetime.now()}, synchronize_session=False)
+        session.commit()
         session.close()
-        return [sql_alchemy_item.id for sql_alchemy_item in sql_alchemy_items]
+
+    def _create_revival(self, item_type: Type[OpenstackItem], identifier: OpenstackIdentifier, deleted: datetime,
+                        created: datetime, now: datetime) -> Dict:
+        """
+        Creates the update mapping that revives the tombstone of an item that has reappeared. The item keeps its
+        original created time if it reappeared within the grace period.
+        :param item_type: the type of the item
+        :param identifier: the item's identifier
+        :param deleted: when the item was marked as no longer existing
+        :param created: the created time of the item, if it is to be treated as new
+        :param now: the current time
+        :return: the update mapping
+        """
+        revival = dict(tenant=self._partition, type=item_type.__name__, identifier=identifier, deleted=None,
+                       last_seen=now)
+        if deleted < now - self.grace_period:
+            revival["created"] = created
+        return revival
+
+    def _adopt_unpartitioned(self, session: Session, item_type: Type[OpenstackItem],
+                             identifiers: Collection[OpenstackIdentifier]) -> Dict[OpenstackIdentifier, datetime]:
+        """
+        Removes items with the given identifiers from the unpartitioned items (i.e. those tracked before the tracker was
+        partitioned) so that they can be moved into this tracker's partition without losing their created time.
+        :param session: the database session
+        :param item_type: the type of the items
+        :param identifiers: the identifiers of the items
+        :return: map between the identifiers of the removed items and their created times
+        """
+        adopted_created: Dict[OpenstackIdentifier, datetime] = {}
+        if self._partition == UNPARTITIONED:
+            return adopted_created
+        unpartitioned = session.query(SqlAlchemyTrackedItem).filter_by(
+            tenant=UNPARTITIONED, type=item_type.__name__, deleted=None)
+        for identifiers_chunk in chunk(identifiers, _MAX_IDENTIFIERS_PER_QUERY):
+            chunk_query = unpartitioned.filter(SqlAlchemyTrackedItem.identifier.in_(identifiers_chunk))
+            adopted_created.update(chunk_query.with_entities(
+                SqlAlchemyTrackedItem.identifier, SqlAlchemyTrackedItem.created).all())
+            chunk_query.delete(synchronize_session=False)
+        return adopted_created
 
     def _register(self, item: OpenstackItem, created: datetime):
-        sql_alchemy_item = SqlAlchemyItem(id=item.identifier, type=type(item).__name__)
-        sql_alchemy_item_tracking = SqlAlchemyItemTracking(id=item.identifier, created=created)
+        now = datetime.now()
         session = self._database_connector.create_session()
-        session.add(sql_alchemy_item)
-        session.add(sql_alchemy_item_tracking)
+        tombstone = session.query(SqlAlchemyTrackedItem.deleted).filter_by(
+            tenant=self._partition, type=type(item).__name__, identifier=item.identifier).scalar()
+        if tombstone is not None:
+            session.bulk_update_mappings(SqlAlchemyTrackedItem, [
+                self._create_revival(type(item), item.identifier, tombstone, created, now)])
+        else:
+            session.add(SqlAlchemyTrackedItem(
+                tenant=self._partition, type=type(item).__name__, identifier=item.identifier, created=created,
+                last_seen=now))
         session.commit()
         session.close()
 
-    def _unregister(self, item: Union[OpenstackItem, OpenstackIdentifier]):
-        identifier = item.identifier if isinstance(item, OpenstackItem) else item
+    def _unregister(self, item: OpenstackItem):
         session = self._database_connector.create_session()
-        sql_alchemy_item = session.query(SqlAlchemyItem).filter_by(id=identifier).first()
-        if sql_alchemy_item is not None:
-            session.delete(sql_alchemy_item)
-            session.commit()
+        session.query(SqlAlchemyTrackedItem).filter_by(
+            tenant=self._partition, type=type(item).__name__, identifier=item.identifier, deleted=None).update(
+            {SqlAlchemyTrackedItem.deleted: datetime.now()}, synchronize_session=False)
+        session.commit()
         session.close()
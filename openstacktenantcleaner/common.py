@@ -1,7 +1,13 @@
+import hashlib
+import json
 import os
 
+from typing import TypeVar, Iterable, Iterator, List
+
 from openstacktenantcleaner.models import OpenstackItem
 
+_T = TypeVar("_T")
+
 
 def create_human_identifier(item: OpenstackItem, include_type: bool=False) -> str:
     """
@@ -24,3 +30,30 @@ def get_absolute_path_relative_to(path: str, relative_to: str) -> str:
     if os.path.isabs(path):
         raise ValueError("The given path is not relative")
     return os.path.join(os.path.dirname(relative_to), path)
+
+
+def create_item_fingerprint(item: OpenstackItem) -> str:
+    """
+    Creates a fingerprint of the given item's properties, which will change if any of the properties change.
+    :param item: the item
+    :return: the fingerprint
+    """
+    properties = json.dumps(vars(item), sort_keys=True, default=str)
+    return hashlib.sha1(f"{type(item).__name__}:{properties}".encode()).hexdigest()
+
+
+def chunk(values: Iterable[_T], size: int) -> Iterator[List[_T]]:
+    """
+    Splits the given values into lists of at most the given size.
+    :param values: the values to split
+    :param size: the maximum size of each list
+    :return: the lists of values
+    """
+    values_chunk: List[_T] = []
+    for value in values:
+        values_chunk.append(value)
+        if len(values_chunk) == size:
+            yield values_chunk
+            values_chunk = []
+    if len(values_chunk) > 0:
+        yield values_chunk
@@ -1,28 +1,56 @@
+import hashlib
+import json
+import logging
 import os
 import re
 from datetime import timedelta
+from enum import Enum
 from logging import getLevelName
 
 import yaml
 from boltons.timeutils import parse_timedelta
-from typing import List, Iterable, Type, Dict, Any
+from typing import List, Type, Dict, Any, Callable, Optional
 
 from openstacktenantcleaner.common import get_absolute_path_relative_to
-from openstacktenantcleaner.detectors import PreventDeleteDetector, prevent_delete_protected_image_detector, \
+from openstacktenantcleaner.detectors import prevent_delete_protected_image_detector, \
     prevent_delete_image_in_use_detector, prevent_delete_key_pair_in_use_detector, create_exclude_detector, \
     create_delete_if_older_than_detector
 from openstacktenantcleaner.external.hgicommon.models import Model
 from openstacktenantcleaner.managers import OpenstackInstanceManager, Manager, OpenstackImageManager, \
     OpenstackKeypairManager
-from openstacktenantcleaner.models import OpenstackCredentials
+from openstacktenantcleaner.models import OpenstackCredentials, ListingFilter, OpenstackImage, OpenstackKeypair
+from openstacktenantcleaner.notifications import DEFAULT_NOTIFICATION_EXCHANGES, DEFAULT_NOTIFICATION_TOPIC
+from openstacktenantcleaner.policies import Policy, Predicate, PredicateInput
+from openstacktenantcleaner.scheduling import DEFAULT_QUOTA_TRIGGER_USAGE
+from openstacktenantcleaner.tracking import DEFAULT_GRACE_PERIOD
 
 _GENERAL_PROPERTY = "general"
 _GENERAL_RUN_EVERY_PROPERTY = "run-every"
+_GENERAL_MIN_RUN_EVERY_PROPERTY = "min-run-every"
+_GENERAL_MAX_RUN_EVERY_PROPERTY = "max-run-every"
 _GENERAL_LOGGING_PROPERTY = "log"
 _GENERAL_LOG_LOCATION_PROPERTY = "location"
 _GENERAL_LOG_LEVEL_PROPERTY = "level"
+_GENERAL_LOG_NOT_DELETED_PROPERTY = "not-deleted"
+_GENERAL_LOG_NOT_DELETED_SAMPLE_SIZE_PROPERTY = "not-deleted-sample-size"
 _GENERAL_TRACKING_DATABASE_PROPERTY = "tracking-database"
+_GENERAL_TRACKING_GRACE_PERIOD_PROPERTY = "tracking-grace-period"
+_GENERAL_COMPACT_TRACKING_EVERY_PROPERTY = "compact-tracking-every"
 _GENERAL_MAX_SIMULTANEOUS_DELETES_PROPERTY = "max-simultaneous-deletes"
+_GENERAL_MAX_SIMULTANEOUS_TENANTS_PROPERTY = "max-simultaneous-tenants"
+_GENERAL_STREAM_PAGE_SIZE_PROPERTY = "stream-page-size"
+_GENERAL_FILTER_LISTINGS_PROPERTY = "filter-listings"
+_GENERAL_DELETE_WHEN_ELIGIBLE_PROPERTY = "delete-when-eligible"
+_GENERAL_LEASE_DURATION_PROPERTY = "lease-duration"
+_GENERAL_CHECK_QUOTA_EVERY_PROPERTY = "check-quota-every"
+_GENERAL_QUOTA_TRIGGER_USAGE_PROPERTY = "quota-trigger-usage"
+_GENERAL_DELETE_PRIORITY_PROPERTY = "delete-priority"
+_GENERAL_MAX_DELETES_PER_RUN_PROPERTY = "max-deletes-per-run"
+_GENERAL_ADMIN_CREDENTIALS_PROPERTY = "admin-credentials"
+_GENERAL_NOTIFICATIONS_PROPERTY = "notifications"
+_GENERAL_NOTIFICATIONS_URL_PROPERTY = "url"
+_GENERAL_NOTIFICATIONS_EXCHANGES_PROPERTY = "exchanges"
+_GENERAL_NOTIFICATIONS_TOPIC_PROPERTY = "topic"
 _CLEAN_UP_PROPERTY = "cleanup"
 _CLEAN_UP_OPENSTACK_AUTH_URL_PROPERTY = "openstack-auth-url"
 _CLEAN_UP_CREDENTIALS_PROPERTY = "credentials"
@@ -35,8 +63,56 @@ _CLEAN_UP_KEY_PAIRS_PROPERTY = "key-pairs"
 _CLEAN_UP_REMOVE_IF_OLDER_THAN_PROPERTY = "remove-if-older-than"
 _CLEAN_UP_EXCLUDE_PROPERTY = "exclude"
 _CLEAN_UP_REMOVE_ONLY_IF_UNUSED_PROPERTY = "remove-only-if-unused"
+_CLEAN_UP_IMAGES_QUOTA_PROPERTY = "quota"
+_CLEAN_UP_IMAGES_QUOTA_GIGABYTES_PROPERTY = "gigabytes"
+_CLEAN_UP_IMAGES_QUOTA_IMAGES_PROPERTY = "images"
+_CLEAN_UP_IMAGES_QUOTA_HEADROOM_PROPERTY = "headroom"
 
 DEFAULT_MAX_SIMULTANEOUS_DELETES = 4
+DEFAULT_MAX_SIMULTANEOUS_TENANTS = 1
+DEFAULT_TRACKING_COMPACTION_PERIOD = timedelta(days=1)
+DEFAULT_NOT_DELETED_SAMPLE_SIZE = 10
+DEFAULT_IMAGE_QUOTA_HEADROOM = 0.1
+
+_logger = logging.getLogger(__name__)
+
+
+class NotDeletedDetail(Enum):
+    """
+    How much detail to log about items that are not to be deleted.
+    """
+    ALL = "all"
+    SAMPLE = "sample"
+    SUMMARY = "summary"
+
+
+class DeletePriority(Enum):
+    """
+    Order in which items that are to be deleted are deleted.
+    """
+    # Oldest first
+    AGE = "age"
+    # Largest images first
+    SIZE = "size"
+    # Instances (which use compute quota and may be preventing images and key-pairs from being deleted) first, then
+    # images, largest first, then key-pairs
+    QUOTA_IMPACT = "quota-impact"
+
+
+class ImageQuotaConfiguration(Model):
+    """
+    Configuration of the image quota of a tenant, which images are deleted to stay within.
+    """
+    def __init__(self, max_gigabytes: float=None, max_images: int=None, headroom: float=DEFAULT_IMAGE_QUOTA_HEADROOM):
+        """
+        Constructor.
+        :param max_gigabytes: the maximum total size of the tenant's images (not limited if `None`)
+        :param max_images: the maximum number of the tenant's images (not limited if `None`)
+        :param headroom: the fraction of each quota to keep free
+        """
+        self.max_gigabytes = max_gigabytes
+        self.max_images = max_images
+        self.headroom = headroom
 
 
 class CleanUpConfiguration(Model):
@@ -45,16 +121,31 @@ class CleanUpConfiguration(Model):
     """
     def __init__(self, credentials: List[OpenstackCredentials]=None):
         self.credentials = credentials if credentials is not None else []
-        self.areas: Dict[Type[Manager], Iterable[PreventDeleteDetector]] = {}
+        self.areas: Dict[Type[Manager], Policy] = {}
+        # Only the images required to stay within this quota are deleted, if set
+        self.image_quota: Optional[ImageQuotaConfiguration] = None
 
 
 class LoggingConfiguration(Model):
     """
     Configuration for logging.
     """
-    def __init__(self, location: str=None, level: int=None):
+    def __init__(self, location: str=None, level: int=None, not_deleted_detail: NotDeletedDetail=NotDeletedDetail.ALL,
+                 not_deleted_sample_size: int=DEFAULT_NOT_DELETED_SAMPLE_SIZE):
         self.location = location
         self.level = level
+        self.not_deleted_detail = not_deleted_detail
+        self.not_deleted_sample_size = not_deleted_sample_size
+
+
+class NotificationsConfiguration(Model):
+    """
+    Configuration for consuming OpenStack notifications.
+    """
+    def __init__(self, url: str=None, exchanges: List[str]=None, topic: str=DEFAULT_NOTIFICATION_TOPIC):
+        self.url = url
+        self.exchanges = exchanges if exchanges is not None else list(DEFAULT_NOTIFICATION_EXCHANGES)
+        self.topic = topic
 
 
 class GeneralConfiguration(Model):
@@ -62,11 +153,46 @@ class GeneralConfiguration(Model):
     General configuration.
     """
     def __init__(self, run_period: timedelta=None, logging_configuration: LoggingConfiguration=None,
-                 tracking_database: str=None, max_simultaneous_deletes: int=DEFAULT_MAX_SIMULTANEOUS_DELETES):
+                 tracking_database: str=None, max_simultaneous_deletes: int=DEFAULT_MAX_SIMULTANEOUS_DELETES,
+                 max_simultaneous_tenants: int=DEFAULT_MAX_SIMULTANEOUS_TENANTS,
+                 tracking_grace_period: timedelta=DEFAULT_GRACE_PERIOD,
+                 tracking_compaction_period: timedelta=DEFAULT_TRACKING_COMPACTION_PERIOD,
+                 min_run_period: timedelta=None, max_run_period: timedelta=None,
+                 notifications_configuration: NotificationsConfiguration=None, stream_page_size: int=None,
+                 delete_priority: DeletePriority=DeletePriority.AGE, max_deletes_per_run: int=None,
+                 quota_check_period: timedelta=None, quota_trigger_usage: float=DEFAULT_QUOTA_TRIGGER_USAGE,
+                 admin_credentials: OpenstackCredentials=None, filter_listings: bool=False,
+                 delete_when_eligible: bool=False, lease_duration: timedelta=None):
         self.run_period = run_period
+        # Runs are scheduled adaptively, between these bounds, if they differ from the run period
+        self.min_run_period = min_run_period if min_run_period is not None else run_period
+        self.max_run_period = max_run_period if max_run_period is not None else run_period
         self.logging_configuration = logging_configuration
         self.tracking_database = tracking_database
+        self.tracking_grace_period = tracking_grace_period
+        self.tracking_compaction_period = tracking_compaction_period
         self.max_simultaneous_deletes = max_simultaneous_deletes
+        self.max_simultaneous_tenants = max_simultaneous_tenants
+        # Notifications are not consumed if `None`
+        self.notifications_configuration = notifications_configuration
+        # Items are listed, decided on and deleted a page of this size at a time, rather than planned all at once, if set
+        self.stream_page_size = stream_page_size
+        self.delete_priority = delete_priority
+        # The number of deletes in a run is not limited if `None`
+        self.max_deletes_per_run = max_deletes_per_run
+        # Quota usage is not watched if `None`
+        self.quota_check_period = quota_check_period
+        self.quota_trigger_usage = quota_trigger_usage
+        # If set, items in all tenants are listed using these credentials rather than those of each tenant
+        self.admin_credentials = admin_credentials
+        # Whether OpenStack is to filter out items that would not be deleted when listing them
+        self.filter_listings = filter_listings
+        # Whether items kept because of their age are revalidated and deleted as soon as they are old enough, when
+        # running periodically, rather than at the next run
+        self.delete_when_eligible = delete_when_eligible
+        # If set, tenants are shared between the nodes that use the tracking database, each holding leases of this
+        # duration on its shard of them, rather than every node cleaning up every tenant
+        self.lease_duration = lease_duration
 
 
 class Configuration(Model):
@@ -78,29 +204,100 @@ class Configuration(Model):
         self.clean_up_configurations = clean_up_configurations
 
 
-def _create_common_prevent_delete_detectors(parent_property: Dict[str, Any]) -> List[PreventDeleteDetector]:
+# Names of predicates that are not compiled from a configuration property of the same name
+_PROTECTED_PREDICATE = "protected"
+_IN_USE_PREDICATE = "in-use"
+
+
+def _create_common_predicates(parent_property: Dict[str, Any]) -> List[Predicate]:
     """
-    Creates delete prevention detectors that are common to all area clean-ups.
+    Creates the policy predicates that are common to all area clean-ups.
     :param parent_property: the area clean-up configuration
-    :return: the created delete prevent detectors
+    :return: the created predicates
     """
-    detectors: List[PreventDeleteDetector] = []
+    predicates: List[Predicate] = []
 
     if _CLEAN_UP_EXCLUDE_PROPERTY in parent_property:
         excludes = [re.compile(exclude) for exclude in parent_property[_CLEAN_UP_EXCLUDE_PROPERTY]]
-        detectors.append(create_exclude_detector(excludes))
+        predicates.append(Predicate(
+            _CLEAN_UP_EXCLUDE_PROPERTY, create_exclude_detector(excludes), [PredicateInput.ITEM]))
 
     if _CLEAN_UP_REMOVE_IF_OLDER_THAN_PROPERTY in parent_property:
         delete_if_older_than = parse_timedelta(parent_property[_CLEAN_UP_REMOVE_IF_OLDER_THAN_PROPERTY])
-        detectors.append(create_delete_if_older_than_detector(delete_if_older_than))
+        predicates.append(Predicate(
+            _CLEAN_UP_REMOVE_IF_OLDER_THAN_PROPERTY, create_delete_if_older_than_detector(delete_if_older_than),
+            [PredicateInput.AGE], listing_filter=ListingFilter(older_than=delete_if_older_than),
+            flips_after=delete_if_older_than))
 
-    return detectors
+    return predicates
 
 
-def parse_configuration(location: str):
+def _get_cached_policy(area_property: str, raw_area: Dict[str, Any],
+                       create_predicates: Callable[[Dict[str, Any]], List[Predicate]],
+                       policy_cache: Optional[Dict[str, Policy]],
+                       previous_policy_cache: Optional[Dict[str, Policy]]) -> Policy:
+    """
+    Gets the policy compiled from the given area configuration, only compiling it if it has not already been compiled
+    for an identical area configuration.
+    :param area_property: the area's property name
+    :param raw_area: the area's configuration
+    :param create_predicates: creates the predicates of the policy for the area configuration
+    :param policy_cache: map between area configurations and the policies compiled from them (not used if `None`)
+    :param previous_policy_cache: map between area configurations and the policies compiled from them for a previous
+    configuration, which are reused and added to `policy_cache` (not used if `None`)
+    :return: the policy
+    """
+    if policy_cache is None:
+        return Policy(create_predicates(raw_area))
+    key = json.dumps([area_property, raw_area], sort_keys=True, default=str)
+    if key not in policy_cache:
+        if previous_policy_cache is not None and key in previous_policy_cache:
+            policy_cache[key] = previous_policy_cache[key]
+        else:
+            policy_cache[key] = Policy(create_predicates(raw_area))
+    return policy_cache[key]
+
+
+def _create_image_predicates(raw_images: Dict[str, Any]) -> List[Predicate]:
+    """
+    Creates the policy predicates for the given image area configuration.
+    :param raw_images: the image area configuration
+    :return: the created predicates
+    """
+    predicates = _create_common_predicates(raw_images)
+    predicates.append(Predicate(
+        _PROTECTED_PREDICATE, prevent_delete_protected_image_detector, [PredicateInput.ITEM], [OpenstackImage],
+        ListingFilter(protected=False)))
+    predicates.append(Predicate(
+        _IN_USE_PREDICATE, prevent_delete_image_in_use_detector,
+        [PredicateInput.INSTANCES, PredicateInput.DECISIONS], [OpenstackImage]))
+    return predicates
+
+
+def _create_key_pair_predicates(raw_keypairs: Dict[str, Any]) -> List[Predicate]:
+    """
+    Creates the policy predicates for the given key-pair area configuration.
+    :param raw_keypairs: the key-pair area configuration
+    :return: the created predicates
+    """
+    predicates = _create_common_predicates(raw_keypairs)
+    if raw_keypairs[_CLEAN_UP_REMOVE_ONLY_IF_UNUSED_PROPERTY]:
+        predicates.append(Predicate(
+            _CLEAN_UP_REMOVE_ONLY_IF_UNUSED_PROPERTY, prevent_delete_key_pair_in_use_detector,
+            [PredicateInput.INSTANCES, PredicateInput.DECISIONS], [OpenstackKeypair]))
+    return predicates
+
+
+def parse_configuration(location: str, policy_cache: Dict[str, Policy]=None,
+                        previous_policy_cache: Dict[str, Policy]=None):
     """
     Parses the configuration in the given location.
     :param location: the location of the configuration that is to be parsed
+    :param policy_cache: policies already compiled from area configurations, which are reused for identical area
+    configurations (and added to for new ones)
+    :param previous_policy_cache: policies compiled from the area configurations of a previous configuration, which are
+    reused for identical area configurations and added to `policy_cache`, so that `policy_cache` can be started empty to
+    only hold the policies that this configuration uses
     :return: parsed configuration
     """
     with open(location, "r") as file:
@@ -119,11 +316,73 @@ def parse_configuration(location: str):
         ),
         tracking_database=raw_general[_GENERAL_TRACKING_DATABASE_PROPERTY],
     )
+    raw_logging = raw_general[_GENERAL_LOGGING_PROPERTY]
+    if _GENERAL_LOG_NOT_DELETED_PROPERTY in raw_logging:
+        general_configuration.logging_configuration.not_deleted_detail = NotDeletedDetail(
+            raw_logging[_GENERAL_LOG_NOT_DELETED_PROPERTY])
+    if _GENERAL_LOG_NOT_DELETED_SAMPLE_SIZE_PROPERTY in raw_logging:
+        general_configuration.logging_configuration.not_deleted_sample_size = \
+            raw_logging[_GENERAL_LOG_NOT_DELETED_SAMPLE_SIZE_PROPERTY]
     if _GENERAL_MAX_SIMULTANEOUS_DELETES_PROPERTY in raw_general:
         general_configuration.max_simultaneous_deletes = raw_general[_GENERAL_MAX_SIMULTANEOUS_DELETES_PROPERTY]
+    if _GENERAL_MAX_SIMULTANEOUS_TENANTS_PROPERTY in raw_general:
+        general_configuration.max_simultaneous_tenants = raw_general[_GENERAL_MAX_SIMULTANEOUS_TENANTS_PROPERTY]
+    if _GENERAL_TRACKING_GRACE_PERIOD_PROPERTY in raw_general:
+        general_configuration.tracking_grace_period = parse_timedelta(
+            raw_general[_GENERAL_TRACKING_GRACE_PERIOD_PROPERTY])
+    if _GENERAL_DELETE_PRIORITY_PROPERTY in raw_general:
+        general_configuration.delete_priority = DeletePriority(raw_general[_GENERAL_DELETE_PRIORITY_PROPERTY])
+    if _GENERAL_MAX_DELETES_PER_RUN_PROPERTY in raw_general:
+        general_configuration.max_deletes_per_run = raw_general[_GENERAL_MAX_DELETES_PER_RUN_PROPERTY]
+    if _GENERAL_CHECK_QUOTA_EVERY_PROPERTY in raw_general:
+        general_configuration.quota_check_period = parse_timedelta(raw_general[_GENERAL_CHECK_QUOTA_EVERY_PROPERTY])
+    if _GENERAL_QUOTA_TRIGGER_USAGE_PROPERTY in raw_general:
+        general_configuration.quota_trigger_usage = raw_general[_GENERAL_QUOTA_TRIGGER_USAGE_PROPERTY]
+    if _GENERAL_STREAM_PAGE_SIZE_PROPERTY in raw_general:
+        general_configuration.stream_page_size = raw_general[_GENERAL_STREAM_PAGE_SIZE_PROPERTY]
+    if _GENERAL_FILTER_LISTINGS_PROPERTY in raw_general:
+        general_configuration.filter_listings = raw_general[_GENERAL_FILTER_LISTINGS_PROPERTY]
+    if _GENERAL_DELETE_WHEN_ELIGIBLE_PROPERTY in raw_general:
+        general_configuration.delete_when_eligible = raw_general[_GENERAL_DELETE_WHEN_ELIGIBLE_PROPERTY]
+    if _GENERAL_LEASE_DURATION_PROPERTY in raw_general:
+        general_configuration.lease_duration = parse_timedelta(raw_general[_GENERAL_LEASE_DURATION_PROPERTY])
+    if _GENERAL_ADMIN_CREDENTIALS_PROPERTY in raw_general:
+        raw_admin_credentials = raw_general[_GENERAL_ADMIN_CREDENTIALS_PROPERTY]
+        general_configuration.admin_credentials = OpenstackCredentials(
+            auth_url=raw_admin_credentials[_CLEAN_UP_OPENSTACK_AUTH_URL_PROPERTY],
+            tenant=raw_admin_credentials[_CLEAN_UP_TENANT_PROPERTY],
+            username=raw_admin_credentials[_CLEAN_UP_CREDENTIALS_USERNAME_PROPERTY],
+            password=raw_admin_credentials[_CLEAN_UP_CREDENTIALS_PASSWORD_PROPERTY])
+    if _GENERAL_NOTIFICATIONS_PROPERTY in raw_general:
+        raw_notifications = raw_general[_GENERAL_NOTIFICATIONS_PROPERTY]
+        general_configuration.notifications_configuration = NotificationsConfiguration(
+            url=raw_notifications[_GENERAL_NOTIFICATIONS_URL_PROPERTY])
+        if _GENERAL_NOTIFICATIONS_EXCHANGES_PROPERTY in raw_notifications:
+            general_configuration.notifications_configuration.exchanges = \
+                raw_notifications[_GENERAL_NOTIFICATIONS_EXCHANGES_PROPERTY]
+        if _GENERAL_NOTIFICATIONS_TOPIC_PROPERTY in raw_notifications:
+            general_configuration.notifications_configuration.topic = \
+                raw_notifications[_GENERAL_NOTIFICATIONS_TOPIC_PROPERTY]
+    if _GENERAL_MIN_RUN_EVERY_PROPERTY in raw_general:
+        general_configuration.min_run_period = parse_timedelta(raw_general[_GENERAL_MIN_RUN_EVERY_PROPERTY])
+    if _GENERAL_MAX_RUN_EVERY_PROPERTY in raw_general:
+        general_configuration.max_run_period = parse_timedelta(raw_general[_GENERAL_MAX_RUN_EVERY_PROPERTY])
+    if general_configuration.min_run_period > general_configuration.max_run_period:
+        raise ValueError(f"\"{_GENERAL_MIN_RUN_EVERY_PROPERTY}\" cannot be greater than "
+                         f"\"{_GENERAL_MAX_RUN_EVERY_PROPERTY}\"")
+    if _GENERAL_COMPACT_TRACKING_EVERY_PROPERTY in raw_general:
+        general_configuration.tracking_compaction_period = parse_timedelta(
+            raw_general[_GENERAL_COMPACT_TRACKING_EVERY_PROPERTY])
+    if general_configuration.stream_page_size is not None:
+        # Streaming clean-ups delete each page as it is decided on, so deletes cannot be ordered or limited per run
+        for property_name in (_GENERAL_DELETE_PRIORITY_PROPERTY, _GENERAL_MAX_DELETES_PER_RUN_PROPERTY):
+            if property_name in raw_general:
+                raise ValueError(f"\"{property_name}\" cannot be used with \"{_GENERAL_STREAM_PAGE_SIZE_PROPERTY}\"")
 
-    cleanup_configuration = CleanUpConfiguration()
+    cleanup_configurations: List[CleanUpConfiguration] = []
     for raw_cleanup in raw_configuration[_CLEAN_UP_PROPERTY]:
+        cleanup_configuration = CleanUpConfiguration()
+        cleanup_configurations.append(cleanup_configuration)
         raw_credentials = raw_cleanup[_CLEAN_UP_CREDENTIALS_PROPERTY]
         for raw_credential in raw_credentials:
             cleanup_configuration.credentials.append(OpenstackCredentials(
@@ -134,27 +393,84 @@ def parse_configuration(location: str):
             ))
 
         if _CLEAN_UP_IMAGES_PROPERTY in raw_cleanup:
-            raw_images = raw_cleanup[_CLEAN_UP_IMAGES_PROPERTY]
-            detectors = _create_common_prevent_delete_detectors(raw_images)
-            detectors.append(prevent_delete_protected_image_detector)
-            detectors.append(prevent_delete_image_in_use_detector)
-            cleanup_configuration.areas[OpenstackImageManager] = detectors
+            cleanup_configuration.areas[OpenstackImageManager] = _get_cached_policy(
+                _CLEAN_UP_IMAGES_PROPERTY, raw_cleanup[_CLEAN_UP_IMAGES_PROPERTY], _create_image_predicates,
+                policy_cache, previous_policy_cache)
+            raw_quota = raw_cleanup[_CLEAN_UP_IMAGES_PROPERTY].get(_CLEAN_UP_IMAGES_QUOTA_PROPERTY)
+            if raw_quota is not None:
+                if general_configuration.stream_page_size is not None:
+                    # Which images need deleting to get within the quota is only known once all images are listed
+                    raise ValueError(f"Image \"{_CLEAN_UP_IMAGES_QUOTA_PROPERTY}\" cannot be used with "
+                                     f"\"{_GENERAL_STREAM_PAGE_SIZE_PROPERTY}\"")
+                cleanup_configuration.image_quota = ImageQuotaConfiguration(
+                    max_gigabytes=raw_quota.get(_CLEAN_UP_IMAGES_QUOTA_GIGABYTES_PROPERTY),
+                    max_images=raw_quota.get(_CLEAN_UP_IMAGES_QUOTA_IMAGES_PROPERTY),
+                    headroom=raw_quota.get(_CLEAN_UP_IMAGES_QUOTA_HEADROOM_PROPERTY, DEFAULT_IMAGE_QUOTA_HEADROOM))
     
         if _CLEAN_UP_INSTANCES_PROPERTY in raw_cleanup:
-            raw_instances = raw_cleanup[_CLEAN_UP_INSTANCES_PROPERTY]
-            detectors = _create_common_prevent_delete_detectors(raw_instances)
-            cleanup_configuration.areas[OpenstackInstanceManager] = detectors
+            cleanup_configuration.areas[OpenstackInstanceManager] = _get_cached_policy(
+                _CLEAN_UP_INSTANCES_PROPERTY, raw_cleanup[_CLEAN_UP_INSTANCES_PROPERTY], _create_common_predicates,
+                policy_cache, previous_policy_cache)
 
         if _CLEAN_UP_KEY_PAIRS_PROPERTY in raw_cleanup:
-            raw_keypairs = raw_cleanup[_CLEAN_UP_KEY_PAIRS_PROPERTY]
-            detectors = _create_common_prevent_delete_detectors(raw_keypairs)
-
-            if raw_keypairs[_CLEAN_UP_REMOVE_ONLY_IF_UNUSED_PROPERTY]:
-                detectors.append(prevent_delete_key_pair_in_use_detector)
-
-            cleanup_configuration.areas[OpenstackKeypairManager] = detectors
+            cleanup_configuration.areas[OpenstackKeypairManager] = _get_cached_policy(
+                _CLEAN_UP_KEY_PAIRS_PROPERTY, raw_cleanup[_CLEAN_UP_KEY_PAIRS_PROPERTY], _create_key_pair_predicates,
+                policy_cache, previous_policy_cache)
 
     return Configuration(
         general_configuration=general_configuration,
-        clean_up_configurations=[cleanup_configuration]
+        clean_up_configurations=cleanup_configurations
     )
+
+
+class ConfigurationWatcher:
+    """
+    Watches a configuration file, reparsing it when it changes. The policies of areas whose configuration has
+    not changed are reused.
+    """
+    def __init__(self, location: str):
+        """
+        Constructor, which parses the configuration.
+        :param location: the location of the configuration
+        """
+        self.location = location
+        self._policy_cache: Dict[str, Policy] = {}
+        self._modified = os.path.getmtime(location)
+        self._fingerprint = self._create_fingerprint()
+        self.configuration = parse_configuration(location, self._policy_cache)
+
+    def reload(self) -> bool:
+        """
+        Reparses the configuration if the file has changed since it was last parsed. The configuration is replaced
+        atomically; if the changed configuration is invalid, the previous configuration is kept.
+        :return: whether the configuration was replaced
+        """
+        modified = os.path.getmtime(self.location)
+        if modified == self._modified:
+            return False
+        self._modified = modified
+        fingerprint = self._create_fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+
+        # The cache is rebuilt so that it only holds the policies used by the latest configuration
+        policy_cache: Dict[str, Policy] = {}
+        try:
+            configuration = parse_configuration(self.location, policy_cache, self._policy_cache)
+        except Exception as e:
+            _logger.error(f"Changed configuration in {self.location} is invalid - keeping previous configuration: {e}")
+            return False
+        _logger.info(f"Reloaded configuration from {self.location} "
+                     f"({len(policy_cache.keys() - self._policy_cache.keys())} area(s) changed)")
+        self._fingerprint = fingerprint
+        self._policy_cache = policy_cache
+        self.configuration = configuration
+        return True
+
+    def _create_fingerprint(self) -> str:
+        """
+        Creates a fingerprint of the configuration file's contents.
+        :return: the fingerprint
+        """
+        with open(self.location, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
@@ -1,45 +1,106 @@
 from datetime import timedelta
 
-from typing import Callable, Tuple, Pattern, Iterable, Set
+from typing import Callable, Tuple, Pattern, Iterable, Set, Dict, List, Optional
 
 from openstacktenantcleaner.common import create_human_identifier
 from openstacktenantcleaner.managers import OpenstackInstanceManager
 from openstacktenantcleaner.models import OpenstackItem, OpenstackCredentials, OpenstackImage, OpenstackKeypair, \
     OpenstackInstance
-from openstacktenantcleaner.tracking import Tracker
+from openstacktenantcleaner.tracking import Tracker, create_partition_key
+
+
+class InstanceIndex:
+    """
+    Index of the instances in the tenants that are being cleaned up, built once per cycle, which allows the instances
+    using an image (in any of the tenants) or a key-pair (in the key-pair's tenant) to be found without listing
+    instances for each image or key-pair.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self._instances: Dict[str, List[OpenstackInstance]] = {}
+        self._image_users: Dict[str, List[OpenstackInstance]] = {}
+        self._key_pair_users: Dict[Tuple[str, str], List[OpenstackInstance]] = {}
+
+    def add(self, tenant: str, instances: Iterable[OpenstackInstance]):
+        """
+        Adds the given instances of a tenant to the index.
+        :param tenant: the tenant's tracker partition key (see `create_partition_key`)
+        :param instances: all of the tenant's instances
+        """
+        instances = list(instances)
+        self._instances[tenant] = instances
+        for instance in instances:
+            self._image_users.setdefault(instance.image, []).append(instance)
+            self._key_pair_users.setdefault((tenant, instance.key_name), []).append(instance)
+
+    def get_instances(self, tenant: str) -> Optional[List[OpenstackInstance]]:
+        """
+        Gets the instances of the given tenant.
+        :param tenant: the tenant's tracker partition key
+        :return: the tenant's instances or `None` if the tenant has not been indexed
+        """
+        return self._instances.get(tenant)
+
+    def get_image_users(self, image_identifier: str) -> List[OpenstackInstance]:
+        """
+        Gets the instances, in any indexed tenant, that are using the image with the given identifier.
+        :param image_identifier: the image's identifier
+        :return: the instances using the image
+        """
+        return self._image_users.get(image_identifier, [])
+
+    def get_key_pair_users(self, tenant: str, key_name: str) -> Optional[List[OpenstackInstance]]:
+        """
+        Gets the instances in the given tenant that are using the key-pair with the given name.
+        :param tenant: the tenant's tracker partition key
+        :param key_name: the key-pair's name
+        :return: the instances using the key-pair or `None` if the tenant has not been indexed
+        """
+        if tenant not in self._instances:
+            return None
+        return self._key_pair_users.get((tenant, key_name), [])
+
 
 ShouldPreventDeleteAndReason = Tuple[bool, str]
-PreventDeleteDetector = Callable[[OpenstackItem, OpenstackCredentials, Tracker, Set[OpenstackItem]],
-                                 ShouldPreventDeleteAndReason]
+PreventDeleteDetector = Callable[[OpenstackItem, OpenstackCredentials, Tracker, Set[OpenstackItem],
+                                  Optional[InstanceIndex]], ShouldPreventDeleteAndReason]
 
 
 def prevent_delete_protected_image_detector(image: OpenstackImage, openstack_credentials: OpenstackCredentials,
-                                            tracker: Tracker,  already_marked_for_deletion: Set[OpenstackItem])\
-        -> ShouldPreventDeleteAndReason:
+                                            tracker: Tracker,  already_marked_for_deletion: Set[OpenstackItem],
+                                            instance_index: InstanceIndex=None) -> ShouldPreventDeleteAndReason:
     """
     Detects when an image delete should be prevented because the OpenStack image is marked as protected.
     :param image: the image of interest
     :param openstack_credentials: credentials to access OpenStack
     :param tracker: OpenStack item history tracker
     :param already_marked_for_deletion: OpenStack items already marked for deletion in other reports
+    :param instance_index: index of the instances in the tenants being cleaned up
     :return: whether to prevent deletion of the item and the reason for the decision
     """
     return image.protected, f"Image is {'' if image.protected else 'not '}marked on OpenStack as protected"
 
 
 def prevent_delete_image_in_use_detector(image: OpenstackImage, openstack_credentials: OpenstackCredentials,
-                                         tracker: Tracker, already_marked_for_deletion: Set[OpenstackItem]) \
-        -> ShouldPreventDeleteAndReason:
+                                         tracker: Tracker, already_marked_for_deletion: Set[OpenstackItem],
+                                         instance_index: InstanceIndex=None) -> ShouldPreventDeleteAndReason:
     """
     Detects when an image delete should be prevented because the image is in use by an OpenStack instance. 
     :param image: the image of interest
     :param openstack_credentials: credentials to access OpenStack
     :param tracker: OpenStack item history tracker
     :param already_marked_for_deletion: OpenStack items already marked for deletion in other reports
+    :param instance_index: index of the instances in the tenants being cleaned up, which is used to find instances in
+    any of those tenants that are using the image (only the instances visible to the given credentials are checked if
+    `None`)
     :return: whether to prevent deletion of the item and the reason for the decision
     """
-    instance_manager = OpenstackInstanceManager(openstack_credentials)
-    instances = instance_manager.get_all()
+    if instance_index is not None:
+        instances = instance_index.get_image_users(image.identifier)
+    else:
+        instances = OpenstackInstanceManager(openstack_credentials).get_all()
     instances_marked_for_deletion = {item for item in already_marked_for_deletion if type(item) == OpenstackInstance}
     for instance in instances:
         if instance.image == image.identifier and instance not in instances_marked_for_deletion:
@@ -49,19 +110,24 @@ def prevent_delete_image_in_use_detector(image: OpenstackImage, openstack_creden
 
 
 def prevent_delete_key_pair_in_use_detector(key_pair: OpenstackKeypair, openstack_credentials: OpenstackCredentials,
-                                            tracker: Tracker, already_marked_for_deletion: Set[OpenstackItem])\
-        -> ShouldPreventDeleteAndReason:
+                                            tracker: Tracker, already_marked_for_deletion: Set[OpenstackItem],
+                                            instance_index: InstanceIndex=None) -> ShouldPreventDeleteAndReason:
     """
     Detects when an key-pair delete should be prevented because it is in use by an OpenStack instance.
     :param key_pair:  the key-pair of interest
     :param openstack_credentials: credentials to access OpenStack
     :param tracker: OpenStack item history tracker
     :param already_marked_for_deletion: OpenStack items already marked for deletion in other reports
+    :param instance_index: index of the instances in the tenants being cleaned up (instances are listed if `None` or
+    the key-pair's tenant has not been indexed)
     :return: whether to prevent deletion of the item and the reason for the decision
     """
-    instance_manager = OpenstackInstanceManager(openstack_credentials)
+    instances = instance_index.get_key_pair_users(create_partition_key(openstack_credentials), key_pair.name) \
+        if instance_index is not None else None
+    if instances is None:
+        instances = OpenstackInstanceManager(openstack_credentials).get_all()
     instances_marked_for_deletion = {item for item in already_marked_for_deletion if type(item) == OpenstackInstance}
-    for instance in instance_manager.get_all():
+    for instance in instances:
         if instance.key_name == key_pair.name and instance not in instances_marked_for_deletion:
             return True, f"Key pair in use by instance {create_human_identifier(instance)}"
     return False, "No instances are using the key pair"
@@ -74,10 +140,9 @@ def create_delete_if_older_than_detector(age: timedelta) -> PreventDeleteDetecto
     :return: the created detector
     """
     def detector(item: OpenstackItem, credentials: OpenstackCredentials, tracker: Tracker,
-                 already_marked_for_deletion: Set[OpenstackItem]):
-        item_age = tracker.get_age(item)
-        prevent_delete = item_age <= age
-        return prevent_delete, f"Item age: {item_age} - {'not ' if prevent_delete else ''}older than: {age}"
+                 already_marked_for_deletion: Set[OpenstackItem], instance_index: InstanceIndex=None):
+        prevent_delete = not tracker.is_older_than(item, age)
+        return prevent_delete, f"Item is {'not ' if prevent_delete else ''}older than: {age}"
 
     return detector
 
@@ -89,7 +154,7 @@ def create_exclude_detector(excludes: Iterable[Pattern]) -> PreventDeleteDetecto
     :return: the created detector
     """
     def detector(item: OpenstackItem, credentials: OpenstackCredentials, tracker: Tracker,
-                 already_marked_for_deletion: Set[OpenstackItem]):
+                 already_marked_for_deletion: Set[OpenstackItem], instance_index: InstanceIndex=None):
         for exclude in excludes:
             if exclude.fullmatch(item.name) is not None:
                 return True, f"Exclude matched: {exclude.pattern}"
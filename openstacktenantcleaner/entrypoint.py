@@ -2,25 +2,51 @@ import logging
 import os
 import sys
 from argparse import ArgumentParser
-from datetime import datetime
+from datetime import datetime, timedelta
 from logging import StreamHandler, FileHandler
 from logging.handlers import RotatingFileHandler
 
-from apscheduler.schedulers.blocking import BlockingScheduler
-from sqlalchemy import create_engine
-from typing import List
+from typing import List, TextIO, Optional, Callable, Dict, TYPE_CHECKING, Collection
 
 from openstacktenantcleaner.common import get_absolute_path_relative_to
-from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyModel
-from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
-from openstacktenantcleaner.configuration import parse_configuration, Configuration, LoggingConfiguration
-from openstacktenantcleaner.planning import create_clean_up_plans, create_human_explanation, execute_plans
-from openstacktenantcleaner.tracking import Tracker
+from openstacktenantcleaner._logstore.tracking import LogTracker
+from openstacktenantcleaner.configuration import Configuration, LoggingConfiguration, CleanUpConfiguration, \
+    ConfigurationWatcher
+from openstacktenantcleaner.detectors import InstanceIndex
+from openstacktenantcleaner.journal import DeleteJournal
+from openstacktenantcleaner.leasing import ShardCoordinator
+from openstacktenantcleaner.managers import get_compute_quota_usage, get_tenant_id, ManagerCache, AdminManagerCache
+from openstacktenantcleaner.models import DecisionChanges, ItemDecision
+from openstacktenantcleaner.planning import create_clean_up_plans, write_human_explanation, execute_plans, \
+    create_clean_up_plans_from_planned_deletes, DecisionHistory, execute_streaming_clean_up, create_instance_index, \
+    DecisionListener, create_clean_up_plans_for_eligible_items, create_clean_up_plans_from_delete_journal, \
+    InstanceIndexCache, filter_plan_deletes, CleanUpPlan
+from openstacktenantcleaner.notifications import NotificationConsumer, AmqpNotificationSource
+from openstacktenantcleaner.scheduling import AdaptiveRunScheduler, RunStatistics, QuotaWatcher, EligibilityScheduler
+from openstacktenantcleaner.serialisation import JsonLinesDecisionWriter, PlanFileWriter, read_plan_file
+from openstacktenantcleaner.tracking import Tracker, create_partition_key
+
+if TYPE_CHECKING:
+    from apscheduler.schedulers.base import BaseScheduler
 
 # TODO: these should be configurable
 MAX_LOG_FILE_SIZE_IN_BYTES = 100 * 1024 * 1024
 BACKUP_LOG_COUNT = 3
 
+SQLITE_SCHEME = "sqlite"
+LOG_SCHEME = "log"
+
+_STANDARD_OUT_LOCATION = "-"
+
+# How often the configuration file is checked for changes when running periodically
+CONFIGURATION_CHECK_PERIOD = timedelta(seconds=30)
+
+_RUN_JOB_ID = "run"
+_QUOTA_TRIGGERED_RUN_JOB_ID_PREFIX = "quota-triggered-run:"
+
+PLAN_COMMAND = "plan"
+APPLY_COMMAND = "apply"
+
 # XXX: __name__ here is set to "__main__", therefore cannot use _logger = logging.getLogger(__name__)
 _logger = logging.getLogger(".".join(__file__.split(os.path.sep)[-2:]).rstrip(".py"))
 
@@ -31,10 +57,14 @@ class _CliConfiguration():
     """
     CLI configuration.
     """
-    def __init__(self, dry_run: bool=False, configuration_location: str=None, run_once: bool=False):
+    def __init__(self, dry_run: bool=False, configuration_location: str=None, run_once: bool=False,
+                 plan_output_location: str=None, command: str=None, plan_location: str=None):
         self.dry_run = dry_run
         self.configuration_location = configuration_location
         self.run_once = run_once
+        self.plan_output_location = plan_output_location
+        self.command = command
+        self.plan_location = plan_location
 
 
 def _parse_arguments(argument_list: List[str]) -> _CliConfiguration:
@@ -42,12 +72,39 @@ def _parse_arguments(argument_list: List[str]) -> _CliConfiguration:
     Parse the given CLI arguments.
     :return: CLI arguments
     """
+    if len(argument_list) > 0 and argument_list[0] in (PLAN_COMMAND, APPLY_COMMAND):
+        return _parse_command_arguments(argument_list)
+
     parser = ArgumentParser(description="OpenStack Tenant Cleaner")
     parser.add_argument("-d", "--dry-run", default=False, action="store_true", help="runs but does not delete anything")
     parser.add_argument("-s", "--single-run", default=False, action="store_true", help="run once then stop")
+    parser.add_argument("-o", "--plan-output", type=str, metavar="LOCATION",
+                        help=f"file (or pipe) to write each decision to as a JSON line as plans are made (use "
+                             f"\"{_STANDARD_OUT_LOCATION}\" for stdout)")
     parser.add_argument("config", metavar="configuration_location", type=str, help="location of the configuration file")
     arguments = parser.parse_args(argument_list)
-    return _CliConfiguration(arguments.dry_run, arguments.config, arguments.single_run)
+    return _CliConfiguration(arguments.dry_run, arguments.config, arguments.single_run, arguments.plan_output)
+
+
+def _parse_command_arguments(argument_list: List[str]) -> _CliConfiguration:
+    """
+    Parse the given CLI arguments, which start with the `plan` or `apply` command.
+    :return: CLI arguments
+    """
+    parser = ArgumentParser(description="OpenStack Tenant Cleaner")
+    subparsers = parser.add_subparsers(dest="command")
+    plan_parser = subparsers.add_parser(PLAN_COMMAND, help="plans what to delete, without deleting anything")
+    apply_parser = subparsers.add_parser(APPLY_COMMAND, help="deletes what was planned, if still valid")
+    apply_parser.add_argument("-d", "--dry-run", default=False, action="store_true",
+                              help="revalidates the plan but does not delete anything")
+    for subparser in (plan_parser, apply_parser):
+        subparser.add_argument("config", metavar="configuration_location", type=str,
+                               help="location of the configuration file")
+        subparser.add_argument("plan", metavar="plan_location", type=str,
+                               help=f"location of the plan file (use \"{_STANDARD_OUT_LOCATION}\" for stdout/stdin)")
+    arguments = parser.parse_args(argument_list)
+    return _CliConfiguration(getattr(arguments, "dry_run", True), arguments.config, True,
+                             command=arguments.command, plan_location=arguments.plan)
 
 
 def _configure_logging(logging_configuration: LoggingConfiguration):
@@ -70,37 +127,654 @@ def _configure_logging(logging_configuration: LoggingConfiguration):
     logger.setLevel(logging.DEBUG)
 
 
-def run(configuration: Configuration, tracker: Tracker, dry_run: bool):
+def _is_logged(logger: logging.Logger, level: int) -> bool:
+    """
+    Gets whether a record of the given level would be output by the given logger (or one of its parents).
+    :param logger: the logger
+    :param level: the record level
+    :return: whether a record would be output
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    while logger is not None:
+        if any(handler.level <= level for handler in logger.handlers):
+            return True
+        logger = logger.parent if logger.propagate else None
+    return False
+
+
+def _create_tracker(tracking_database: str, configuration_location: str, grace_period: timedelta) -> Tracker:
+    """
+    Creates the tracker for the given tracking database, creating or migrating the database as required. The tracker
+    backend is selected by the database's URL scheme: `log://` for the record log backend and any other scheme for the
+    SQL backend. A location without a scheme is taken to be the path of a SQLite database.
+    :param tracking_database: location of the tracking database
+    :param configuration_location: location of the configuration, which relative paths are relative to
+    :param grace_period: how long the tracker retains items that no longer exist
+    :return: the created tracker
+    """
+    scheme, separator, path = tracking_database.partition("://")
+    if separator == "":
+        scheme, path = SQLITE_SCHEME, f"/{tracking_database}"
+
+    if scheme in (SQLITE_SCHEME, LOG_SCHEME):
+        # Following SQLAlchemy's convention, a path following "://" has a leading "/", then is absolute if it
+        # starts with a further "/"
+        path = path[1:]
+        if not os.path.isabs(path):
+            path = get_absolute_path_relative_to(path, configuration_location)
+        if scheme == LOG_SCHEME:
+            return LogTracker(path, grace_period=grace_period)
+        tracking_database = f"{SQLITE_SCHEME}:///{path}"
+
+    # SQLAlchemy is slow to import so is only imported if the SQL backend is used
+    from openstacktenantcleaner._sqlalchemy.migrations import migrate, SCHEMA_VERSION
+    from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
+
+    original_schema_version = migrate(tracking_database)
+    if original_schema_version is None:
+        _logger.info(f"Created tracking database: {tracking_database}")
+    elif original_schema_version != SCHEMA_VERSION:
+        _logger.info(f"Migrated tracking database {tracking_database} from schema version {original_schema_version} "
+                     f"to {SCHEMA_VERSION}")
+    return SqlTracker(tracking_database, grace_period=grace_period)
+
+
+def _open_plan_output(location: str, append: bool=True) -> TextIO:
+    """
+    Opens the given plan output location for writing.
+    :param location: the location to open, where "-" is stdout
+    :param append: whether to append to the location, as opposed to overwriting it
+    :return: the opened stream, which is closed on exit if used as a context manager (unless it is stdout)
+    """
+    if location == _STANDARD_OUT_LOCATION:
+        return open(sys.stdout.fileno(), "w", closefd=False)
+    return open(location, "a" if append else "w")
+
+
+def _create_manager_cache(configuration: Configuration) -> ManagerCache:
+    """
+    Creates a cache of the managers used to list and delete items, which use admin credentials to list all tenants at
+    once if they are configured.
+    :param configuration: cleaner configuration
+    :return: the created manager cache
+    """
+    admin_credentials = configuration.general_configuration.admin_credentials
+    if admin_credentials is not None:
+        return AdminManagerCache(admin_credentials)
+    return ManagerCache()
+
+
+def _combine_decision_listeners(*decision_listeners: Optional[DecisionListener]) -> Optional[DecisionListener]:
+    """
+    Combines the given decision listeners into one that calls each of them in turn.
+    :param decision_listeners: the listeners, where those that are `None` are ignored
+    :return: the combined listener (`None` if there are no listeners)
+    """
+    decision_listeners = [listener for listener in decision_listeners if listener is not None]
+    if len(decision_listeners) <= 1:
+        return decision_listeners[0] if len(decision_listeners) == 1 else None
+
+    def decision_listener(decision: ItemDecision):
+        for listener in decision_listeners:
+            listener(decision)
+
+    return decision_listener
+
+
+def run(configuration: Configuration, tracker: Tracker, dry_run: bool, plan_output_location: str=None,
+        decision_history: DecisionHistory=None, manager_cache: ManagerCache=None,
+        instance_index: InstanceIndex=None, decision_listener: DecisionListener=None,
+        delete_journal: DeleteJournal=None, shard_coordinator: ShardCoordinator=None) -> Optional[DecisionChanges]:
     """
     Run the cleaner.
     :param configuration: cleaner configuration
     :param tracker: OpenStack item history tracker
     :param dry_run: whether to run without actually deleting anything
+    :param plan_output_location: location to write each decision to as a JSON line
+    :param decision_history: the decisions made in the previous run, which are not explained again if unchanged
+    :param manager_cache: cache of managers to reuse between runs, which the caller is to refresh (see
+    `ManagerCache.refresh`)
+    :param instance_index: index of the instances in all of the tenants that are cleaned up (created from the tenants
+    in the given configuration if `None`)
+    :param decision_listener: called with each decision as it is made (must be thread-safe if multiple tenants are
+    cleaned up simultaneously)
+    :param delete_journal: journal to record the progress of deletes in (not journalled if `None`, or if the run is
+    streamed)
+    :param shard_coordinator: coordinator of this node's shard, which is checked right before deleting so that nothing
+    is deleted in tenants whose leases have been lost whilst planning (not checked if `None`, or if the run is
+    streamed)
+    :return: how the decisions have changed since the previous run, if a decision history was given and the run was not
+    streamed
     """
     global _global_run_counter
     _global_run_counter += 1
     _logger.info(f"Starting run cycle {_global_run_counter}...")
 
     try:
-        plans = create_clean_up_plans(configuration, tracker, dry_run=dry_run)
-        _logger.info(create_human_explanation(plans, dry_run=dry_run))
-        execute_plans(plans, configuration.general_configuration.max_simultaneous_deletes)
+        stream_page_size = configuration.general_configuration.stream_page_size
+        filter_listings = configuration.general_configuration.filter_listings
+        if stream_page_size is not None:
+            if plan_output_location is not None:
+                with _open_plan_output(plan_output_location) as plan_output:
+                    execute_streaming_clean_up(configuration, tracker, dry_run=dry_run,
+                                               decision_listener=_combine_decision_listeners(
+                                                   JsonLinesDecisionWriter(plan_output), decision_listener),
+                                               manager_cache=manager_cache, page_size=stream_page_size,
+                                               instance_index=instance_index, filter_listings=filter_listings)
+            else:
+                execute_streaming_clean_up(configuration, tracker, dry_run=dry_run,
+                                           decision_listener=decision_listener, manager_cache=manager_cache,
+                                           page_size=stream_page_size, instance_index=instance_index,
+                                           filter_listings=filter_listings)
+            return None
+
+        if plan_output_location is not None:
+            with _open_plan_output(plan_output_location) as plan_output:
+                plans = create_clean_up_plans(configuration, tracker, dry_run=dry_run,
+                                              decision_listener=_combine_decision_listeners(
+                                                  JsonLinesDecisionWriter(plan_output), decision_listener),
+                                              manager_cache=manager_cache, instance_index=instance_index,
+                                              filter_listings=filter_listings)
+        else:
+            plans = create_clean_up_plans(configuration, tracker, dry_run=dry_run,
+                                          decision_listener=decision_listener, manager_cache=manager_cache,
+                                          instance_index=instance_index, filter_listings=filter_listings)
+        logging_configuration = configuration.general_configuration.logging_configuration
+        explained_plans, changes = plans, None
+        if decision_history is not None:
+            explained_plans, changes = decision_history.diff(plans, [
+                create_partition_key(clean_up_configuration.credentials[0])
+                for clean_up_configuration in configuration.clean_up_configurations])
+            _logger.info(f"Decisions since the previous run: {changes.unchanged} unchanged, {changes.changed} changed, "
+                         f"{changes.new} new, {changes.newly_deletable} newly deletable, {changes.gone} gone")
+        if _is_logged(_logger, logging.INFO):
+            write_human_explanation(explained_plans, _logger.info, dry_run=dry_run,
+                                    not_deleted_detail=logging_configuration.not_deleted_detail,
+                                    not_deleted_sample_size=logging_configuration.not_deleted_sample_size)
+        general_configuration = configuration.general_configuration
+        if shard_coordinator is not None:
+            plans = _filter_plans_in_shard(plans, shard_coordinator)
+        execute_plans(plans, general_configuration.max_simultaneous_deletes, general_configuration.delete_priority,
+                      general_configuration.max_deletes_per_run, delete_journal)
+        return changes
     except Exception as e:
         _logger.error(e)
         raise
 
 
-def run_periodically(configuration: Configuration, tracker: Tracker, dry_run: bool):
+def plan(configuration: Configuration, tracker: Tracker, plan_location: str):
+    """
+    Plans what to delete, writing the planned deletes to a plan file that can later be applied using `apply`.
+    :param configuration: cleaner configuration
+    :param tracker: OpenStack item history tracker
+    :param plan_location: location to write the plan file to, where "-" is stdout
+    """
+    with _open_plan_output(plan_location, append=False) as plan_output:
+        plans = create_clean_up_plans(configuration, tracker, dry_run=True,
+                                      decision_listener=PlanFileWriter(plan_output),
+                                      manager_cache=_create_manager_cache(configuration),
+                                      filter_listings=configuration.general_configuration.filter_listings)
+    if _is_logged(_logger, logging.INFO):
+        logging_configuration = configuration.general_configuration.logging_configuration
+        write_human_explanation(plans, _logger.info, dry_run=True,
+                                not_deleted_detail=logging_configuration.not_deleted_detail,
+                                not_deleted_sample_size=logging_configuration.not_deleted_sample_size)
+
+
+def apply(configuration: Configuration, plan_location: str, dry_run: bool):
+    """
+    Applies the deletes in the given plan file, written by `plan`, that are still valid.
+    :param configuration: cleaner configuration, which holds the credentials required to apply the deletes
+    :param plan_location: location of the plan file, where "-" is stdin
+    :param dry_run: whether to revalidate the plan without actually deleting anything
+    """
+    if plan_location == _STANDARD_OUT_LOCATION:
+        planned_deletes = read_plan_file(sys.stdin)
+    else:
+        with open(plan_location, "r") as plan_file:
+            planned_deletes = read_plan_file(plan_file)
+    _logger.info(f"Applying {len(planned_deletes)} planned delete(s) from {plan_location}")
+
+    plans = create_clean_up_plans_from_planned_deletes(planned_deletes, configuration, dry_run=dry_run,
+                                                       manager_cache=_create_manager_cache(configuration))
+    if _is_logged(_logger, logging.INFO):
+        write_human_explanation(plans, _logger.info, dry_run=dry_run)
+    general_configuration = configuration.general_configuration
+    execute_plans(plans, general_configuration.max_simultaneous_deletes, general_configuration.delete_priority,
+                  general_configuration.max_deletes_per_run)
+
+
+def resume_deletes(configuration: Configuration, delete_journal: DeleteJournal, manager_cache: ManagerCache=None,
+                   partitions: Collection[str]=None):
+    """
+    Resumes the deletes in the given journal that were not confirmed (e.g. as the cleaner died whilst making them).
+    :param configuration: cleaner configuration, which holds the credentials required to resume the deletes
+    :param delete_journal: journal of deletes
+    :param manager_cache: cache of managers to reuse
+    :param partitions: tracker partition keys of the tenants whose deletes are to be resumed (all if `None`)
+    """
+    try:
+        plans = create_clean_up_plans_from_delete_journal(delete_journal, configuration, manager_cache, partitions)
+        if len(plans) == 0:
+            return
+        _logger.info("Resuming deletes that were not confirmed")
+        if _is_logged(_logger, logging.INFO):
+            write_human_explanation(plans, _logger.info, dry_run=False)
+        general_configuration = configuration.general_configuration
+        execute_plans(plans, general_configuration.max_simultaneous_deletes, general_configuration.delete_priority,
+                      delete_journal=delete_journal)
+    except Exception as e:
+        _logger.error(e)
+        raise
+
+
+def compact_tracker(tracker: Tracker, delete_journal: DeleteJournal=None):
+    """
+    Compacts the given tracker's storage, along with the given delete journal.
+    :param tracker: OpenStack item history tracker
+    :param delete_journal: journal of deletes, which is stored alongside the tracker (not compacted if `None`)
+    """
+    _logger.info("Compacting tracker...")
+    try:
+        tracker.compact()
+        if delete_journal is not None:
+            delete_journal.compact()
+    except Exception as e:
+        _logger.error(e)
+        raise
+
+
+def _get_tenant_runs(configuration: Configuration) -> Dict[str, CleanUpConfiguration]:
+    """
+    Gets the clean-up configuration of each tenant that is to be run separately.
+    :param configuration: cleaner configuration
+    :return: map between the name of each tenant run and the tenant's clean-up configuration
+    """
+    return {create_partition_key(clean_up_configuration.credentials[0]): clean_up_configuration
+            for clean_up_configuration in configuration.clean_up_configurations}
+
+
+def _create_shard_coordinator(configuration_watcher: ConfigurationWatcher, tracker: Tracker) -> ShardCoordinator:
+    """
+    Creates a coordinator that shares the tenants in the latest configuration between the nodes that use the tracker's
+    storage.
+    :param configuration_watcher: watcher of the cleaner configuration
+    :param tracker: OpenStack item history tracker, whose storage holds the leases
+    :return: the created shard coordinator
+    :raises ValueError: if the tracker's storage cannot be shared between nodes
     """
-    Runs the cleaner periodically.
+    lease_store = tracker.create_lease_store()
+    if lease_store is None:
+        raise ValueError(f"Tenants can only be shared between nodes that use an SQL tracking database, not "
+                         f"{type(tracker).__name__}")
+    return ShardCoordinator(lease_store, configuration_watcher.configuration.general_configuration.lease_duration,
+                            lambda: _get_tenant_runs(configuration_watcher.configuration).keys())
+
+
+def _get_shard_configuration(configuration: Configuration, partitions: Collection[str]) -> Configuration:
+    """
+    Gets the configuration restricted to the tenants in a shard.
     :param configuration: cleaner configuration
+    :param partitions: tracker partition keys of the tenants in the shard (see `_get_tenant_runs`)
+    :return: the configuration of the shard
+    """
+    return Configuration(configuration.general_configuration, [
+        clean_up_configuration for name, clean_up_configuration in _get_tenant_runs(configuration).items()
+        if name in partitions])
+
+
+def _run_shard(configuration: Configuration, shard_coordinator: ShardCoordinator, tracker: Tracker, dry_run: bool,
+               plan_output_location: str=None, decision_history: DecisionHistory=None,
+               manager_cache: ManagerCache=None, decision_listener: DecisionListener=None,
+               delete_journal: DeleteJournal=None) -> Optional[DecisionChanges]:
+    """
+    Runs the cleaner on the tenants in this node's shard, after resuming the journalled deletes of those tenants (e.g.
+    as they have been taken over from a node that has gone).
+    :param configuration: cleaner configuration, of all tenants
+    :param shard_coordinator: coordinator of this node's shard
+    :param tracker: OpenStack item history tracker
+    :param dry_run: whether to run without actually deleting anything
+    :param plan_output_location: location to write each decision to as a JSON line
+    :param decision_history: the decisions made in the previous run, which are not explained again if unchanged
+    :param manager_cache: cache of managers to reuse between runs
+    :param decision_listener: called with each decision as it is made
+    :param delete_journal: journal to record the progress of deletes in (not journalled if `None`)
+    :return: how the decisions have changed since the previous run (see `run`), or `None` if this node does not hold
+    any tenants
+    """
+    partitions = shard_coordinator.get_owned()
+    if len(partitions) == 0:
+        _logger.info(f"Not running as node \"{shard_coordinator.node}\" does not hold any tenants")
+        return None
+    if delete_journal is not None:
+        resume_deletes(configuration, delete_journal, manager_cache, partitions)
+    # Instances of all tenants are indexed, so that images shared with tenants in other shards are not deleted whilst
+    # in use
+    instance_index = create_instance_index(configuration, manager_cache)
+    return run(_get_shard_configuration(configuration, partitions), tracker, dry_run, plan_output_location,
+               decision_history, manager_cache, instance_index, decision_listener, delete_journal, shard_coordinator)
+
+
+def _filter_plans_in_shard(plans: List[CleanUpPlan], shard_coordinator: ShardCoordinator) -> List[CleanUpPlan]:
+    """
+    Removes the deletes from the given plans that are in tenants that are no longer in this node's shard (e.g. as the
+    leases on them could not be renewed whilst planning), so another node that has taken them over does not clean
+    them up at the same time.
+    :param plans: the clean-up plans
+    :param shard_coordinator: coordinator of this node's shard
+    :return: the plans with only the deletes in tenants in the shard
+    """
+    partitions = shard_coordinator.get_owned()
+    return filter_plan_deletes(plans, lambda credentials: create_partition_key(credentials) in partitions)
+
+
+def _create_tenant_run(configuration_watcher: ConfigurationWatcher, name: str, tracker: Tracker, dry_run: bool,
+                       plan_output_location: str=None, manager_cache: ManagerCache=None,
+                       eligibility_scheduler: EligibilityScheduler=None, delete_journal: DeleteJournal=None,
+                       shard_coordinator: ShardCoordinator=None,
+                       instance_index_cache: InstanceIndexCache=None) -> Callable[[], RunStatistics]:
+    """
+    Creates a run of the cleaner for a single tenant, which measures the tenant's churn and quota usage. The latest
+    configuration of the tenant is used each time it is run.
+    :param configuration_watcher: watcher of the cleaner configuration
+    :param name: name of the tenant run (see `_get_tenant_runs`)
+    :param tracker: OpenStack item history tracker
+    :param dry_run: whether to run without actually deleting anything
+    :param plan_output_location: location to write each decision to as a JSON line
+    :param manager_cache: cache of managers to reuse between runs
+    :param eligibility_scheduler: scheduler of the revalidation of the items that the run keeps until they become
+    eligible for deletion (not scheduled if `None`)
+    :param delete_journal: journal to record the progress of deletes in (not journalled if `None`)
+    :param shard_coordinator: coordinator of this node's shard, where the run does nothing if the tenant is not in the
+    shard (run regardless if `None`)
+    :param instance_index_cache: cache of the index of the instances in all tenants, shared with the other tenant runs
+    (the instances of all tenants are listed for each run if `None`)
+    :return: the created run
+    """
+    decision_history = DecisionHistory()
+    number_of_runs = 0
+
+    def tenant_run() -> RunStatistics:
+        nonlocal number_of_runs
+        configuration = configuration_watcher.configuration
+        clean_up_configuration = _get_tenant_runs(configuration).get(name)
+        if clean_up_configuration is None:
+            return RunStatistics()
+        if shard_coordinator is not None:
+            if not shard_coordinator.owns(name):
+                _logger.debug(f"Not running \"{name}\" as it is held by another node")
+                return RunStatistics()
+            if delete_journal is not None:
+                resume_deletes(configuration, delete_journal, manager_cache, {name})
+        number_of_runs += 1
+        if manager_cache is not None:
+            # Listings may be shared between tenant runs (e.g. of all tenants, with admin credentials), so they are
+            # discarded at most once per minimum run period, rather than for every tenant run
+            manager_cache.refresh(configuration.general_configuration.min_run_period)
+        tenant_configuration = Configuration(configuration.general_configuration, [clean_up_configuration])
+        # Instances of all tenants are indexed, so that images shared with other tenants are not deleted whilst in use
+        instance_index = instance_index_cache.get(configuration, {name}, manager_cache) \
+            if instance_index_cache is not None else create_instance_index(configuration, manager_cache)
+        changes = run(tenant_configuration, tracker, dry_run, plan_output_location, decision_history, manager_cache,
+                      instance_index, _create_eligibility_listener(eligibility_scheduler), delete_journal,
+                      shard_coordinator)
+        if eligibility_scheduler is not None:
+            eligibility_scheduler.reschedule()
+        churn = None
+        # Changes are not known if the run was streamed
+        if number_of_runs > 1 and changes is not None:
+            number_of_items = changes.unchanged + changes.changed + changes.newly_deletable + changes.new + changes.gone
+            churn = (changes.new + changes.gone) / max(number_of_items, 1)
+        try:
+            quota_usage = get_compute_quota_usage(clean_up_configuration.credentials[0], manager_cache)
+        except Exception as e:
+            _logger.warning(f"Could not get quota usage: {e}")
+            quota_usage = None
+        return RunStatistics(churn=churn, quota_usage=quota_usage)
+
+    return tenant_run
+
+
+def _get_notification_partitions(configuration: Configuration,
+                                 previous_partitions: Dict[str, str]=None) -> Dict[str, str]:
+    """
+    Gets the map between the identifiers of the tenants in the given configuration and their tracker partition keys.
+    :param configuration: cleaner configuration
+    :param previous_partitions: map got for a previous configuration, whose tenant identifiers are reused rather than
+    got from OpenStack again
+    :return: map between tenant identifiers and tracker partition keys
+    """
+    tenant_ids = {partition: tenant_id for tenant_id, partition in (previous_partitions or {}).items()}
+    partitions = {}
+    for clean_up_configuration in configuration.clean_up_configurations:
+        credentials = clean_up_configuration.credentials[0]
+        partition = create_partition_key(credentials)
+        tenant_id = tenant_ids[partition] if partition in tenant_ids else get_tenant_id(credentials)
+        partitions[tenant_id] = partition
+    return partitions
+
+
+def _create_notification_consumer(configuration: Configuration, tracker: Tracker) -> NotificationConsumer:
+    """
+    Creates a consumer of the OpenStack notifications about the tenants in the given configuration.
+    :param configuration: cleaner configuration, which must have notifications configured
+    :param tracker: OpenStack item history tracker, which the consumer is to update
+    :return: the created consumer
+    """
+    notifications_configuration = configuration.general_configuration.notifications_configuration
+    source = AmqpNotificationSource(notifications_configuration.url, notifications_configuration.exchanges,
+                                    notifications_configuration.topic)
+    return NotificationConsumer(source, tracker, _get_notification_partitions(configuration))
+
+
+def _create_quota_watcher(configuration_watcher: ConfigurationWatcher, trigger: Callable[[str], None],
+                          manager_cache: ManagerCache, shard_coordinator: ShardCoordinator=None) -> QuotaWatcher:
+    """
+    Creates a watcher of the compute quota usage of the tenants in the latest configuration.
+    :param configuration_watcher: watcher of the cleaner configuration
+    :param trigger: triggers the tenant run with the given name (see `_get_tenant_runs`)
+    :param manager_cache: cache of managers, whose authenticated clients are reused to get quota usage
+    :param shard_coordinator: coordinator of this node's shard, where the quota usage of tenants in other shards is not
+    checked (all are checked if `None`)
+    :return: the created quota watcher
+    """
+    def get_quota_usage(name: str) -> Optional[float]:
+        clean_up_configuration = _get_tenant_runs(configuration_watcher.configuration).get(name)
+        if clean_up_configuration is None or (shard_coordinator is not None and not shard_coordinator.owns(name)):
+            return None
+        try:
+            return get_compute_quota_usage(clean_up_configuration.credentials[0], manager_cache)
+        except Exception as e:
+            _logger.warning(f"Could not get quota usage of \"{name}\": {e}")
+            return None
+
+    general_configuration = configuration_watcher.configuration.general_configuration
+    return QuotaWatcher(get_quota_usage, trigger, general_configuration.min_run_period,
+                        general_configuration.quota_trigger_usage)
+
+
+def _create_eligibility_listener(eligibility_scheduler: Optional[EligibilityScheduler]) -> Optional[DecisionListener]:
+    """
+    Creates a listener that adds each item that is kept until a known time to the given eligibility scheduler, and
+    removes each item that is not.
+    :param eligibility_scheduler: the eligibility scheduler
+    :return: the created listener (`None` if the eligibility scheduler is `None`)
+    """
+    if eligibility_scheduler is None:
+        return None
+
+    def decision_listener(decision: ItemDecision):
+        credentials = decision.credentials
+        eligibility_scheduler.add(
+            (credentials.auth_url, credentials.tenant, credentials.username, type(decision.item).__name__,
+             decision.item.identifier), decision.eligible_at if not decision.delete else None, decision)
+
+    return decision_listener
+
+
+def _create_eligibility_scheduler(configuration_watcher: ConfigurationWatcher, scheduler: "BaseScheduler",
+                                  tracker: Tracker, dry_run: bool, manager_cache: ManagerCache=None,
+                                  delete_journal: DeleteJournal=None,
+                                  shard_coordinator: ShardCoordinator=None) -> EligibilityScheduler:
+    """
+    Creates a scheduler that revalidates items when they become eligible for deletion, deleting them if they still are,
+    using the latest configuration.
+    :param configuration_watcher: watcher of the cleaner configuration
+    :param scheduler: the underlying scheduler
+    :param tracker: OpenStack item history tracker
+    :param dry_run: whether to revalidate without actually deleting anything
+    :param manager_cache: cache of managers, whose authenticated clients are reused to fetch the items
+    :param delete_journal: journal to record the progress of deletes in (not journalled if `None`)
+    :param shard_coordinator: coordinator of this node's shard, where items in tenants that have since moved to other
+    shards are not revalidated (all are revalidated if `None`)
+    :return: the created eligibility scheduler
+    """
+    eligibility_scheduler: Optional[EligibilityScheduler] = None
+
+    def revalidate(decisions: List[ItemDecision]):
+        configuration = configuration_watcher.configuration
+        if shard_coordinator is not None:
+            partitions = shard_coordinator.get_owned()
+            decisions = [decision for decision in decisions if create_partition_key(decision.credentials) in partitions]
+        try:
+            if manager_cache is not None:
+                manager_cache.refresh(configuration.general_configuration.min_run_period)
+            # Items that are still kept until a known time (e.g. as they have been replaced) are scheduled again
+            plans = create_clean_up_plans_for_eligible_items(
+                decisions, configuration, tracker, dry_run=dry_run,
+                decision_listener=_create_eligibility_listener(eligibility_scheduler), manager_cache=manager_cache)
+            if _is_logged(_logger, logging.INFO):
+                write_human_explanation(plans, _logger.info, dry_run=dry_run)
+            general_configuration = configuration.general_configuration
+            if shard_coordinator is not None:
+                plans = _filter_plans_in_shard(plans, shard_coordinator)
+            execute_plans(plans, general_configuration.max_simultaneous_deletes,
+                          general_configuration.delete_priority, general_configuration.max_deletes_per_run,
+                          delete_journal)
+        except Exception as e:
+            _logger.error(e)
+            raise
+
+    eligibility_scheduler = EligibilityScheduler(scheduler, revalidate)
+    return eligibility_scheduler
+
+
+def run_periodically(configuration_watcher: ConfigurationWatcher, tracker: Tracker, dry_run: bool,
+                     plan_output_location: str=None, delete_journal: DeleteJournal=None,
+                     shard_coordinator: ShardCoordinator=None):
+    """
+    Runs the cleaner periodically, along with compaction of the tracker. Jobs are executed one at a time so that
+    compaction does not contend with a run for the tracker's storage. Only the decisions that have changed since the
+    previous run are explained. If the minimum and maximum run periods differ, each tenant is run separately, with how
+    often it is run adapted to its churn and quota usage. If quota checks are configured, a tenant is also run as soon
+    as its compute quota usage crosses the trigger threshold. If notifications are configured, the tracker is also
+    updated as items are created and deleted. If deleting when eligible is configured, items that are kept because of
+    their age are revalidated, and deleted if still eligible, as soon as they are old enough, without waiting for the
+    next run. If a shard coordinator is given, only the tenants in this node's shard are run. Changes to the
+    configuration's clean-up entries and run period are applied between runs, and to the tenants whose notifications
+    are handled as soon as the configuration is reloaded.
+    :param configuration_watcher: watcher of the cleaner configuration
     :param tracker: OpenStack item history tracker
     :param dry_run: whether to run without actually deleting anything
+    :param plan_output_location: location to write each decision to as a JSON line
+    :param delete_journal: journal to record the progress of deletes in (not journalled if `None`)
+    :param shard_coordinator: coordinator of the shard of tenants that this node is to run (all are run if `None`)
     """
-    scheduler = BlockingScheduler()
-    scheduler.add_job(run, args=(configuration, tracker, dry_run),
-                      trigger="interval", seconds=configuration.general_configuration.run_period.total_seconds(),
-                      coalesce=True, max_instances=1, next_run_time=datetime.now())
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    general_configuration = configuration_watcher.configuration.general_configuration
+    manager_cache = _create_manager_cache(configuration_watcher.configuration)
+    # The instances of the tenants that are not being run are listed about once per minimum run period, rather than
+    # for every tenant run
+    instance_index_cache = InstanceIndexCache(general_configuration.min_run_period)
+    scheduler = BlockingScheduler(executors={"default": ThreadPoolExecutor(1)})
+    run_scheduler: Optional[AdaptiveRunScheduler] = None
+    eligibility_scheduler: Optional[EligibilityScheduler] = None
+    if general_configuration.delete_when_eligible:
+        eligibility_scheduler = _create_eligibility_scheduler(
+            configuration_watcher, scheduler, tracker, dry_run, manager_cache, delete_journal, shard_coordinator)
+
+    if general_configuration.min_run_period == general_configuration.max_run_period:
+        decision_history = DecisionHistory()
+
+        def periodic_run():
+            manager_cache.refresh()
+            decision_listener = _create_eligibility_listener(eligibility_scheduler)
+            if shard_coordinator is None:
+                run(configuration_watcher.configuration, tracker, dry_run, plan_output_location, decision_history,
+                    manager_cache, decision_listener=decision_listener, delete_journal=delete_journal)
+            else:
+                _run_shard(configuration_watcher.configuration, shard_coordinator, tracker, dry_run,
+                           plan_output_location, decision_history, manager_cache, decision_listener, delete_journal)
+            if eligibility_scheduler is not None:
+                eligibility_scheduler.reschedule()
+
+        scheduler.add_job(periodic_run, id=_RUN_JOB_ID, trigger="interval",
+                          seconds=general_configuration.run_period.total_seconds(), coalesce=True, max_instances=1,
+                          next_run_time=datetime.now())
+    else:
+        run_scheduler = AdaptiveRunScheduler(scheduler, general_configuration.run_period,
+                                             general_configuration.min_run_period, general_configuration.max_run_period)
+        for name in _get_tenant_runs(configuration_watcher.configuration).keys():
+            run_scheduler.add(name, _create_tenant_run(
+                configuration_watcher, name, tracker, dry_run, plan_output_location, manager_cache,
+                eligibility_scheduler, delete_journal, shard_coordinator, instance_index_cache))
+
+    notification_consumer: Optional[NotificationConsumer] = None
+    if general_configuration.notifications_configuration is not None:
+        notification_consumer = _create_notification_consumer(configuration_watcher.configuration, tracker)
+
+    def reload_configuration():
+        run_period = configuration_watcher.configuration.general_configuration.run_period
+        if not configuration_watcher.reload():
+            return
+        configuration = configuration_watcher.configuration
+        manager_cache.retain(credentials for clean_up_configuration in configuration.clean_up_configurations
+                             for credentials in clean_up_configuration.credentials)
+        if notification_consumer is not None:
+            # Replaced rather than updated, so the consumer's thread always sees a complete map
+            notification_consumer.partitions = _get_notification_partitions(
+                configuration, notification_consumer.partitions)
+        if run_scheduler is None:
+            if configuration.general_configuration.run_period != run_period:
+                scheduler.reschedule_job(_RUN_JOB_ID, trigger="interval",
+                                         seconds=configuration.general_configuration.run_period.total_seconds())
+        else:
+            tenant_runs = _get_tenant_runs(configuration).keys()
+            for name in run_scheduler.get_run_periods().keys() - tenant_runs:
+                run_scheduler.remove(name)
+            for name in tenant_runs - run_scheduler.get_run_periods().keys():
+                run_scheduler.add(name, _create_tenant_run(
+                    configuration_watcher, name, tracker, dry_run, plan_output_location, manager_cache,
+                    eligibility_scheduler, delete_journal, shard_coordinator, instance_index_cache))
+
+    if general_configuration.quota_check_period is not None:
+        if run_scheduler is not None:
+            trigger = run_scheduler.run_now
+        else:
+            triggered_runs: Dict[str, Callable[[], RunStatistics]] = {}
+
+            def trigger(name: str):
+                if name not in triggered_runs:
+                    triggered_runs[name] = _create_tenant_run(
+                        configuration_watcher, name, tracker, dry_run, plan_output_location, manager_cache,
+                        eligibility_scheduler, delete_journal, shard_coordinator, instance_index_cache)
+                scheduler.add_job(triggered_runs[name], id=f"{_QUOTA_TRIGGERED_RUN_JOB_ID_PREFIX}{name}",
+                                  replace_existing=True)
+
+        quota_watcher = _create_quota_watcher(configuration_watcher, trigger, manager_cache, shard_coordinator)
+        scheduler.add_job(lambda: quota_watcher.check(_get_tenant_runs(configuration_watcher.configuration).keys()),
+                          trigger="interval", seconds=general_configuration.quota_check_period.total_seconds(),
+                          coalesce=True, max_instances=1)
+    if notification_consumer is not None:
+        notification_consumer.start()
+    scheduler.add_job(reload_configuration, trigger="interval", seconds=CONFIGURATION_CHECK_PERIOD.total_seconds(),
+                      coalesce=True, max_instances=1)
+    scheduler.add_job(compact_tracker, args=(tracker, delete_journal), trigger="interval",
+                      seconds=general_configuration.tracking_compaction_period.total_seconds(),
+                      coalesce=True, max_instances=1)
     scheduler.start()
 
 
@@ -110,22 +784,51 @@ def main():
     """
     cli_configuration = _parse_arguments(sys.argv[1:])
     _logger.debug(f"CLI configuration: {cli_configuration}")
-    configuration = parse_configuration(cli_configuration.configuration_location)
+    configuration_watcher = ConfigurationWatcher(cli_configuration.configuration_location)
+    configuration = configuration_watcher.configuration
     _configure_logging(configuration.general_configuration.logging_configuration)
     _logger.debug(f"Program configuration: {configuration}")
 
-    tracking_database = configuration.general_configuration.tracking_database
-    if not os.path.isabs(tracking_database):
-        tracking_database = get_absolute_path_relative_to(tracking_database, cli_configuration.configuration_location)
-    if not os.path.exists(tracking_database):
-        _logger.info(f"Creating tracking database: {tracking_database}")
-        engine = create_engine(f"sqlite:///{tracking_database}")
-        SqlAlchemyModel.metadata.create_all(bind=engine)
+    if cli_configuration.command == APPLY_COMMAND:
+        apply(configuration, cli_configuration.plan_location, cli_configuration.dry_run)
+        return
 
-    tracker = SqlTracker(f"sqlite:///{tracking_database}")
+    tracker = _create_tracker(configuration.general_configuration.tracking_database,
+                              cli_configuration.configuration_location,
+                              configuration.general_configuration.tracking_grace_period)
+
+    if cli_configuration.command == PLAN_COMMAND:
+        plan(configuration, tracker, cli_configuration.plan_location)
+        return
+
+    shard_coordinator = None
+    if configuration.general_configuration.lease_duration is not None:
+        shard_coordinator = _create_shard_coordinator(configuration_watcher, tracker)
+        shard_coordinator.start()
+        _logger.info(f"Sharing tenants with other nodes as \"{shard_coordinator.node}\"")
+
+    try:
+        delete_journal = None
+        if not cli_configuration.dry_run:
+            delete_journal = tracker.create_delete_journal()
+            # When sharing tenants, the deletes of each tenant are resumed when it is run by the node that holds it
+            if delete_journal is not None and shard_coordinator is None:
+                resume_deletes(configuration, delete_journal)
 
-    execute = run if cli_configuration.run_once else run_periodically
-    execute(configuration, tracker, cli_configuration.dry_run)
+        if cli_configuration.run_once:
+            if shard_coordinator is None:
+                run(configuration, tracker, cli_configuration.dry_run, cli_configuration.plan_output_location,
+                    manager_cache=_create_manager_cache(configuration), delete_journal=delete_journal)
+            else:
+                _run_shard(configuration, shard_coordinator, tracker, cli_configuration.dry_run,
+                           cli_configuration.plan_output_location, manager_cache=_create_manager_cache(configuration),
+                           delete_journal=delete_journal)
+        else:
+            run_periodically(configuration_watcher, tracker, cli_configuration.dry_run,
+                             cli_configuration.plan_output_location, delete_journal, shard_coordinator)
+    finally:
+        if shard_coordinator is not None:
+            shard_coordinator.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+from abc import ABCMeta, abstractmethod
+from datetime import datetime, timedelta
+from enum import Enum, unique
+
+from typing import Iterable, List, Collection, Tuple
+
+from openstacktenantcleaner.common import create_item_fingerprint
+from openstacktenantcleaner.external.hgicommon.models import Model
+from openstacktenantcleaner.models import PlannedDelete, OpenstackItem, OpenstackCredentials, OpenstackIdentifier
+
+# Key of a journal entry: auth URL, tenant and username of the credentials used to delete the item, and the item's type
+# and identifier
+JournalKey = Tuple[str, str, str, str, OpenstackIdentifier]
+
+# Deletes that OpenStack carries on with after accepting them (e.g. of instances) are assumed to still be in progress
+# for this long after they were issued, so are not issued again
+IN_FLIGHT_EXPIRY = timedelta(hours=1)
+
+
+@unique
+class DeleteState(Enum):
+    """
+    State of a journalled delete.
+    """
+    # The item is to be deleted but the delete has not been sent to OpenStack
+    INTENT = "intent"
+    # The delete may have been sent to OpenStack
+    ISSUED = "issued"
+    # OpenStack has accepted the delete
+    CONFIRMED = "confirmed"
+
+
+class JournalEntry(Model):
+    """
+    Entry in a delete journal.
+    """
+    def __init__(self, planned_delete: PlannedDelete=None, state: DeleteState=None, updated: datetime=None):
+        """
+        Constructor.
+        :param planned_delete: the delete
+        :param state: the state that the delete has reached
+        :param updated: when the delete reached the state
+        """
+        self.planned_delete = planned_delete
+        self.state = state
+        self.updated = updated
+
+
+def create_planned_delete(item: OpenstackItem, credentials: OpenstackCredentials) -> PlannedDelete:
+    """
+    Creates the planned delete of the given item, with the given credentials.
+    :param item: the item to delete
+    :param credentials: the credentials to delete the item with
+    :return: the planned delete
+    """
+    return PlannedDelete(auth_url=credentials.auth_url, tenant=credentials.tenant, username=credentials.username,
+                         item_type=type(item).__name__, identifier=item.identifier, name=item.name,
+                         fingerprint=create_item_fingerprint(item))
+
+
+def get_journal_key(planned_delete: PlannedDelete) -> JournalKey:
+    """
+    Gets the key of the journal entry for the given planned delete.
+    :param planned_delete: the planned delete
+    :return: the key
+    """
+    return planned_delete.auth_url, planned_delete.tenant, planned_delete.username, planned_delete.item_type, \
+        planned_delete.identifier
+
+
+class DeleteJournal(metaclass=ABCMeta):
+    """
+    Write-ahead journal of deletes, which records the progress of each delete (intent, issued then confirmed) so that
+    deletes that were not confirmed (e.g. as the process died) can be resumed. Each call records its entries in a
+    single durable write, so callers should batch entries.
+    """
+    @abstractmethod
+    def _write(self, entries: Collection[JournalEntry]):
+        """
+        Durably writes the given entries, replacing any entries with the same keys.
+        :param entries: the entries to write
+        """
+
+    @abstractmethod
+    def forget(self, planned_deletes: Iterable[PlannedDelete]):
+        """
+        Removes the entries of the given deletes (e.g. as they failed or are no longer valid).
+        :param planned_deletes: the deletes
+        """
+
+    @abstractmethod
+    def get_unconfirmed(self) -> List[JournalEntry]:
+        """
+        Gets the entries of the deletes that have not been confirmed.
+        :return: the unconfirmed entries
+        """
+
+    @abstractmethod
+    def compact(self):
+        """
+        Purges the entries of confirmed deletes.
+        """
+
+    def record(self, planned_deletes: Iterable[PlannedDelete], state: DeleteState):
+        """
+        Records that the given deletes have reached the given state.
+        :param planned_deletes: the deletes
+        :param state: the state that the deletes have reached
+        """
+        now = datetime.now()
+        entries = [JournalEntry(planned_delete, state, now) for planned_delete in planned_deletes]
+        if len(entries) > 0:
+            self._write(entries)
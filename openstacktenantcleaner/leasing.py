@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from abc import ABCMeta, abstractmethod
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from typing import Callable, Collection, Dict, Optional, Set
+
+# Number of times that each node renews its leases within the lease duration, so that a lease survives a missed renewal
+HEARTBEATS_PER_LEASE = 3
+
+_logger = logging.getLogger(__name__)
+
+
+def create_node_name() -> str:
+    """
+    Creates a name for this node that is unique amongst all the nodes that have ever run the cleaner.
+    :return: the node name
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseStore(metaclass=ABCMeta):
+    """
+    Store, shared by all of the nodes running the cleaner, of which nodes are alive and of the time-bounded leases that
+    nodes hold on tenants. Leases are only taken if they are free or have expired, so a tenant is held by at most one
+    node at a time. Expiry times set by one node are compared with the clocks of other nodes, so the clocks of nodes
+    must be synchronised to well within the lease duration.
+    """
+    @abstractmethod
+    def heartbeat(self, node: str, now: datetime, expires: datetime):
+        """
+        Records that the given node is alive until the given time, forgetting nodes that are no longer alive.
+        :param node: name of the node
+        :param now: the current time
+        :param expires: when the node is to be considered gone if it does not heartbeat again
+        """
+
+    @abstractmethod
+    def get_live_nodes(self, now: datetime) -> Set[str]:
+        """
+        Gets the nodes that are alive.
+        :param now: the current time
+        :return: names of the live nodes
+        """
+
+    @abstractmethod
+    def get_owners(self, now: datetime) -> Dict[str, str]:
+        """
+        Gets the owner of each tenant with an unexpired lease.
+        :param now: the current time
+        :return: map between leased tenants and the names of the nodes that hold them
+        """
+
+    @abstractmethod
+    def acquire(self, tenant: str, node: str, now: datetime, expires: datetime) -> bool:
+        """
+        Atomically takes the lease on the given tenant for the given node, if the lease is free, has expired or is
+        already held by the node.
+        :param tenant: the tenant
+        :param node: name of the node
+        :param now: the current time
+        :param expires: when the lease is to expire
+        :return: whether the node now holds the lease
+        """
+
+    @abstractmethod
+    def renew(self, tenants: Collection[str], node: str, now: datetime, expires: datetime) -> Set[str]:
+        """
+        Extends the unexpired leases on the given tenants that are held by the given node.
+        :param tenants: the tenants
+        :param node: name of the node
+        :param now: the current time
+        :param expires: when the leases are to expire
+        :return: the tenants whose leases were renewed
+        """
+
+    @abstractmethod
+    def release(self, tenants: Collection[str], node: str):
+        """
+        Releases the leases on the given tenants that are held by the given node.
+        :param tenants: the tenants
+        :param node: name of the node
+        """
+
+    @abstractmethod
+    def leave(self, node: str):
+        """
+        Removes the given node, releasing all of its leases.
+        :param node: name of the node
+        """
+
+
+class ShardCoordinator:
+    """
+    Shares tenants between the nodes running the cleaner, so that each node only cleans up its own shard of them. On
+    each heartbeat, a node renews the leases on its tenants, releases any beyond its fair share (e.g. as another node
+    has joined) and takes free leases up to its fair share (e.g. as a node has gone and its leases have expired). Each
+    node prefers the tenants that rank highest for it by rendezvous hashing, which spreads the nodes' preferences and
+    keeps assignments stable.
+    """
+    def __init__(self, lease_store: LeaseStore, lease_duration: timedelta, get_tenants: Callable[[], Collection[str]],
+                 node: str=None):
+        """
+        Constructor.
+        :param lease_store: store of the leases, shared with the other nodes
+        :param lease_duration: how long each lease lasts if it is not renewed
+        :param get_tenants: gets the tenants that are to be shared between the nodes
+        :param node: name of this node (a unique name is created if `None`)
+        """
+        self.lease_store = lease_store
+        self.lease_duration = lease_duration
+        self.get_tenants = get_tenants
+        self.node = node if node is not None else create_node_name()
+        self._owned: Set[str] = set()
+        self._valid_until = datetime.min
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def owns(self, tenant: str) -> bool:
+        """
+        Gets whether this node holds the lease on the given tenant.
+        :param tenant: the tenant
+        :return: whether the tenant is in this node's shard
+        """
+        return tenant in self.get_owned()
+
+    def get_owned(self) -> Set[str]:
+        """
+        Gets the tenants in this node's shard. Leases that may have expired, as they could not be renewed in time, are
+        not included.
+        :return: the tenants that this node holds leases on
+        """
+        with self._lock:
+            return set(self._owned) if datetime.now() < self._valid_until else set()
+
+    def heartbeat(self):
+        """
+        Renews this node's leases and rebalances the tenants.
+        """
+        # Leases are considered valid until a lease duration after the heartbeat started, which is no later than when
+        # the store considers them to expire
+        now = datetime.now()
+        expires = now + self.lease_duration
+        tenants = set(self.get_tenants())
+        with self._lock:
+            previously_owned = set(self._owned)
+
+        self.lease_store.heartbeat(self.node, now, expires)
+        nodes = sorted(self.lease_store.get_live_nodes(now) | {self.node})
+        # Any remainder is shared out one each to the first nodes, by name, so that shares differ by at most one
+        fair_share = len(tenants) // len(nodes) + (1 if nodes.index(self.node) < len(tenants) % len(nodes) else 0)
+        ranked = sorted(tenants, key=self._get_rank, reverse=True)
+
+        owned = self.lease_store.renew(previously_owned, self.node, now, expires) & tenants
+        if len(owned) > fair_share:
+            owned = set([tenant for tenant in ranked if tenant in owned][:fair_share])
+        self.lease_store.release(previously_owned - owned, self.node)
+        if len(owned) < fair_share:
+            leased = self.lease_store.get_owners(now).keys()
+            for tenant in ranked:
+                if len(owned) >= fair_share:
+                    break
+                if tenant not in owned and tenant not in leased \
+                        and self.lease_store.acquire(tenant, self.node, now, expires):
+                    owned.add(tenant)
+
+        if owned != previously_owned:
+            _logger.info(f"Node \"{self.node}\" ({len(nodes)} live) now holds {len(owned)} of {len(tenants)} "
+                         f"tenant(s): gained {sorted(owned - previously_owned)}, lost "
+                         f"{sorted(previously_owned - owned)}")
+        with self._lock:
+            self._owned = owned
+            self._valid_until = expires
+
+    def start(self):
+        """
+        Acquires this node's shard, then keeps renewing its leases in a background thread.
+        """
+        self.heartbeat()
+        self._stop.clear()
+        self._thread = Thread(target=self._heartbeat_periodically, name="shard-coordinator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops renewing leases and leaves, releasing this node's shard so that other nodes can take it over straight
+        away.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._owned = set()
+        self.lease_store.leave(self.node)
+
+    def _heartbeat_periodically(self):
+        """
+        Heartbeats until stopped, logging rather than propagating errors.
+        """
+        period = self.lease_duration / HEARTBEATS_PER_LEASE
+        while not self._stop.wait(period.total_seconds()):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                _logger.error(f"Could not renew leases: {e}")
+
+    def _get_rank(self, tenant: str) -> int:
+        """
+        Gets how strongly this node prefers to hold the given tenant.
+        :param tenant: the tenant
+        :return: rank of the tenant for this node
+        """
+        return int.from_bytes(hashlib.sha1(f"{self.node}#{tenant}".encode()).digest()[:8], "big")
@@ -1,26 +1,89 @@
 from abc import ABCMeta, abstractmethod
+from datetime import datetime, timedelta
+from threading import Lock
 
-from dateutil.parser import parse as parse_datetime
-from glanceclient.client import Client as GlanceClient
-from keystoneclient.v2_0.client import Client as KeystoneClient
-from novaclient.client import Client as NovaClient
-from novaclient.exceptions import ClientException
-from novaclient.v2.images import Image
-from novaclient.v2.keypairs import Keypair
-from novaclient.v2.servers import Server
-from typing import TypeVar, Generic, Set, Iterable, Type
+from typing import TypeVar, Generic, Set, Iterable, Type, Dict, Tuple, Iterator, List, Optional, Collection, \
+    Callable, TYPE_CHECKING
 
+from openstacktenantcleaner.common import chunk
 from openstacktenantcleaner.models import OpenstackCredentials, OpenstackItem, OpenstackKeypair, OpenstackInstance, \
-    OpenstackImage, OpenstackIdentifier
+    OpenstackImage, OpenstackIdentifier, ListingFilter
+
+# The OpenStack client libraries are slow to import so are only imported when a manager that requires them is created
+if TYPE_CHECKING:
+    from glanceclient.v2.client import Client as GlanceClient
+    from keystoneclient.v2_0.client import Client as KeystoneClient
+    from novaclient.client import Client as NovaClient
+    from novaclient.v2.images import Image
+    from novaclient.v2.keypairs import Keypair
+    from novaclient.v2.servers import Server
 
 Managed = TypeVar("Managed", bound=OpenstackItem)
 RawModel = TypeVar("RawModel")
 
+DEFAULT_PAGE_SIZE = 1000
+
+# Maximum number of identifiers in each Glance "in" filter, which keeps the request's URL within the usual limits
+_MAX_GLANCE_FILTER_IDENTIFIERS = 100
+
+
+def _create_nova_client(openstack_credentials: OpenstackCredentials) -> "NovaClient":
+    """
+    Creates a Nova client for the given credentials.
+    :param openstack_credentials: the OpenStack credentials
+    :return: the created client
+    """
+    from novaclient.client import Client as NovaClient
+    return NovaClient(_NovaManager.NOVA_VERSION, openstack_credentials.username, openstack_credentials.password,
+                      project_name=openstack_credentials.tenant, auth_url=openstack_credentials.auth_url)
+
+
+def _create_keystone_client(openstack_credentials: OpenstackCredentials) -> "KeystoneClient":
+    """
+    Creates a Keystone client for the given credentials.
+    :param openstack_credentials: the OpenStack credentials
+    :return: the created client
+    """
+    from keystoneclient.v2_0.client import Client as KeystoneClient
+    return KeystoneClient(
+        auth_url=openstack_credentials.auth_url, username=openstack_credentials.username,
+        password=openstack_credentials.password, tenant_name=openstack_credentials.tenant)
+
+
+def _parse_datetime(value: str) -> datetime:
+    """
+    Parses the given OpenStack timestamp.
+    :param value: the timestamp
+    :return: the parsed timestamp
+    """
+    from dateutil.parser import parse
+    return parse(value)
+
+
+def _create_glance_filters(listing_filter: ListingFilter) -> Dict[str, str]:
+    """
+    Creates the Glance (v2) image listing filters equivalent to the given listing filter.
+    :param listing_filter: the listing filter
+    :return: the Glance filters
+    """
+    filters: Dict[str, str] = {}
+    if listing_filter.older_than is not None:
+        created_before = datetime.utcnow() - listing_filter.older_than
+        filters["created_at"] = f"lt:{created_before.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    if listing_filter.protected is not None:
+        filters["protected"] = str(listing_filter.protected).lower()
+    return filters
+
 
 class Manager(Generic[Managed, RawModel], metaclass=ABCMeta):
     """
     Manager for OpenStack items.
     """
+    # Whether OpenStack applies listing filters given to the manager (otherwise they are ignored)
+    FILTERS_LISTINGS = False
+    # Whether OpenStack carries on deleting an item after accepting its delete (otherwise the item has been deleted)
+    DELETES_ASYNCHRONOUSLY = False
+
     @property
     @abstractmethod
     def item_type(self) -> Type[OpenstackItem]:
@@ -75,16 +138,77 @@ class Manager(Generic[Managed, RawModel], metaclass=ABCMeta):
         item = self._get_by_id_raw(identifier)
         return self._convert_raw(item)
 
-    def get_all(self) -> Set[Managed]:
+    def get_by_ids(self, identifiers: Collection[OpenstackIdentifier]) -> Dict[OpenstackIdentifier, Managed]:
+        """
+        Gets the managed OpenStack items that have the given identifiers, using one listing rather than a request for
+        each item.
+        :param identifiers: the items' identifiers
+        :return: map between the identifier of each of the items that exists and the item
+        """
+        identifiers = set(identifiers)
+        items = (self._convert_raw(item) for item in self._get_by_ids_raw(identifiers))
+        return {item.identifier: item for item in items if item.identifier in identifiers}
+
+    def get_all(self, listing_filter: ListingFilter=None) -> Set[Managed]:
         """
         Gets all of the OpenStack items of the managed type.
+        :param listing_filter: filter that OpenStack may apply to the listing, if the manager supports it (items that
+        do not pass the filter may still be returned)
         :return: the OpenStack items
         """
         models: Set[Managed] = set()
-        for item in self._get_all_raw():
+        for item in self._get_all_raw() if listing_filter is None else self._get_filtered_raw(listing_filter):
             models.add(self._convert_raw(item))
         return models
 
+    def iterate_all(self, page_size: int=DEFAULT_PAGE_SIZE, listing_filter: ListingFilter=None) \
+            -> Iterator[List[Managed]]:
+        """
+        Iterates over all of the OpenStack items of the managed type, page by page, so that they do not all have to be
+        held in memory. Each page is listed before the previous page is returned, so that deleting the items in a
+        returned page does not invalidate the listing.
+        :param page_size: the maximum number of items in each page
+        :param listing_filter: filter that OpenStack may apply to the listing, if the manager supports it (items that
+        do not pass the filter may still be returned)
+        :return: iterator of the pages of OpenStack items
+        """
+        previous_page = None
+        for raw_page in chunk(self._iterate_all_raw(page_size, listing_filter), page_size):
+            page = [self._convert_raw(item) for item in raw_page]
+            if previous_page is not None:
+                yield previous_page
+            previous_page = page
+        if previous_page is not None:
+            yield previous_page
+
+    def _get_filtered_raw(self, listing_filter: ListingFilter) -> Iterable[RawModel]:
+        """
+        Gets raw models of the OpenStack items of the type this manager manages, with the given filter applied by
+        OpenStack where it is supported. This implementation does not filter.
+        :param listing_filter: the filter to apply
+        :return: the OpenStack items that pass the filter (and possibly others)
+        """
+        return self._get_all_raw()
+
+    def _get_by_ids_raw(self, identifiers: Collection[OpenstackIdentifier]) -> Iterable[RawModel]:
+        """
+        Gets raw models of the OpenStack items with the given identifiers, where OpenStack supports filtering a listing
+        by identifier. This implementation lists all of the items.
+        :param identifiers: the items' identifiers
+        :return: the OpenStack items with the given identifiers (and possibly others)
+        """
+        return self._get_all_raw()
+
+    def _iterate_all_raw(self, page_size: int, listing_filter: ListingFilter=None) -> Iterable[RawModel]:
+        """
+        Iterates over raw models of all the OpenStack items of the type this manager manages, ideally fetching them
+        from OpenStack in pages of the given size as they are required.
+        :param page_size: the number of items to fetch in each request
+        :param listing_filter: filter that OpenStack may apply to the listing (not filtered if `None`)
+        :return: iterable of all OpenStack items
+        """
+        return self._get_all_raw() if listing_filter is None else self._get_filtered_raw(listing_filter)
+
     def delete(self, *, item: Managed=None, identifier: OpenstackIdentifier=None):
         """
         Deletes the given OpenStack item.
@@ -112,12 +236,10 @@ class _NovaManager(Generic[Managed, RawModel], Manager[Managed, RawModel], metac
         Constructor.
         """
         super().__init__(*args, **kwargs)
-        self._client = NovaClient(_NovaManager.NOVA_VERSION, self.openstack_credentials.username,
-                                  self.openstack_credentials.password, project_name=self.openstack_credentials.tenant,
-                                  auth_url=self.openstack_credentials.auth_url)
+        self._client = _create_nova_client(self.openstack_credentials)
 
 
-class OpenstackKeypairManager(_NovaManager[OpenstackKeypair, Keypair]):
+class OpenstackKeypairManager(_NovaManager[OpenstackKeypair, "Keypair"]):
     """
     Manager for OpenStack key-pairs.
     """
@@ -131,7 +253,7 @@ class OpenstackKeypairManager(_NovaManager[OpenstackKeypair, Keypair]):
     def _get_all_raw(self) -> Iterable[RawModel]:
         return self._client.keypairs.list()
 
-    def _convert_raw(self, model: Keypair) -> OpenstackKeypair:
+    def _convert_raw(self, model: "Keypair") -> OpenstackKeypair:
         return OpenstackKeypair(
             identifier=model.name,
             name=model.name,
@@ -142,10 +264,12 @@ class OpenstackKeypairManager(_NovaManager[OpenstackKeypair, Keypair]):
         self._client.keypairs.delete(identifier)
 
 
-class OpenstackInstanceManager(_NovaManager[OpenstackInstance, Server]):
+class OpenstackInstanceManager(_NovaManager[OpenstackInstance, "Server"]):
     """
     Manager for OpenStack instances.
     """
+    DELETES_ASYNCHRONOUSLY = True
+
     @property
     def item_type(self):
         return OpenstackInstance
@@ -156,17 +280,34 @@ class OpenstackInstanceManager(_NovaManager[OpenstackInstance, Server]):
     def _get_all_raw(self) -> Iterable[RawModel]:
         return self._client.servers.list()
 
-    def _convert_raw(self, model: Server) -> OpenstackInstance:
+    def _iterate_all_raw(self, page_size: int, listing_filter: ListingFilter=None) -> Iterable[RawModel]:
+        marker = None
+        while True:
+            page = self._client.servers.list(limit=page_size, marker=marker)
+            yield from page
+            if len(page) < page_size:
+                return
+            marker = page[-1].id
+
+    def _convert_raw(self, model: "Server") -> OpenstackInstance:
         return OpenstackInstance(
             identifier=model.id,
             name=model.name,
-            created_at=parse_datetime(model.created),
-            updated_at=parse_datetime(model.updated),
+            created_at=_parse_datetime(model.created),
+            updated_at=_parse_datetime(model.updated),
             image=model.image["id"],
             key_name=model.key_name
         )
 
+    def get_absolute_limits(self) -> Dict[str, int]:
+        """
+        Gets the absolute limits (quotas and their usage) of the tenant.
+        :return: map between the name of each limit and its value
+        """
+        return {limit.name: limit.value for limit in self._client.limits.get().absolute}
+
     def _delete(self, identifier: OpenstackIdentifier=None):
+        from novaclient.exceptions import ClientException
         try:
             self._client.servers.force_delete(identifier)
         except ClientException as e:
@@ -176,11 +317,12 @@ class OpenstackInstanceManager(_NovaManager[OpenstackInstance, Server]):
             self._client.servers.force_delete(identifier)
 
 
-class OpenstackImageManager(Manager[OpenstackImage, Image]):
+class OpenstackImageManager(Manager[OpenstackImage, "Image"]):
     """
     Manager for OpenStack images.
     """
     GLANCE_VERSION = "2"
+    FILTERS_LISTINGS = True
 
     @property
     def item_type(self):
@@ -191,11 +333,11 @@ class OpenstackImageManager(Manager[OpenstackImage, Image]):
         Constructor.
         """
         super().__init__(*args, **kwargs)
-        keystone = KeystoneClient(
-            auth_url=self.openstack_credentials.auth_url, username=self.openstack_credentials.username,
-            password=self.openstack_credentials.password, tenant_name=self.openstack_credentials.tenant)
+        from glanceclient.client import Client as GlanceClient
+        keystone = _create_keystone_client(self.openstack_credentials)
         glance_endpoint = keystone.service_catalog.url_for(service_type="image", endpoint_type="publicURL")
         self._client = GlanceClient(OpenstackImageManager.GLANCE_VERSION, glance_endpoint, token=keystone.auth_token)
+        self.tenant_id = keystone.auth_tenant_id
 
     def _get_by_id_raw(self, identifier: OpenstackIdentifier = None) -> RawModel:
         return self._client.images.get(identifier)
@@ -203,14 +345,415 @@ class OpenstackImageManager(Manager[OpenstackImage, Image]):
     def _get_all_raw(self) -> Iterable[RawModel]:
         return self._client.images.list()
 
-    def _convert_raw(self, model: Image) -> OpenstackImage:
+    def _get_filtered_raw(self, listing_filter: ListingFilter) -> Iterable[RawModel]:
+        return self._client.images.list(filters=_create_glance_filters(listing_filter))
+
+    def _get_by_ids_raw(self, identifiers: Collection[OpenstackIdentifier]) -> Iterable[RawModel]:
+        for identifiers_chunk in chunk(sorted(identifiers), _MAX_GLANCE_FILTER_IDENTIFIERS):
+            yield from self._client.images.list(filters={"id": f"in:{','.join(identifiers_chunk)}"})
+
+    def _iterate_all_raw(self, page_size: int, listing_filter: ListingFilter=None) -> Iterable[RawModel]:
+        if listing_filter is None:
+            return self._client.images.list(page_size=page_size)
+        return self._client.images.list(page_size=page_size, filters=_create_glance_filters(listing_filter))
+
+    def _convert_raw(self, model: "Image") -> OpenstackImage:
         return OpenstackImage(
             identifier=model.id,
             name=model.name,
-            created_at=parse_datetime(model.created_at),
-            updated_at=parse_datetime(model.updated_at),
-            protected=model.protected
+            created_at=_parse_datetime(model.created_at),
+            updated_at=_parse_datetime(model.updated_at),
+            protected=model.protected,
+            size=getattr(model, "size", None),
+            owner=getattr(model, "owner", None)
         )
 
     def _delete(self, identifier: OpenstackIdentifier=None):
         self._client.images.delete(identifier)
+
+
+# Managers are recreated after this long so that they re-authenticate before their tokens expire
+DEFAULT_MANAGER_EXPIRY = timedelta(minutes=30)
+
+
+class ManagerCache:
+    """
+    Cache of managers, which allows the authenticated clients used by managers to be reused between runs. Thread-safe.
+    """
+    def __init__(self, expiry: timedelta=DEFAULT_MANAGER_EXPIRY):
+        """
+        Constructor.
+        :param expiry: how long managers are reused for
+        """
+        self.expiry = expiry
+        self._managers: Dict[Tuple[Type[Manager], OpenstackCredentials], Tuple[Manager, datetime]] = {}
+        self._lock = Lock()
+
+    def get(self, manager_type: Type[Manager], openstack_credentials: OpenstackCredentials) -> Manager:
+        """
+        Gets a manager of the given type that uses the given credentials, creating it if one is not cached.
+        :param manager_type: the type of manager
+        :param openstack_credentials: the OpenStack credentials
+        :return: the manager
+        """
+        key = (manager_type, openstack_credentials)
+        with self._lock:
+            manager, created = self._managers.get(key, (None, None))
+            if manager is None or datetime.now() - created >= self.expiry:
+                manager = self._create(manager_type, openstack_credentials)
+                self._managers[key] = (manager, datetime.now())
+            return manager
+
+    def refresh(self, max_age: timedelta=None):
+        """
+        Discards anything that the managers have cached about the items in OpenStack, so that they are listed afresh.
+        Should be called at the start of each cycle.
+        :param max_age: only discard what was cached if it was last discarded at least this long ago (always discarded
+        if `None`), which bounds how stale listings get without discarding them for every run of a single tenant
+        """
+
+    def _create(self, manager_type: Type[Manager], openstack_credentials: OpenstackCredentials) -> Manager:
+        """
+        Creates a manager of the given type that uses the given credentials.
+        :param manager_type: the type of manager
+        :param openstack_credentials: the OpenStack credentials
+        :return: the created manager
+        """
+        return manager_type(openstack_credentials)
+
+    def retain(self, openstack_credentials: Iterable[OpenstackCredentials]):
+        """
+        Removes the cached managers that do not use any of the given credentials.
+        :param openstack_credentials: the credentials of the managers to keep
+        """
+        openstack_credentials = set(openstack_credentials)
+        with self._lock:
+            for key in [key for key in self._managers.keys() if key[1] not in openstack_credentials]:
+                del self._managers[key]
+
+
+# Nova API version used with admin credentials, which is the first that allows key-pairs to be listed by user
+_ADMIN_NOVA_VERSION = "2.10"
+
+
+class AllTenantsListing:
+    """
+    Listing of the items in all tenants, made using admin credentials with a single paginated request stream per
+    service (and a request per user for key-pairs), which is partitioned by tenant in memory. The listing of each
+    service is made when first required and kept until refreshed. Thread-safe.
+    """
+    def __init__(self, keystone_client: "KeystoneClient", nova_client: "NovaClient", glance_client: "GlanceClient",
+                 page_size: int=DEFAULT_PAGE_SIZE):
+        """
+        Constructor.
+        :param keystone_client: Keystone client, authenticated as an admin
+        :param nova_client: Nova client, authenticated as an admin (with an API version that allows key-pairs to be
+        listed by user)
+        :param glance_client: Glance client, authenticated as an admin
+        :param page_size: the number of items to list in each request
+        """
+        self.keystone_client = keystone_client
+        self.nova_client = nova_client
+        self.glance_client = glance_client
+        self.page_size = page_size
+        self._tenant_ids: Optional[Dict[str, str]] = None
+        self._user_ids: Optional[Dict[str, str]] = None
+        self._instances: Optional[Dict[str, List["Server"]]] = None
+        self._images: Optional[Dict[str, List["Image"]]] = None
+        self._refreshed = datetime.now()
+        self._lock = Lock()
+
+    def refresh(self, max_age: timedelta=None):
+        """
+        Discards the listings, so that they are made afresh when next required.
+        :param max_age: only discard the listings if they were last discarded at least this long ago (always discarded
+        if `None`)
+        """
+        with self._lock:
+            now = datetime.now()
+            if max_age is not None and now - self._refreshed < max_age:
+                return
+            self._refreshed = now
+            self._tenant_ids = None
+            self._user_ids = None
+            self._instances = None
+            self._images = None
+
+    def get_tenant_id(self, tenant: str) -> str:
+        """
+        Gets the identifier of the tenant with the given name.
+        :param tenant: the tenant's name
+        :return: the tenant's identifier
+        """
+        with self._lock:
+            if self._tenant_ids is None:
+                self._tenant_ids = {tenant.name: tenant.id for tenant in self.keystone_client.tenants.list()}
+            return self._tenant_ids[tenant]
+
+    def get_user_id(self, username: str) -> str:
+        """
+        Gets the identifier of the user with the given name.
+        :param username: the user's name
+        :return: the user's identifier
+        """
+        with self._lock:
+            if self._user_ids is None:
+                self._user_ids = {user.name: user.id for user in self.keystone_client.users.list()}
+            return self._user_ids[username]
+
+    def get_instances(self, tenant: str) -> List["Server"]:
+        """
+        Gets the instances in the given tenant.
+        :param tenant: the tenant's name
+        :return: raw models of the tenant's instances
+        """
+        tenant_id = self.get_tenant_id(tenant)
+        with self._lock:
+            if self._instances is None:
+                self._instances = {}
+                for server in self._list_all_servers():
+                    self._instances.setdefault(server.tenant_id, []).append(server)
+            return self._instances.get(tenant_id, [])
+
+    def get_images(self, tenant: str) -> List["Image"]:
+        """
+        Gets the images owned by the given tenant.
+        :param tenant: the tenant's name
+        :return: raw models of the tenant's images
+        """
+        tenant_id = self.get_tenant_id(tenant)
+        with self._lock:
+            if self._images is None:
+                self._images = {}
+                for image in self.glance_client.images.list(page_size=self.page_size):
+                    self._images.setdefault(getattr(image, "owner", None), []).append(image)
+            return self._images.get(tenant_id, [])
+
+    def get_key_pairs(self, username: str) -> List["Keypair"]:
+        """
+        Gets the key-pairs of the given user.
+        :param username: the user's name
+        :return: raw models of the user's key-pairs
+        """
+        return self.nova_client.keypairs.list(user_id=self.get_user_id(username))
+
+    def _list_all_servers(self) -> Iterator["Server"]:
+        """
+        Lists the instances in all tenants, a page at a time.
+        :return: iterator of raw models of all instances
+        """
+        marker = None
+        while True:
+            page = self.nova_client.servers.list(search_opts={"all_tenants": 1}, limit=self.page_size, marker=marker)
+            yield from page
+            if len(page) < self.page_size:
+                return
+            marker = page[-1].id
+
+
+def create_all_tenants_listing(admin_credentials: OpenstackCredentials, page_size: int=DEFAULT_PAGE_SIZE) \
+        -> AllTenantsListing:
+    """
+    Creates a listing of the items in all tenants that uses the given admin credentials.
+    :param admin_credentials: credentials of an OpenStack admin
+    :param page_size: the number of items to list in each request
+    :return: the created listing
+    """
+    from glanceclient.client import Client as GlanceClient
+    from novaclient.client import Client as NovaClient
+    keystone_client = _create_keystone_client(admin_credentials)
+    nova_client = NovaClient(_ADMIN_NOVA_VERSION, admin_credentials.username, admin_credentials.password,
+                             project_name=admin_credentials.tenant, auth_url=admin_credentials.auth_url)
+    glance_endpoint = keystone_client.service_catalog.url_for(service_type="image", endpoint_type="publicURL")
+    glance_client = GlanceClient(OpenstackImageManager.GLANCE_VERSION, glance_endpoint,
+                                 token=keystone_client.auth_token)
+    return AllTenantsListing(keystone_client, nova_client, glance_client, page_size)
+
+
+class _AllTenantsListingUser:
+    """
+    Mixin for managers that use the all-tenants listing (and admin clients) of an admin manager cache. The listing is
+    got from the cache whenever it is used, so that managers use the cache's new listing once the previous one expires.
+    """
+    def __init__(self, openstack_credentials: OpenstackCredentials, get_listing: Callable[[], AllTenantsListing]):
+        """
+        Constructor.
+        :param openstack_credentials: credentials of the tenant or user whose items are managed (which are not used to
+        authenticate)
+        :param get_listing: gets the current all-tenants listing
+        """
+        Manager.__init__(self, openstack_credentials)
+        self._get_listing = get_listing
+
+    @property
+    def _listing(self) -> AllTenantsListing:
+        return self._get_listing()
+
+
+class _AdminInstanceManager(_AllTenantsListingUser, OpenstackInstanceManager):
+    """
+    Manager for the OpenStack instances of a tenant, which uses an all-tenants listing and admin client.
+    """
+    @property
+    def _client(self) -> "NovaClient":
+        return self._listing.nova_client
+
+    def get_absolute_limits(self) -> Dict[str, int]:
+        tenant_id = self._listing.get_tenant_id(self.openstack_credentials.tenant)
+        return {limit.name: limit.value for limit in self._client.limits.get(tenant_id=tenant_id).absolute}
+
+    def _get_all_raw(self) -> Iterable[RawModel]:
+        return self._listing.get_instances(self.openstack_credentials.tenant)
+
+    def _iterate_all_raw(self, page_size: int, listing_filter: ListingFilter=None) -> Iterable[RawModel]:
+        return self._get_all_raw()
+
+
+class _AdminImageManager(_AllTenantsListingUser, OpenstackImageManager):
+    """
+    Manager for the OpenStack images owned by a tenant, which uses an all-tenants listing and admin client.
+    """
+    # The listing of all tenants is shared so is not filtered
+    FILTERS_LISTINGS = False
+
+    def __init__(self, openstack_credentials: OpenstackCredentials, get_listing: Callable[[], AllTenantsListing]):
+        super().__init__(openstack_credentials, get_listing)
+        self.tenant_id = self._listing.get_tenant_id(openstack_credentials.tenant)
+
+    @property
+    def _client(self) -> "GlanceClient":
+        return self._listing.glance_client
+
+    def _get_all_raw(self) -> Iterable[RawModel]:
+        return self._listing.get_images(self.openstack_credentials.tenant)
+
+    def _get_filtered_raw(self, listing_filter: ListingFilter) -> Iterable[RawModel]:
+        return self._get_all_raw()
+
+    def _get_by_ids_raw(self, identifiers: Collection[OpenstackIdentifier]) -> Iterable[RawModel]:
+        return self._get_all_raw()
+
+    def _iterate_all_raw(self, page_size: int, listing_filter: ListingFilter=None) -> Iterable[RawModel]:
+        return self._get_all_raw()
+
+
+class _AdminKeypairManager(_AllTenantsListingUser, OpenstackKeypairManager):
+    """
+    Manager for the OpenStack key-pairs of a user, which uses the admin client.
+    """
+    @property
+    def _client(self) -> "NovaClient":
+        return self._listing.nova_client
+
+    def _get_by_id_raw(self, identifier: OpenstackIdentifier=None) -> RawModel:
+        return self._client.keypairs.get(identifier, user_id=self._get_user_id())
+
+    def _get_all_raw(self) -> Iterable[RawModel]:
+        return self._listing.get_key_pairs(self.openstack_credentials.username)
+
+    def _delete(self, identifier: OpenstackIdentifier=None):
+        self._client.keypairs.delete(identifier, user_id=self._get_user_id())
+
+    def _get_user_id(self) -> str:
+        """
+        Gets the identifier of the user whose key-pairs are managed.
+        :return: the user's identifier
+        """
+        return self._listing.get_user_id(self.openstack_credentials.username)
+
+
+_ADMIN_MANAGER_TYPES: Dict[Type[Manager], Type[Manager]] = {
+    OpenstackInstanceManager: _AdminInstanceManager,
+    OpenstackImageManager: _AdminImageManager,
+    OpenstackKeypairManager: _AdminKeypairManager
+}
+
+
+class AdminManagerCache(ManagerCache):
+    """
+    Cache of managers that use admin credentials and a listing of all tenants, rather than authenticating as each
+    tenant and user and listing each tenant separately. Thread-safe.
+    """
+    def __init__(self, admin_credentials: OpenstackCredentials, expiry: timedelta=DEFAULT_MANAGER_EXPIRY,
+                 page_size: int=DEFAULT_PAGE_SIZE):
+        """
+        Constructor.
+        :param admin_credentials: credentials of an OpenStack admin
+        :param expiry: how long managers (and the admin clients that they use) are reused for
+        :param page_size: the number of items to list in each request
+        """
+        super().__init__(expiry)
+        self.admin_credentials = admin_credentials
+        self.page_size = page_size
+        self._listing: Optional[AllTenantsListing] = None
+        self._listing_created: Optional[datetime] = None
+        # Separate from the lock on the managers, as managers are created whilst it is held
+        self._listing_lock = Lock()
+
+    def refresh(self, max_age: timedelta=None):
+        with self._listing_lock:
+            if self._listing is not None:
+                self._listing.refresh(max_age)
+
+    def _create(self, manager_type: Type[Manager], openstack_credentials: OpenstackCredentials) -> Manager:
+        return _ADMIN_MANAGER_TYPES[manager_type](openstack_credentials, self._get_listing)
+
+    def _get_listing(self) -> AllTenantsListing:
+        """
+        Gets the listing of all tenants, which is replaced (along with its admin clients) once it has expired.
+        :return: the listing
+        """
+        with self._listing_lock:
+            if self._listing is None or datetime.now() - self._listing_created >= self.expiry:
+                self._listing = self._create_listing()
+                self._listing_created = datetime.now()
+            return self._listing
+
+    def _create_listing(self) -> AllTenantsListing:
+        """
+        Creates a listing of all tenants, authenticated with the admin credentials.
+        :return: the created listing
+        """
+        return create_all_tenants_listing(self.admin_credentials, self.page_size)
+
+
+# Names of the Nova absolute limits of each compute quota: (used, maximum)
+_COMPUTE_QUOTA_LIMITS = [
+    ("totalInstancesUsed", "maxTotalInstances"),
+    ("totalCoresUsed", "maxTotalCores"),
+    ("totalRAMUsed", "maxTotalRAMSize")
+]
+
+
+def get_compute_quota_usage(openstack_credentials: OpenstackCredentials, manager_cache: ManagerCache=None) -> float:
+    """
+    Gets the usage of the most used compute quota (instances, cores or RAM) of the tenant that the given credentials
+    are for. Only a single request is made to Nova if an authenticated client is cached.
+    :param openstack_credentials: the OpenStack credentials
+    :param manager_cache: cache of managers, whose authenticated instance manager is reused (a new manager is created if
+    `None`)
+    :return: the fraction of the quota that is used (0 if no quotas are limited)
+    """
+    manager = manager_cache.get(OpenstackInstanceManager, openstack_credentials) if manager_cache is not None \
+        else OpenstackInstanceManager(openstack_credentials)
+    limits = manager.get_absolute_limits()
+    usages = [limits[used] / limits[maximum] for used, maximum in _COMPUTE_QUOTA_LIMITS
+              if limits.get(maximum, -1) > 0 and used in limits]
+    return max(usages, default=0.0)
+
+
+def get_tenant_id(openstack_credentials: OpenstackCredentials) -> str:
+    """
+    Gets the identifier of the tenant that the given credentials are for.
+    :param openstack_credentials: the OpenStack credentials
+    :return: the tenant's identifier
+    """
+    return _create_keystone_client(openstack_credentials).auth_tenant_id
+
+
+# The manager for each type of item
+ITEM_MANAGER_TYPES: Dict[Type[OpenstackItem], Type[Manager]] = {
+    OpenstackKeypair: OpenstackKeypairManager,
+    OpenstackInstance: OpenstackInstanceManager,
+    OpenstackImage: OpenstackImageManager
+}
@@ -1,6 +1,6 @@
 from abc import ABCMeta
-from datetime import datetime
-from typing import NewType
+from datetime import datetime, timedelta
+from typing import NewType, List
 
 from openstacktenantcleaner.external.hgicommon.models import Model
 
@@ -66,6 +66,70 @@ class OpenstackImage(OpenstackItem, Timestamped):
     """
     An image on OpenStack.
     """
-    def __init__(self, protected: bool=None, **kwargs):
+    def __init__(self, protected: bool=None, size: int=None, owner: str=None, **kwargs):
         super().__init__(**kwargs)
         self.protected = protected
+        # Size in bytes
+        self.size = size
+        # Identifier of the tenant that owns the image
+        self.owner = owner
+
+
+class ListingFilter(Model):
+    """
+    Conditions that an item must meet to be deleted, which can be used to filter listings of items on OpenStack.
+    """
+    def __init__(self, older_than: timedelta=None, protected: bool=None):
+        """
+        Constructor.
+        :param older_than: the age that items must be older than (not filtered on if `None`)
+        :param protected: whether items must be protected (not filtered on if `None`)
+        """
+        self.older_than = older_than
+        self.protected = protected
+
+
+class ItemDecision(Model):
+    """
+    Decision on whether an OpenStack item is to be deleted.
+    """
+    def __init__(self, tenant: str=None, item: OpenstackItem=None, age: timedelta=None, delete: bool=None,
+                 reasons: List[str]=None, credentials: OpenstackCredentials=None, decided_by: str=None,
+                 eligible_at: datetime=None):
+        self.tenant = tenant
+        self.credentials = credentials
+        self.item = item
+        self.age = age
+        self.delete = delete
+        self.reasons = reasons if reasons is not None else []
+        # Name of the policy predicate that prevented the item from being deleted, if any
+        self.decided_by = decided_by
+        # When the item becomes eligible for deletion, if its delete is only prevented until a known time
+        self.eligible_at = eligible_at
+
+
+class PlannedDelete(Model):
+    """
+    Delete of an OpenStack item that has been planned, to be applied later.
+    """
+    def __init__(self, auth_url: str=None, tenant: str=None, username: str=None, item_type: str=None,
+                 identifier: OpenstackIdentifier=None, name: str=None, fingerprint: str=None):
+        self.auth_url = auth_url
+        self.tenant = tenant
+        self.username = username
+        self.item_type = item_type
+        self.identifier = identifier
+        self.name = name
+        self.fingerprint = fingerprint
+
+
+class DecisionChanges(Model):
+    """
+    Counts of how decisions have changed since the previous cycle.
+    """
+    def __init__(self, unchanged: int=0, changed: int=0, new: int=0, newly_deletable: int=0, gone: int=0):
+        self.unchanged = unchanged
+        self.changed = changed
+        self.new = new
+        self.newly_deletable = newly_deletable
+        self.gone = gone
@@ -1,78 +1,604 @@
+import hashlib
+import heapq
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import math
+import random
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from functools import partial
+from threading import Semaphore, Lock
 
-from typing import List, Iterable, Tuple, Collection, Callable, Type, Dict, Set
+from typing import List, Iterable, Tuple, Collection, Callable, Type, Dict, Set, Iterator, Optional
 
-from openstacktenantcleaner.common import create_human_identifier
-from openstacktenantcleaner.configuration import Configuration
-from openstacktenantcleaner.detectors import PreventDeleteDetector
-from openstacktenantcleaner.managers import Manager, OpenstackKeypairManager, OpenstackInstanceManager
-from openstacktenantcleaner.models import OpenstackItem
-from openstacktenantcleaner.tracking import Tracker
+from openstacktenantcleaner.common import create_human_identifier, create_item_fingerprint, chunk
+from openstacktenantcleaner.configuration import Configuration, CleanUpConfiguration, NotDeletedDetail, \
+    DEFAULT_NOT_DELETED_SAMPLE_SIZE, DeletePriority, ImageQuotaConfiguration
+from openstacktenantcleaner.detectors import InstanceIndex
+from openstacktenantcleaner.journal import DeleteJournal, DeleteState, JournalKey, IN_FLIGHT_EXPIRY, \
+    create_planned_delete, get_journal_key
+from openstacktenantcleaner.managers import Manager, OpenstackKeypairManager, OpenstackInstanceManager, \
+    OpenstackImageManager, ITEM_MANAGER_TYPES, ManagerCache, DEFAULT_PAGE_SIZE
+from openstacktenantcleaner.models import OpenstackItem, ItemDecision, PlannedDelete, OpenstackImage, \
+    OpenstackKeypair, OpenstackInstance, DecisionChanges, OpenstackCredentials, ListingFilter, \
+    OpenstackIdentifier
+from openstacktenantcleaner.policies import Policy
+from openstacktenantcleaner.tracking import Tracker, create_partition_key
 
 ItemAndReasons = Tuple[OpenstackItem, Collection[str]]
 DeleteSetup = Tuple[OpenstackItem, Callable[[OpenstackItem], None]]
 CleanUpPlan = Dict[Type[Manager],
                          Tuple[Collection[DeleteSetup], Collection[ItemAndReasons], Collection[ItemAndReasons]]]
+DecisionListener = Callable[[ItemDecision], None]
+
+# The tracker partition key of the tenant, the item's type and the item's identifier
+_DecisionKey = Tuple[str, str, str]
+# Whether the item was to be deleted and a fingerprint of the reasons why
+_DecisionRecord = Tuple[bool, str]
+
+# Durations (e.g. an item's age) in reasons change every cycle so are ignored when comparing reasons between cycles
+_DURATION_PATTERN = re.compile(r"(-?\d+ days?, )?\d+:\d{2}:\d{2}(\.\d+)?")
+
+_BYTES_PER_GIGABYTE = 1024 ** 3
+
+# Order in which item types are deleted when prioritising deletes by their impact on quota
+_QUOTA_IMPACT_ORDER = {OpenstackInstance: 0, OpenstackImage: 1, OpenstackKeypair: 2}
 
 _logger = logging.getLogger(__name__)
 
 
-def create_clean_up_plans(configuration: Configuration, tracker: Tracker, dry_run: bool=True) -> List[CleanUpPlan]:
+class DecisionHistory:
+    """
+    History of the decisions made in the previous cycle, used to find the decisions that have changed.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self._previous: Dict[_DecisionKey, _DecisionRecord] = {}
+
+    def diff(self, plans: List[CleanUpPlan], tenants: List[str]) -> Tuple[List[CleanUpPlan], DecisionChanges]:
+        """
+        Finds the decisions in the given plans that have changed since the plans given in the previous call, which
+        then become the previous cycle's decisions. Decisions are matched by tenant, rather than by the position of
+        their plan, so plans may be given in a different order (e.g. when tenants are sharded or reconfigured).
+        :param plans: the clean-up plans made in this cycle
+        :param tenants: the tracker partition key of the tenant of each plan (see `create_partition_key`)
+        :return: tuple where the first item is the given plans reduced to the decisions on new items and those that have
+        changed (the deletes to execute are unchanged), and the second counts of how the decisions have changed
+        """
+        current: Dict[_DecisionKey, _DecisionRecord] = {}
+        changes = DecisionChanges()
+        changed_plans: List[CleanUpPlan] = []
+
+        for plan, tenant in zip(plans, tenants):
+            changed_plan: CleanUpPlan = {}
+            for manager_type, (delete_setups, marked_for_deletion, not_marked_for_deletion) in plan.items():
+                changed_marked_for_deletion = [item_and_reasons for item_and_reasons in marked_for_deletion
+                                               if self._record(tenant, item_and_reasons, True, current, changes)]
+                changed_not_marked_for_deletion = [item_and_reasons for item_and_reasons in not_marked_for_deletion
+                                                   if self._record(tenant, item_and_reasons, False, current, changes)]
+                changed_plan[manager_type] = delete_setups, changed_marked_for_deletion, \
+                                             changed_not_marked_for_deletion
+            changed_plans.append(changed_plan)
+
+        changes.gone = len(self._previous.keys() - current.keys())
+        self._previous = current
+        return changed_plans, changes
+
+    def _record(self, tenant: str, item_and_reasons: ItemAndReasons, delete: bool,
+                current: Dict[_DecisionKey, _DecisionRecord], changes: DecisionChanges) -> bool:
+        """
+        Records the decision on the given item, in the current decisions, and counts how it has changed.
+        :param tenant: the tracker partition key of the tenant that the decision is in
+        :param item_and_reasons: the item and the reasons for the decision
+        :param delete: whether the item is to be deleted
+        :param current: the current decisions
+        :param changes: the counts of how decisions have changed
+        :return: whether the decision is new or has changed
+        """
+        item, reasons = item_and_reasons
+        key = (tenant, type(item).__name__, item.identifier)
+        reasons_fingerprint = hashlib.sha1("\n".join(
+            sorted(_DURATION_PATTERN.sub("", reason) for reason in reasons)).encode()).hexdigest()
+        record = current[key] = (delete, reasons_fingerprint)
+
+        previous = self._previous.get(key)
+        if previous is None:
+            changes.new += 1
+        elif previous == record:
+            changes.unchanged += 1
+            return False
+        elif delete and not previous[0]:
+            changes.newly_deletable += 1
+        else:
+            changes.changed += 1
+        return True
+
+
+def create_instance_index(configuration: Configuration, manager_cache: ManagerCache=None) -> InstanceIndex:
     """
-    Creates plans on what needs to be cleaned up based on the given configuration.
+    Creates an index of the instances in all of the tenants in the given configuration, listing the instances of each
+    tenant once. Up to the configured maximum number of tenants are listed simultaneously.
+    :param configuration: the clean-up configuration
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :return: the created index
+    """
+    def get_instances(credentials: OpenstackCredentials) -> Collection[OpenstackInstance]:
+        manager = manager_cache.get(OpenstackInstanceManager, credentials) if manager_cache is not None \
+            else OpenstackInstanceManager(credentials)
+        return manager.get_all()
+
+    all_credentials = {create_partition_key(credentials): credentials for credentials in (
+        clean_up_configuration.credentials[0] for clean_up_configuration in configuration.clean_up_configurations)}
+    instance_index = InstanceIndex()
+    with ThreadPoolExecutor(configuration.general_configuration.max_simultaneous_tenants) as executor:
+        for tenant, instances in zip(all_credentials.keys(), executor.map(get_instances, all_credentials.values())):
+            instance_index.add(tenant, instances)
+    return instance_index
+
+
+class InstanceIndexCache:
+    """
+    Cache of the index of the instances in all of the tenants that are cleaned up, shared between runs of single tenants
+    so that the instances of every tenant are not listed for each tenant run. The instances of the tenants being run
+    are always listed afresh, as it is their images and key-pairs that are checked against the index.
+    """
+    def __init__(self, max_age: timedelta):
+        """
+        Constructor.
+        :param max_age: how long the instances of the tenants that are not being run are reused for
+        """
+        self.max_age = max_age
+        self._instance_index: Optional[InstanceIndex] = None
+        self._created = datetime.min
+        self._lock = Lock()
+
+    def get(self, configuration: Configuration, tenants: Collection[str],
+            manager_cache: ManagerCache=None) -> InstanceIndex:
+        """
+        Gets an index of the instances in all of the tenants in the given configuration.
+        :param configuration: the clean-up configuration
+        :param tenants: tracker partition keys of the tenants being run, whose instances are listed afresh
+        :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+        :return: the index
+        """
+        all_tenants = {create_partition_key(clean_up_configuration.credentials[0])
+                       for clean_up_configuration in configuration.clean_up_configurations}
+        with self._lock:
+            now = datetime.now()
+            if self._instance_index is None or now - self._created >= self.max_age \
+                    or any(self._instance_index.get_instances(tenant) is None for tenant in all_tenants):
+                self._instance_index = create_instance_index(configuration, manager_cache)
+                self._created = now
+                return self._instance_index
+
+            run_configuration = Configuration(configuration.general_configuration, [
+                clean_up_configuration for clean_up_configuration in configuration.clean_up_configurations
+                if create_partition_key(clean_up_configuration.credentials[0]) in tenants])
+            listed = create_instance_index(run_configuration, manager_cache)
+            # A new index is created, rather than the cached one updated, as it may be in use by another run
+            instance_index = InstanceIndex()
+            for tenant in all_tenants:
+                instances = listed.get_instances(tenant)
+                instance_index.add(tenant, instances if instances is not None
+                                   else self._instance_index.get_instances(tenant))
+            self._instance_index = instance_index
+            return instance_index
+
+
+def create_clean_up_plans(configuration: Configuration, tracker: Tracker, dry_run: bool=True,
+                          decision_listener: DecisionListener=None, manager_cache: ManagerCache=None,
+                          instance_index: InstanceIndex=None, filter_listings: bool=False) -> List[CleanUpPlan]:
+    """
+    Creates plans on what needs to be cleaned up based on the given configuration. Up to the configured maximum number
+    of tenants are planned simultaneously.
     :param configuration: the clean-up configuration
     :param tracker: OpenStack item tracker
     :param dry_run: will not plan to delete anything if `True`
-    :return: the created clean-up plans
+    :param decision_listener: called with each decision as it is made (must be thread-safe if multiple tenants are
+    planned simultaneously)
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param instance_index: index of the instances in all of the tenants that are cleaned up (created from the tenants
+    in the given configuration if `None`)
+    :param filter_listings: see `create_clean_up_plan`
+    :return: the created clean-up plans, in the same order as the clean-up configurations
     """
-    plans: List[CleanUpPlan] = []
+    if instance_index is None:
+        instance_index = create_instance_index(configuration, manager_cache)
+    now = datetime.now()
+    with ThreadPoolExecutor(configuration.general_configuration.max_simultaneous_tenants) as executor:
+        return list(executor.map(lambda clean_up_configuration: create_clean_up_plan(
+            clean_up_configuration, tracker, dry_run=dry_run, decision_listener=decision_listener,
+            manager_cache=manager_cache, instance_index=instance_index, filter_listings=filter_listings, now=now),
+            configuration.clean_up_configurations))
+
+
+def create_clean_up_plan(clean_up_configuration: CleanUpConfiguration, tracker: Tracker, dry_run: bool=True,
+                         decision_listener: DecisionListener=None, manager_cache: ManagerCache=None,
+                         instance_index: InstanceIndex=None, filter_listings: bool=False,
+                         now: datetime=None) -> CleanUpPlan:
+    """
+    Creates a plan on what needs to be cleaned up in the tenant with the given clean-up configuration. Only the
+    tenant's partition of the tracker is used.
+    :param clean_up_configuration: the tenant's clean-up configuration
+    :param tracker: OpenStack item tracker
+    :param dry_run: will not plan to delete anything if `True`
+    :param decision_listener: called with each decision as it is made
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param instance_index: index of the instances in the tenants that are cleaned up, which is used instead of listing
+    instances (instances are listed as required if `None`)
+    :param filter_listings: whether to have OpenStack filter out items that the detectors would prevent from being
+    deleted when listing them (see `get_area_listing_filter`). Items that are filtered out are not unregistered from
+    the tracker
+    :param now: the time that the ages of items are measured at (the current time if `None`)
+    :return: the created clean-up plan
+    """
+    clean_up_area_plan: CleanUpPlan = {}
+    if now is None:
+        now = datetime.now()
+
+    for manager_type, policy in sort_clean_up_areas(clean_up_configuration.areas.items()):
+        # Need to use all credentials when cleaning up keys, as they can only be removed by the account that created
+        # them
+        is_owned_by_user = manager_type == OpenstackKeypairManager
+        credentials_to_use = [clean_up_configuration.credentials[0]] if not is_owned_by_user \
+            else clean_up_configuration.credentials
 
-    for clean_up_configuration in configuration.clean_up_configurations:
-        clean_up_area_plan: CleanUpPlan = {}
+        all_area_delete_setups: List[DeleteSetup] = []
+        all_area_marked_for_deletion: List[ItemAndReasons] = []
+        all_area_not_marked_for_deletion: List[ItemAndReasons] = []
 
-        for manager_type, prevent_delete_detectors in sort_clean_up_areas(clean_up_configuration.areas.items()):
-            # Need to use all credentials when cleaning up keys, as they can only be removed by the account that created
-            # them
-            credentials_to_use = [clean_up_configuration.credentials[0]] if manager_type != OpenstackKeypairManager \
-                else clean_up_configuration.credentials
+        for credentials in credentials_to_use:
+            already_marked_for_deletion = {item for plan_details in clean_up_area_plan.values()
+                                           for item, _ in plan_details[1]}
+            manager = manager_cache.get(manager_type, credentials) if manager_cache is not None \
+                else manager_type(credentials)
+            # Items older than each age are fetched from the tracker once, after the area's items are synchronised
+            partition_tracker = tracker.get_partition(
+                create_partition_key(credentials, include_user=is_owned_by_user)).get_snapshot(now)
+            image_quota = clean_up_configuration.image_quota if manager_type == OpenstackImageManager else None
+            items = instance_index.get_instances(create_partition_key(credentials)) \
+                if instance_index is not None and manager_type == OpenstackInstanceManager else None
+            listing_filter = get_area_listing_filter(manager, policy, image_quota) \
+                if filter_listings and items is None else None
+            marked_for_deletion, not_marked_for_deletion = _create_area_report(
+                manager, policy, partition_tracker, already_marked_for_deletion, decision_listener,
+                image_quota, instance_index, items, listing_filter, now)
+            policy.forget_verdicts(credentials, manager.item_type, now)
 
-            all_area_delete_setups: List[DeleteSetup] = []
-            all_area_marked_for_deletion: List[ItemAndReasons] = []
-            all_area_not_marked_for_deletion: List[ItemAndReasons] = []
+            if not dry_run:
+                for item, _ in marked_for_deletion:
+                    delete_setup: DeleteSetup = (item, _create_delete(manager))
+                    all_area_delete_setups.append(delete_setup)
+            all_area_marked_for_deletion += marked_for_deletion
+            all_area_not_marked_for_deletion += not_marked_for_deletion
 
-            for credentials in credentials_to_use:
-                already_marked_for_deletion = {item_and_reasons[0][0] for item_and_reasons in
-                                               filter(lambda x: len(x) > 0,
-                                                      [plan_details[1] for plan_details in clean_up_area_plan.values()])}
-                manager = manager_type(credentials)
-                marked_for_deletion, not_marked_for_deletion = _create_area_report(
-                    manager, prevent_delete_detectors, tracker, already_marked_for_deletion)
+        clean_up_area_plan[manager_type] = all_area_delete_setups, all_area_marked_for_deletion, \
+                                           all_area_not_marked_for_deletion
+
+    return clean_up_area_plan
+
+
+def get_area_listing_filter(manager: Manager, policy: Policy,
+                            image_quota: ImageQuotaConfiguration=None) -> Optional[ListingFilter]:
+    """
+    Gets the filter that OpenStack can apply when listing the items in a clean-up area, so that items that the area's
+    policy would prevent from being deleted are not listed. Images are not filtered if they are subject to a quota,
+    as the usage of the quota is calculated from all of the images.
+    :param manager: the manager of the area
+    :param policy: the area's policy
+    :param image_quota: the image quota that the area is subject to, if any
+    :return: the listing filter or `None` if the area's listing cannot be filtered
+    """
+    if not manager.FILTERS_LISTINGS or image_quota is not None:
+        return None
+    return policy.listing_filter
+
+
+def create_clean_up_plans_from_planned_deletes(planned_deletes: Collection[PlannedDelete], configuration: Configuration,
+                                               dry_run: bool=True, manager_cache: ManagerCache=None,
+                                               instance_index_cache: InstanceIndexCache=None) -> List[CleanUpPlan]:
+    """
+    Creates plans to apply the given, previously planned, deletes. Rather than re-evaluating the prevent delete
+    detectors, each planned delete is revalidated by fetching the item, checking that it still exists, has not changed
+    since it was planned and (for images and key-pairs) is not now in use by an instance that is not also to be
+    deleted. The instances of every tenant in the configuration are indexed once, as images may be in use by instances
+    in other tenants (e.g. if shared), and planned instance deletes are revalidated against the index. The images and
+    key-pairs of each area are fetched with one listing, with up to the configured maximum number of tenants listed
+    simultaneously. Instances are revalidated first, so that only the instances whose deletes are still valid are
+    discounted from the in-use checks.
+    :param planned_deletes: the previously planned deletes
+    :param configuration: the clean-up configuration, which holds the credentials required to apply the deletes
+    :param dry_run: will not plan to delete anything if `True`
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param instance_index_cache: cache of the index of the instances in all tenants to reuse (the instances of every
+    tenant are listed if `None`)
+    :return: the created clean-up plans, one for each tenant with planned deletes
+    """
+    manager_types = {item_type.__name__: manager_type for item_type, manager_type in ITEM_MANAGER_TYPES.items()}
+    all_credentials = {(credentials.auth_url, credentials.tenant, credentials.username): credentials
+                       for clean_up_configuration in configuration.clean_up_configurations
+                       for credentials in clean_up_configuration.credentials}
 
+    def get_manager(manager_type: Type[Manager], credentials: OpenstackCredentials) -> Manager:
+        return manager_cache.get(manager_type, credentials) if manager_cache is not None \
+            else manager_type(credentials)
+
+    planned_in_areas: Dict[Tuple[str, str, str, str], List[PlannedDelete]] = {}
+    for planned_delete in planned_deletes:
+        planned_in_areas.setdefault((planned_delete.auth_url, planned_delete.tenant, planned_delete.username,
+                                     planned_delete.item_type), []).append(planned_delete)
+    areas: List[Tuple[OpenstackCredentials, Manager, List[PlannedDelete]]] = []
+    for (auth_url, tenant, username, item_type), area_planned_deletes in sorted(
+            planned_in_areas.items(), key=lambda entry: entry[0][3] != OpenstackInstance.__name__):
+        credentials = all_credentials.get((auth_url, tenant, username))
+        if credentials is None or item_type not in manager_types:
+            _logger.warning(f"Cannot apply {len(area_planned_deletes)} planned delete(s) of type \"{item_type}\" in "
+                            f"tenant \"{tenant}\" for user \"{username}\" as they are not in the configuration")
+            continue
+        areas.append((credentials, get_manager(manager_types[item_type], credentials), area_planned_deletes))
+    if len(areas) == 0:
+        return []
+
+    tenants = {create_partition_key(credentials) for credentials, _, _ in areas}
+    instance_index = instance_index_cache.get(configuration, tenants, manager_cache) \
+        if instance_index_cache is not None else create_instance_index(configuration, manager_cache)
+
+    def get_items(area: Tuple[OpenstackCredentials, Manager, List[PlannedDelete]]) \
+            -> Optional[Dict[OpenstackIdentifier, OpenstackItem]]:
+        credentials, manager, area_planned_deletes = area
+        identifiers = {planned_delete.identifier for planned_delete in area_planned_deletes}
+        instances = instance_index.get_instances(create_partition_key(credentials)) \
+            if area_planned_deletes[0].item_type == OpenstackInstance.__name__ else None
+        if instances is not None:
+            return {instance.identifier: instance for instance in instances if instance.identifier in identifiers}
+        try:
+            return manager.get_by_ids(identifiers)
+        except Exception as e:
+            _logger.warning(f"Cannot apply {len(area_planned_deletes)} planned delete(s) of type "
+                            f"\"{area_planned_deletes[0].item_type}\" in tenant \"{credentials.tenant}\" as they "
+                            f"could not be fetched: {e}")
+            return None
+
+    with ThreadPoolExecutor(configuration.general_configuration.max_simultaneous_tenants) as executor:
+        area_items = list(executor.map(get_items, areas))
+
+    revalidated_instance_identifiers: Set[OpenstackIdentifier] = set()
+    plans: Dict[Tuple[str, str], CleanUpPlan] = {}
+    for (credentials, manager, area_planned_deletes), items in zip(areas, area_items):
+        if items is None:
+            continue
+        delete_setups: List[DeleteSetup] = []
+        marked_for_deletion: List[ItemAndReasons] = []
+        not_marked_for_deletion: List[ItemAndReasons] = []
+        for planned_delete in area_planned_deletes:
+            item = items.get(planned_delete.identifier)
+            if item is None:
+                _logger.info(f"Planned delete of {planned_delete.item_type} \"{planned_delete.identifier}\" skipped "
+                             f"as it no longer exists")
+                continue
+            if isinstance(item, OpenstackImage):
+                instances = instance_index.get_image_users(item.identifier)
+            elif isinstance(item, OpenstackKeypair):
+                instances = instance_index.get_key_pair_users(create_partition_key(credentials), item.name) or []
+            else:
+                instances = []
+            reason = _get_planned_delete_invalid_reason(planned_delete, item, [
+                instance for instance in instances if instance.identifier not in revalidated_instance_identifiers])
+            if reason is not None:
+                not_marked_for_deletion.append((item, [reason]))
+            else:
+                marked_for_deletion.append((item, ["Planned delete revalidated"]))
+                if isinstance(item, OpenstackInstance):
+                    revalidated_instance_identifiers.add(item.identifier)
+                if not dry_run:
+                    delete_setups.append((item, _create_delete(manager)))
+
+        plan = plans.setdefault((credentials.auth_url, credentials.tenant), {})
+        existing = plan.get(type(manager), ([], [], []))
+        plan[type(manager)] = existing[0] + delete_setups, existing[1] + marked_for_deletion, \
+                              existing[2] + not_marked_for_deletion
+
+    return list(plans.values())
+
+
+def create_clean_up_plans_for_eligible_items(decisions: Collection[ItemDecision], configuration: Configuration,
+                                             tracker: Tracker, dry_run: bool=True,
+                                             decision_listener: DecisionListener=None,
+                                             manager_cache: ManagerCache=None,
+                                             instance_index: InstanceIndex=None) -> List[CleanUpPlan]:
+    """
+    Creates plans to clean up the items that the given decisions kept until they became eligible for deletion. Rather
+    than listing each area, each item is fetched by its identifier and decided on again with the latest policy of its
+    area, so it is only deleted if it still exists and nothing else now prevents its delete. Items are not tracked.
+    :param decisions: the earlier decisions on the items, which must have been made with the credentials of a tenant in
+    the given configuration
+    :param configuration: the clean-up configuration
+    :param tracker: OpenStack item tracker
+    :param dry_run: will not plan to delete anything if `True`
+    :param decision_listener: called with each decision as it is made
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param instance_index: index of the instances in all of the tenants that are cleaned up, used to find the instances
+    that are using images and key-pairs (created from the tenants in the given configuration if `None` and required)
+    :return: the created clean-up plans, one for each tenant with eligible items
+    """
+    now = datetime.now()
+    tenant_areas = {(credentials.auth_url, credentials.tenant, credentials.username): (credentials,
+                                                                                        clean_up_configuration.areas)
+                    for clean_up_configuration in configuration.clean_up_configurations
+                    for credentials in clean_up_configuration.credentials}
+
+    eligible_in_areas: Dict[Tuple[str, str, str, Type[Manager]], List[ItemDecision]] = {}
+    for decision in decisions:
+        eligible_in_areas.setdefault((decision.credentials.auth_url, decision.credentials.tenant,
+                                      decision.credentials.username, ITEM_MANAGER_TYPES[type(decision.item)]),
+                                     []).append(decision)
+    if instance_index is None and any(manager_type != OpenstackInstanceManager
+                                      for *_, manager_type in eligible_in_areas.keys()):
+        instance_index = create_instance_index(configuration, manager_cache)
+    already_marked_for_deletion: Set[OpenstackItem] = set()
+
+    plans: Dict[Tuple[str, str], CleanUpPlan] = {}
+    for (auth_url, tenant, username, manager_type), area_decisions in sorted(
+            eligible_in_areas.items(), key=lambda entry: entry[0][3] != OpenstackInstanceManager):
+        credentials, areas = tenant_areas.get((auth_url, tenant, username), (None, {}))
+        policy = areas.get(manager_type)
+        if policy is None:
+            _logger.info(f"Not revalidating {len(area_decisions)} eligible {type(area_decisions[0].item).__name__}(s) "
+                         f"in tenant \"{tenant}\" for user \"{username}\" as they are no longer in the configuration")
+            continue
+        manager = manager_cache.get(manager_type, credentials) if manager_cache is not None \
+            else manager_type(credentials)
+        partition_tracker = tracker.get_partition(
+            create_partition_key(credentials, include_user=manager_type == OpenstackKeypairManager))
+
+        delete_setups: List[DeleteSetup] = []
+        marked_for_deletion: List[ItemAndReasons] = []
+        not_marked_for_deletion: List[ItemAndReasons] = []
+        for decision in area_decisions:
+            try:
+                item = manager.get_by_id(decision.item.identifier)
+            except Exception as e:
+                _logger.info(f"Eligible item {create_human_identifier(decision.item, True)} skipped as it could not "
+                             f"be fetched (it may no longer exist): {e}")
+                continue
+            delete, reasons = _decide(item, manager, policy, partition_tracker, already_marked_for_deletion,
+                                      decision_listener, instance_index, now)
+            if delete:
+                marked_for_deletion.append((item, reasons))
+                if isinstance(item, OpenstackInstance):
+                    already_marked_for_deletion.add(item)
                 if not dry_run:
-                    for item, _ in marked_for_deletion:
-                        delete_setup: DeleteSetup = (item, _create_delete(manager))
-                        all_area_delete_setups.append(delete_setup)
-                all_area_marked_for_deletion += marked_for_deletion
-                all_area_not_marked_for_deletion += not_marked_for_deletion
+                    delete_setups.append((item, _create_delete(manager)))
+            else:
+                not_marked_for_deletion.append((item, reasons))
 
-            clean_up_area_plan[manager_type] = all_area_delete_setups, all_area_marked_for_deletion, \
-                                               all_area_not_marked_for_deletion
+        plan = plans.setdefault((auth_url, tenant), {})
+        existing = plan.get(manager_type, ([], [], []))
+        plan[manager_type] = existing[0] + delete_setups, existing[1] + marked_for_deletion, \
+                             existing[2] + not_marked_for_deletion
 
-        plans.append(clean_up_area_plan)
+    return list(plans.values())
 
-    return plans
 
+def create_clean_up_plans_from_delete_journal(delete_journal: DeleteJournal, configuration: Configuration,
+                                              manager_cache: ManagerCache=None,
+                                              partitions: Collection[str]=None) -> List[CleanUpPlan]:
+    """
+    Creates plans to resume the deletes in the given journal that were not confirmed (e.g. as the process died whilst
+    they were being made), without re-planning. Each item is fetched by its identifier: deletes of items that no longer
+    exist are confirmed, and deletes of items that have changed since the delete was journalled are removed from the
+    journal (to be re-planned in the next run). Deletes that are still in progress are left to complete.
+    :param delete_journal: the delete journal
+    :param configuration: the clean-up configuration, which holds the credentials required to resume the deletes
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param partitions: tracker partition keys of the tenants whose deletes are to be resumed, where the deletes of other
+    tenants are left in the journal (e.g. for the nodes that hold them to resume). All are resumed if `None`
+    :return: the created clean-up plans, one for each tenant with deletes to resume
+    """
+    manager_types = {item_type.__name__: manager_type for item_type, manager_type in ITEM_MANAGER_TYPES.items()}
+    all_credentials = {(credentials.auth_url, credentials.tenant, credentials.username): credentials
+                       for clean_up_configuration in configuration.clean_up_configurations
+                       for credentials in clean_up_configuration.credentials}
+    in_flight = _get_in_flight_deletes(delete_journal)
 
-def sort_clean_up_areas(areas: Iterable[Tuple[Type[Manager], Iterable[PreventDeleteDetector]]]) -> \
-        List[Tuple[Type[Manager], Iterable[PreventDeleteDetector]]]:
+    confirmed: List[PlannedDelete] = []
+    invalid: List[PlannedDelete] = []
+    plans: Dict[Tuple[str, str], CleanUpPlan] = {}
+    for entry in delete_journal.get_unconfirmed():
+        planned_delete = entry.planned_delete
+        credentials = all_credentials.get((planned_delete.auth_url, planned_delete.tenant, planned_delete.username))
+        if credentials is None or planned_delete.item_type not in manager_types:
+            _logger.warning(f"Cannot resume journalled delete of {planned_delete.item_type} "
+                            f"\"{planned_delete.identifier}\" in tenant \"{planned_delete.tenant}\" for user "
+                            f"\"{planned_delete.username}\" as it is not in the configuration")
+            invalid.append(planned_delete)
+            continue
+        if partitions is not None and create_partition_key(credentials) not in partitions:
+            continue
+        manager_type = manager_types[planned_delete.item_type]
+        manager = manager_cache.get(manager_type, credentials) if manager_cache is not None \
+            else manager_type(credentials)
+        try:
+            item = manager.get_by_id(planned_delete.identifier)
+        except Exception as e:
+            _logger.info(f"Journalled delete of {planned_delete.item_type} \"{planned_delete.identifier}\" confirmed "
+                         f"as it could not be fetched (it no longer exists): {e}")
+            confirmed.append(planned_delete)
+            continue
+        if create_item_fingerprint(item) != planned_delete.fingerprint:
+            _logger.info(f"Journalled delete of item {create_human_identifier(item, True)} not resumed as the item has "
+                         f"changed")
+            invalid.append(planned_delete)
+            continue
+        if get_journal_key(planned_delete) in in_flight:
+            _logger.info(f"Journalled delete of item {create_human_identifier(item, True)} not resumed as it is still "
+                         f"in progress")
+            continue
+
+        plan = plans.setdefault((planned_delete.auth_url, planned_delete.tenant), {})
+        delete_setups, marked_for_deletion, not_marked_for_deletion = plan.get(manager_type, ([], [], []))
+        reasons = [f"Journalled delete resumed ({entry.state.value})"]
+        plan[manager_type] = delete_setups + [(item, _create_delete(manager))], \
+            marked_for_deletion + [(item, reasons)], not_marked_for_deletion
+
+    delete_journal.record(confirmed, DeleteState.CONFIRMED)
+    delete_journal.forget(invalid)
+    return list(plans.values())
+
+
+def select_images_to_free_quota(tenant_images: Collection[OpenstackImage], eligible_images: Iterable[OpenstackImage],
+                                image_quota: ImageQuotaConfiguration) -> Set[OpenstackImage]:
+    """
+    Selects the fewest images, of those that are eligible for deletion, that need to be deleted to bring the tenant's
+    image usage within its quota, less the configured headroom. If space needs to be freed, the largest images are
+    selected first, else the oldest are. If the usage cannot be brought within the quota, all eligible images are
+    selected.
+    :param tenant_images: all images that count towards the tenant's quota
+    :param eligible_images: the images that can be deleted
+    :param image_quota: the tenant's image quota
+    :return: the images to delete
+    """
+    bytes_to_free = 0.0
+    if image_quota.max_gigabytes is not None:
+        target_bytes = (1 - image_quota.headroom) * image_quota.max_gigabytes * _BYTES_PER_GIGABYTE
+        bytes_to_free = sum(image.size or 0 for image in tenant_images) - target_bytes
+    images_to_free = 0
+    if image_quota.max_images is not None:
+        images_to_free = len(tenant_images) - math.floor((1 - image_quota.headroom) * image_quota.max_images)
+    if bytes_to_free <= 0 and images_to_free <= 0:
+        return set()
+
+    def get_age_priority(image: OpenstackImage) -> Tuple:
+        return image.created_at is None, image.created_at.timestamp() if image.created_at is not None else 0
+
+    # Heap of the eligible images, built in a single pass, from which only as many images as are needed are taken
+    candidates = [((-(image.size or 0), ) + get_age_priority(image) if bytes_to_free > 0
+                   else get_age_priority(image) + (-(image.size or 0), ), i, image)
+                  for i, image in enumerate(eligible_images)]
+    heapq.heapify(candidates)
+
+    selected: Set[OpenstackImage] = set()
+    while (bytes_to_free > 0 or images_to_free > 0) and len(candidates) > 0:
+        _, _, image = heapq.heappop(candidates)
+        selected.add(image)
+        bytes_to_free -= image.size or 0
+        images_to_free -= 1
+    if bytes_to_free > 0 or images_to_free > 0:
+        _logger.warning(f"Deleting all {len(selected)} eligible image(s) will not bring image usage within quota")
+    return selected
+
+
+def sort_clean_up_areas(areas: Iterable[Tuple[Type[Manager], Policy]]) -> List[Tuple[Type[Manager], Policy]]:
     """
     Sorts the clean up areas such that instances are dealt with first, as if they are deleted, it may allow keys and
     images to also be deleted.
     :param areas: areas
     :return: sorted areas
     """
-    ordered: List[Tuple[Type[Manager], Iterable[PreventDeleteDetector]]] = []
+    ordered: List[Tuple[Type[Manager], Policy]] = []
     for area in areas:
         if area[0] == OpenstackInstanceManager:
             ordered.insert(0, area)
@@ -81,110 +607,521 @@ def sort_clean_up_areas(areas: Iterable[Tuple[Type[Manager], Iterable[PreventDel
     return ordered
 
 
-def execute_plans(plans: List[CleanUpPlan], max_simultaneous_deletes: int):
+def get_delete_priority(item: OpenstackItem, delete_priority: DeletePriority) -> Tuple:
+    """
+    Gets the priority of deleting the given item, where items with lower values are to be deleted first.
+    :param item: the item to be deleted
+    :param delete_priority: the order in which items are to be deleted
+    :return: the priority of deleting the item
+    """
+    created_at = getattr(item, "created_at", None)
+    # Items without a created time (e.g. key-pairs) are considered the youngest
+    age_priority = (created_at is None, created_at.timestamp() if created_at is not None else 0)
+    size_priority = -(getattr(item, "size", None) or 0)
+    if delete_priority == DeletePriority.SIZE:
+        return (size_priority, ) + age_priority
+    if delete_priority == DeletePriority.QUOTA_IMPACT:
+        return (_QUOTA_IMPACT_ORDER.get(type(item), len(_QUOTA_IMPACT_ORDER)), size_priority) + age_priority
+    return age_priority
+
+
+def _get_delete_dependencies(items: List[OpenstackItem], plan_indices: List[int]) -> Dict[int, Set[int]]:
     """
-    Execute the given clean-up plans.
+    Gets the instances to be deleted that each image and key-pair to be deleted is used by. Images are shared between
+    tenants, whereas key-pairs are only used by instances in the same plan.
+    :param items: the items to be deleted
+    :param plan_indices: the index of the plan that each item is in
+    :return: map between the positions of images and key-pairs in the given items and the positions of the instances
+    that use them (images and key-pairs that are not used by any of the instances are not included)
+    """
+    image_users: Dict[str, Set[int]] = defaultdict(set)
+    key_pair_users: Dict[Tuple[int, str], Set[int]] = defaultdict(set)
+    for position, item in enumerate(items):
+        if isinstance(item, OpenstackInstance):
+            if item.image is not None:
+                image_users[item.image].add(position)
+            if item.key_name is not None:
+                key_pair_users[(plan_indices[position], item.key_name)].add(position)
+
+    dependencies: Dict[int, Set[int]] = {}
+    for position, item in enumerate(items):
+        if isinstance(item, OpenstackImage) and item.identifier in image_users:
+            dependencies[position] = set(image_users[item.identifier])
+        elif isinstance(item, OpenstackKeypair) and (plan_indices[position], item.name) in key_pair_users:
+            dependencies[position] = set(key_pair_users[(plan_indices[position], item.name)])
+    return dependencies
+
+
+def filter_plan_deletes(plans: List[CleanUpPlan], is_deletable: Callable[[OpenstackCredentials], bool]) \
+        -> List[CleanUpPlan]:
+    """
+    Removes the deletes from the given plans that can no longer be made with the credentials that they were planned
+    with (e.g. as the tenant is no longer in this node's shard). The decisions in the plans are kept.
+    :param plans: the clean-up plans
+    :param is_deletable: whether deletes can still be made with the given credentials
+    :return: the plans with only the deletes that can still be made
+    """
+    filtered_plans: List[CleanUpPlan] = []
+    for plan in plans:
+        filtered_plan: CleanUpPlan = {}
+        for manager_type, (delete_setups, marked_for_deletion, not_marked_for_deletion) in plan.items():
+            kept = [(item, deleter) for item, deleter in delete_setups if not isinstance(deleter, _ManagerDelete)
+                    or is_deletable(deleter.manager.openstack_credentials)]
+            if len(kept) < len(delete_setups):
+                _logger.warning(f"Not deleting {len(delete_setups) - len(kept)} {manager_type.__name__} item(s) as "
+                                f"they can no longer be deleted with the credentials that they were planned with")
+            filtered_plan[manager_type] = kept, marked_for_deletion, not_marked_for_deletion
+        filtered_plans.append(filtered_plan)
+    return filtered_plans
+
+
+def execute_plans(plans: List[CleanUpPlan], max_simultaneous_deletes: int,
+                  delete_priority: DeletePriority=DeletePriority.AGE, max_deletes: int=None,
+                  delete_journal: DeleteJournal=None):
+    """
+    Execute the given clean-up plans. Deletes are started in order of priority, so that if the execution is cut short
+    (or limited), the deletes that matter most have been done.
     :param plans: the clean-up plans
     :param max_simultaneous_deletes: the maximum number of OpenStack items to delete simultaneously. This only applies
     within the method call (it is not global)
+    :param delete_priority: the order in which to delete items
+    :param max_deletes: the maximum number of items to delete (no limit if `None`), where the items with the highest
+    priority are deleted. An image or key-pair that is used by instances that are to be deleted is only deleted if all
+    of those instances are within the limit, so the limit never leaves an instance without its image or key-pair
+    :param delete_journal: journal to record the progress of the deletes in (not journalled if `None`). The intent to
+    make all of the deletes is journalled before any are made, each batch of (up to the maximum number of simultaneous)
+    deletes is journalled as issued before it is made, and deletes are journalled as confirmed, in batches, once
+    OpenStack has accepted them. Failed deletes are removed from the journal. Deletes that are still in progress, having
+    been issued but not confirmed, are not made again
     """
-    all_delete_setups: List[DeleteSetup] = []
-    for plan in plans:
+    delete_queue: List[Tuple[Tuple, int, DeleteSetup]] = []
+    plan_indices: List[int] = []
+    for plan_index, plan in enumerate(plans):
         for _, (delete_setups, _, _) in plan.items():
-            all_delete_setups += delete_setups
+            for delete_setup in delete_setups:
+                # The queue position breaks ties, so that items with equal priority are deleted in the planned order
+                delete_queue.append((get_delete_priority(delete_setup[0], delete_priority), len(delete_queue),
+                                     delete_setup))
+                plan_indices.append(plan_index)
+    waiting_for = _get_delete_dependencies([entry[2][0] for entry in delete_queue], plan_indices) \
+        if max_deletes is not None else {}
+    dependents: Dict[int, List[int]] = defaultdict(list)
+    for dependent_position, instance_positions in waiting_for.items():
+        for instance_position in instance_positions:
+            dependents[instance_position].append(dependent_position)
+    waiting: Dict[int, Tuple[Tuple, int, DeleteSetup]] = {}
+    heapq.heapify(delete_queue)
+    in_flight = _get_in_flight_deletes(delete_journal) if delete_journal is not None else set()
+
+    to_delete: List[Tuple[DeleteSetup, Optional[PlannedDelete]]] = []
+    while len(delete_queue) > 0 and (max_deletes is None or len(to_delete) < max_deletes):
+        entry = heapq.heappop(delete_queue)
+        _, position, (item, deleter) = entry
+        if len(waiting_for.get(position, ())) > 0:
+            # Deleted once all the instances using the item have been taken, or not at all if the limit is reached first
+            waiting[position] = entry
+            continue
+        for dependent_position in dependents.pop(position, ()):
+            waiting_for[dependent_position].discard(position)
+            if len(waiting_for[dependent_position]) == 0 and dependent_position in waiting:
+                heapq.heappush(delete_queue, waiting.pop(dependent_position))
+        planned_delete = create_planned_delete(item, deleter.manager.openstack_credentials) \
+            if delete_journal is not None and isinstance(deleter, _ManagerDelete) else None
+        if planned_delete is not None and get_journal_key(planned_delete) in in_flight:
+            _logger.info(f"Not deleting item {create_human_identifier(item, True)} as its delete is still in progress")
+            continue
+        to_delete.append(((item, deleter), planned_delete))
+
+    journalled = [planned_delete for _, planned_delete in to_delete if planned_delete is not None]
+    if len(journalled) > 0:
+        delete_journal.record(journalled, DeleteState.INTENT)
+    accepted: List[PlannedDelete] = []
+    failed: List[PlannedDelete] = []
+    outcomes_lock = Lock()
+
+    def on_delete_done(planned_delete: PlannedDelete, future: Future):
+        with outcomes_lock:
+            (accepted if future.exception() is None else failed).append(planned_delete)
+            if len(accepted) < max_simultaneous_deletes:
+                return
+            to_confirm = list(accepted)
+            accepted.clear()
+        delete_journal.record(to_confirm, DeleteState.CONFIRMED)
 
     with ThreadPoolExecutor(max_simultaneous_deletes) as executor:
-        for item, deleter in all_delete_setups:
-            _logger.info(f"Deleting item {create_human_identifier(item, True)}")
-            executor.submit(deleter, item)
+        for batch in chunk(to_delete, max_simultaneous_deletes):
+            if len(journalled) > 0:
+                delete_journal.record([planned_delete for _, planned_delete in batch if planned_delete is not None],
+                                      DeleteState.ISSUED)
+            for (item, deleter), planned_delete in batch:
+                _logger.info(f"Deleting item {create_human_identifier(item, True)}")
+                future = executor.submit(deleter, item)
+                if planned_delete is not None:
+                    future.add_done_callback(partial(on_delete_done, planned_delete))
+
+    if len(journalled) > 0:
+        delete_journal.record(accepted, DeleteState.CONFIRMED)
+        delete_journal.forget(failed)
+    if len(to_delete) > 0:
+        _logger.info(f"{len(to_delete)} item(s) deleted")
+        _logger.debug(f"Deleted items: {[create_human_identifier(item, True) for (item, _), _ in to_delete]}")
+    not_deleted = len(delete_queue) + len(waiting)
+    if not_deleted > 0:
+        _logger.info(f"{not_deleted} item(s) not deleted as the limit of {max_deletes} deletes per run has been "
+                     f"reached")
+
+
+def execute_streaming_clean_up(configuration: Configuration, tracker: Tracker, dry_run: bool=True,
+                               decision_listener: DecisionListener=None, manager_cache: ManagerCache=None,
+                               page_size: int=DEFAULT_PAGE_SIZE, instance_index: InstanceIndex=None,
+                               filter_listings: bool=False):
+    """
+    Cleans up based on the given configuration without holding a complete plan in memory: items are listed a page at a
+    time, the tracker is synchronised a page at a time and items are deleted as soon as they are decided to be, so
+    memory use is bounded by the page size rather than by the number of items in a tenant. Only the items being
+    deleted and the instances marked for deletion (which images and key-pairs may depend on) are retained.
+    :param configuration: the clean-up configuration
+    :param tracker: OpenStack item tracker
+    :param dry_run: will not delete anything if `True`
+    :param decision_listener: called with each decision as it is made (must be thread-safe if multiple tenants are
+    cleaned up simultaneously)
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param page_size: the number of items to list at a time
+    :param instance_index: index of the instances in all of the tenants that are cleaned up, used to find the instances
+    that are using images and key-pairs (created from the tenants in the given configuration if `None`)
+    :param filter_listings: see `create_clean_up_plan`
+    """
+    max_simultaneous_deletes = configuration.general_configuration.max_simultaneous_deletes
+    now = datetime.now()
+    if instance_index is None:
+        instance_index = create_instance_index(configuration, manager_cache)
+    # Bounds the number of deletes that are waiting to be executed, so that listing does not outpace deleting
+    pending_deletes = Semaphore(2 * max_simultaneous_deletes)
+
+    with ThreadPoolExecutor(max_simultaneous_deletes) as delete_executor:
+        def delete(item: OpenstackItem, manager: Manager):
+            pending_deletes.acquire()
+            future: Future = delete_executor.submit(_create_delete(manager), item)
+            future.add_done_callback(lambda _: pending_deletes.release())
+
+        with ThreadPoolExecutor(configuration.general_configuration.max_simultaneous_tenants) as tenant_executor:
+            list(tenant_executor.map(lambda clean_up_configuration: _execute_streaming_tenant_clean_up(
+                clean_up_configuration, tracker, None if dry_run else delete, decision_listener, manager_cache,
+                page_size, instance_index, filter_listings, now), configuration.clean_up_configurations))
+
+
+def _execute_streaming_tenant_clean_up(clean_up_configuration: CleanUpConfiguration, tracker: Tracker,
+                                       delete: Optional[Callable[[OpenstackItem, Manager], None]],
+                                       decision_listener: Optional[DecisionListener],
+                                       manager_cache: Optional[ManagerCache], page_size: int,
+                                       instance_index: InstanceIndex, filter_listings: bool=False,
+                                       now: datetime=None):
+    """
+    Cleans up the tenant with the given clean-up configuration, a page of items at a time.
+    :param clean_up_configuration: the tenant's clean-up configuration
+    :param tracker: OpenStack item tracker
+    :param delete: called to delete each item that is to be deleted, with the item's manager (nothing is deleted if
+    `None`)
+    :param decision_listener: called with each decision as it is made
+    :param manager_cache: cache of managers to reuse (new managers are created if `None`)
+    :param page_size: the number of items to list at a time
+    :param instance_index: index of the instances in the tenants that are cleaned up, passed to the detectors
+    :param filter_listings: see `create_clean_up_plan`
+    :param now: the time that the ages of items are measured at (the current time if `None`)
+    """
+    already_marked_for_deletion: Set[OpenstackItem] = set()
+    if now is None:
+        now = datetime.now()
+
+    for manager_type, policy in sort_clean_up_areas(clean_up_configuration.areas.items()):
+        is_owned_by_user = manager_type == OpenstackKeypairManager
+        credentials_to_use = [clean_up_configuration.credentials[0]] if not is_owned_by_user \
+            else clean_up_configuration.credentials
+
+        for credentials in credentials_to_use:
+            manager = manager_cache.get(manager_type, credentials) if manager_cache is not None \
+                else manager_type(credentials)
+            partition_tracker = tracker.get_partition(create_partition_key(credentials, include_user=is_owned_by_user))
+            synchronisation = partition_tracker.create_synchronisation(manager.item_type)
+            listing_filter = get_area_listing_filter(manager, policy) if filter_listings else None
+            number_marked_for_deletion = 0
+            number_not_marked_for_deletion = 0
+            area_tracker = partition_tracker.get_snapshot(now)
+
+            for items in manager.iterate_all(page_size, listing_filter):
+                synchronisation.add(items)
+                # Only the created times of the page's items are fetched from the tracker, in a single query
+                area_tracker.fetch(manager.item_type, [item.identifier for item in items])
+                for item in items:
+                    to_delete, _ = _decide(item, manager, policy, area_tracker,
+                                           already_marked_for_deletion, decision_listener, instance_index, now)
+                    if not to_delete:
+                        number_not_marked_for_deletion += 1
+                        continue
+                    number_marked_for_deletion += 1
+                    if isinstance(item, OpenstackInstance):
+                        already_marked_for_deletion.add(item)
+                    if delete is not None:
+                        _logger.info(f"Deleting item {create_human_identifier(item, True)}")
+                        delete(item, manager)
+                    else:
+                        _logger.info(f"Would delete item {create_human_identifier(item, True)}")
 
-    if len(all_delete_setups) > 0:
-        _logger.info(f"{len(all_delete_setups)} item(s) deleted")
-        _logger.debug(f"Deleted items: {[create_human_identifier(item, True) for item, _ in all_delete_setups]}")
+            # Items that were filtered out of the listing have not been seen but may still exist
+            if listing_filter is None:
+                synchronisation.finish()
+            policy.forget_verdicts(credentials, manager.item_type, now)
+            _logger.info(f"{number_marked_for_deletion} {manager.item_type.__name__}(s) marked for deletion and "
+                         f"{number_not_marked_for_deletion} not in tenant \"{credentials.tenant}\"")
 
 
-def create_human_explanation(plans: List[CleanUpPlan], dry_run: bool=True) -> str:
+def create_human_explanation(plans: List[CleanUpPlan], dry_run: bool=True,
+                             not_deleted_detail: NotDeletedDetail=NotDeletedDetail.ALL,
+                             not_deleted_sample_size: int=DEFAULT_NOT_DELETED_SAMPLE_SIZE) -> str:
     """
-    Creates a human readable explanation of the given cleanup plans.
+    Creates a human readable explanation of the given cleanup plans. `write_human_explanation` should be preferred for
+    large plans.
     :param plans: the plans to explain
     :param dry_run: whether executing a dry run
+    :param not_deleted_detail: how much detail to give about items that are not to be deleted
+    :param not_deleted_sample_size: number of items not to be deleted to explain if sampling
     :return: human readable explanation
     """
+    return "\n".join(generate_human_explanation(plans, dry_run, not_deleted_detail, not_deleted_sample_size))
+
+
+def write_human_explanation(plans: List[CleanUpPlan], sink: Callable[[str], None], dry_run: bool=True,
+                            not_deleted_detail: NotDeletedDetail=NotDeletedDetail.ALL,
+                            not_deleted_sample_size: int=DEFAULT_NOT_DELETED_SAMPLE_SIZE):
+    """
+    Writes a human readable explanation of the given cleanup plans to the given sink, line by line.
+    :param plans: the plans to explain
+    :param sink: the sink to write each line to (e.g. a logging method)
+    :param dry_run: whether executing a dry run
+    :param not_deleted_detail: how much detail to give about items that are not to be deleted
+    :param not_deleted_sample_size: number of items not to be deleted to explain if sampling
+    """
+    for line in generate_human_explanation(plans, dry_run, not_deleted_detail, not_deleted_sample_size):
+        sink(line)
+
+
+def generate_human_explanation(plans: List[CleanUpPlan], dry_run: bool=True,
+                               not_deleted_detail: NotDeletedDetail=NotDeletedDetail.ALL,
+                               not_deleted_sample_size: int=DEFAULT_NOT_DELETED_SAMPLE_SIZE) -> Iterator[str]:
+    """
+    Generates the lines of a human readable explanation of the given cleanup plans.
+    :param plans: the plans to explain
+    :param dry_run: whether executing a dry run
+    :param not_deleted_detail: how much detail to give about items that are not to be deleted
+    :param not_deleted_sample_size: number of items not to be deleted to explain if sampling
+    :return: generator of the explanation's lines
+    """
     delete_action = "Deleting" if not dry_run else "Would delete"
     not_delete_action = "Not deleting" if not dry_run else "Would not delete"
 
-    lines: List[str] = []
     for i in range(len(plans)):
-        lines.append(f"In cleanup configuration number {i +1}:")
+        yield f"In cleanup configuration number {i +1}:"
         proposal = plans[i]
 
         for manager_type, (delete_setups, marked_for_deletion, not_marked_for_deletion) in proposal.items():
             for item, reasons in marked_for_deletion:
-                lines.append(f"{delete_action} item {create_human_identifier(item, True)} as not prevented: {reasons}")
-            for item, reasons in not_marked_for_deletion:
-                lines.append(f"{not_delete_action} item {create_human_identifier(item, True)} as prevented: {reasons}")
+                yield f"{delete_action} item {create_human_identifier(item, True)} as not prevented: {reasons}"
 
-        lines.append("")
+            explained = not_marked_for_deletion
+            if not_deleted_detail == NotDeletedDetail.SUMMARY:
+                explained = []
+            elif not_deleted_detail == NotDeletedDetail.SAMPLE \
+                    and len(not_marked_for_deletion) > not_deleted_sample_size:
+                explained = [not_marked_for_deletion[j] for j in sorted(
+                    random.sample(range(len(not_marked_for_deletion)), not_deleted_sample_size))]
 
-    return "\n".join(lines)
+            for item, reasons in explained:
+                yield f"{not_delete_action} item {create_human_identifier(item, True)} as prevented: {reasons}"
+            if len(explained) < len(not_marked_for_deletion):
+                yield f"{not_delete_action} {len(not_marked_for_deletion) - len(explained)} " \
+                      f"{'' if len(explained) == 0 else 'other '}item(s) of type " \
+                      f"\"{type(not_marked_for_deletion[0][0]).__name__}\" " \
+                      f"as prevented"
 
+        yield ""
 
-def _create_area_report(manager: Manager, prevent_delete_detectors: Iterable[PreventDeleteDetector], tracker: Tracker,
-                        already_marked_for_deletion: Set[OpenstackItem]) \
-        -> Tuple[List[ItemAndReasons], List[ItemAndReasons]]:
+
+def _create_area_report(manager: Manager, policy: Policy, tracker: Tracker,
+                        already_marked_for_deletion: Set[OpenstackItem], decision_listener: DecisionListener=None,
+                        image_quota: ImageQuotaConfiguration=None, instance_index: InstanceIndex=None,
+                        items: Collection[OpenstackItem]=None, listing_filter: ListingFilter=None,
+                        now: datetime=None) -> Tuple[List[ItemAndReasons], List[ItemAndReasons]]:
     """
     Creates a report of what can be cleaned up in an area controlled by the given manager.
     :param manager: the OpenStack area manager, where the area could be instances, keys, etc.
-    :param prevent_delete_detectors: the detectors that are to be used to determine if an item should not be deleted
+    :param policy: the area's policy, which is used to determine if an item should not be deleted
     :param tracker: OpenStack item tracker
     :param already_marked_for_deletion: OpenStack items already marked for deletion in other reports
+    :param decision_listener: called with the decision on each item as it is made
+    :param image_quota: if set (for an image area), only the images that need to be deleted to stay within this quota
+    are marked for deletion
+    :param instance_index: index of the instances in the tenants that are cleaned up, passed to the detectors
+    :param items: all of the items in the area, if already listed (listed using the manager if `None`)
+    :param listing_filter: filter for OpenStack to apply when listing the items with the manager, in which case items
+    that are not listed are not unregistered from the tracker
+    :param now: the time of the cycle that the report is made in, which allows the policy to reuse the results it
+    remembered in earlier cycles (not reused if `None`)
     :return: tuple where the first item is a list of OpenStack items that have been identified as can be deleted, along 
     with the reasoning for this decision, and the second a list and reasoning of OpenStack items that should not be 
     deleted 
     """
-    items = set(manager.get_all())
-    registered_identifiers = set(tracker.get_registered_identifiers(item_type=manager.item_type))
-
-    new_items = {item for item in items if item.identifier not in registered_identifiers}
-    tracker.register(new_items)
-
-    old_items_identifiers = registered_identifiers - {item.identifier for item in items}
-    tracker.unregister(old_items_identifiers)
+    if items is None and listing_filter is not None:
+        items = manager.get_all(listing_filter)
+        # Items that were filtered out of the listing have not been seen but may still exist
+        tracker.create_synchronisation(manager.item_type).add(items)
+    else:
+        items = set(manager.get_all() if items is None else items)
+        tracker.synchronise(items, manager.item_type)
 
     not_marked_for_deletion: List[ItemAndReasons] = []
     marked_for_deletion: List[ItemAndReasons] = []
 
     for item in items:
-        not_to_delete_reasons: List[str] = []
-        to_delete_reasons: List[str] = []
-
-        for delete_prevent_detector in prevent_delete_detectors:
-            delete_prevented, reason = delete_prevent_detector(
-                item, manager.openstack_credentials, tracker, already_marked_for_deletion)
-            if delete_prevented:
-                not_to_delete_reasons.append(reason)
-            else:
-                to_delete_reasons.append(reason)
-
-        if len(not_to_delete_reasons) > 0:
-            not_marked_for_deletion.append((item, not_to_delete_reasons))
+        # Decisions are only final once images have been selected to stay within quota
+        delete, reasons = _decide(item, manager, policy, tracker, already_marked_for_deletion,
+                                  decision_listener if image_quota is None else None, instance_index, now)
+        if delete:
+            marked_for_deletion.append((item, reasons))
         else:
-            marked_for_deletion.append((item, to_delete_reasons))
+            not_marked_for_deletion.append((item, reasons))
+
+    if image_quota is not None:
+        # Only deleting the images that the tenant owns frees its quota
+        tenant_images = [item for item in items if item.owner == manager.tenant_id]
+        to_delete = select_images_to_free_quota(tenant_images, [
+            item for item, _ in marked_for_deletion if item.owner == manager.tenant_id], image_quota)
+        not_marked_for_deletion += [
+            (item, list(reasons) + ["Not required to be deleted to stay within quota"
+                                    if item.owner == manager.tenant_id
+                                    else "Not owned by the tenant so deleting it does not free the tenant's quota"])
+            for item, reasons in marked_for_deletion if item not in to_delete]
+        marked_for_deletion = [(item, list(reasons) + ["Required to be deleted to stay within quota"])
+                               for item, reasons in marked_for_deletion if item in to_delete]
+        if decision_listener is not None:
+            for item, reasons in marked_for_deletion:
+                _notify(decision_listener, item, manager, tracker, True, reasons, now=now)
+            for item, reasons in not_marked_for_deletion:
+                _notify(decision_listener, item, manager, tracker, False, reasons, now=now)
 
     return marked_for_deletion, not_marked_for_deletion
 
 
-def _create_delete(manager: Manager) -> Callable[[OpenstackItem], None]:
+def _get_planned_delete_invalid_reason(planned_delete: PlannedDelete, item: OpenstackItem,
+                                       instances: Iterable[OpenstackInstance]) -> Optional[str]:
     """
-    Creates a method that will use the given manager to delete a given item.
-    :param manager: the manager that will perform the delete
-    :return: the created method
+    Gets why the given planned delete is no longer valid.
+    :param planned_delete: the planned delete
+    :param item: the current state of the item that is planned to be deleted
+    :param instances: the instances that could be using the item (images can be used by instances in any tenant,
+    key-pairs only by instances in the item's tenant) that are not planned to be deleted
+    :return: the reason why the planned delete is no longer valid or `None` if it is still valid
+    """
+    if create_item_fingerprint(item) != planned_delete.fingerprint:
+        return "Changed since the delete was planned"
+    if isinstance(item, OpenstackImage):
+        users = [instance for instance in instances if instance.image == item.identifier]
+    elif isinstance(item, OpenstackKeypair):
+        users = [instance for instance in instances if instance.key_name == item.name]
+    else:
+        users = []
+    if len(users) > 0:
+        return f"In use by instance(s) {[create_human_identifier(instance) for instance in users]}"
+    return None
+
+
+def _decide(item: OpenstackItem, manager: Manager, policy: Policy, tracker: Tracker,
+            already_marked_for_deletion: Set[OpenstackItem], decision_listener: DecisionListener=None,
+            instance_index: InstanceIndex=None, now: datetime=None) -> Tuple[bool, List[str]]:
+    """
+    Decides whether the given item is to be deleted.
+    :param item: the item
+    :param manager: the manager of the item
+    :param policy: the policy that is to be used to determine if the item should not be deleted
+    :param tracker: OpenStack item tracker
+    :param already_marked_for_deletion: OpenStack items already marked for deletion
+    :param decision_listener: called with the decision
+    :param instance_index: index of the instances in the tenants that are cleaned up, passed to the policy
+    :param now: the time of the current cycle, passed to the policy and used to measure the age of the item that the
+    listener is given
+    :return: tuple where the first item is whether the item is to be deleted and the second the reasons for the
+    decision
+    """
+    decision = policy.evaluate(
+        item, manager.openstack_credentials, tracker, already_marked_for_deletion, instance_index, now)
+    if decision_listener is not None:
+        _notify(decision_listener, item, manager, tracker, decision.delete, decision.reasons, decision.decided_by,
+                decision.eligible_at, now)
+    return decision.delete, decision.reasons
+
+
+def _notify(decision_listener: DecisionListener, item: OpenstackItem, manager: Manager, tracker: Tracker, delete: bool,
+            reasons: List[str], decided_by: str=None, eligible_at: datetime=None, now: datetime=None):
+    """
+    Notifies the given listener of a decision.
+    :param decision_listener: the listener to notify
+    :param item: the item that the decision is on
+    :param manager: the manager of the item
+    :param tracker: OpenStack item tracker
+    :param delete: whether the item is to be deleted
+    :param reasons: the reasons for the decision
+    :param decided_by: name of the policy predicate that prevented the item from being deleted, if any
+    :param eligible_at: when the item becomes eligible for deletion, if known
+    :param now: the time of the cycle that the decision is made in, which the item's age is measured at (the current
+    time if `None`)
     """
-    def delete(to_delete: OpenstackItem):
+    # Uses the created times fetched by a snapshot, rather than querying the tracker for each decision
+    created = tracker.get_created_time(item)
+    if now is None:
+        now = datetime.now()
+    decision_listener(ItemDecision(
+        tenant=manager.openstack_credentials.tenant, item=item,
+        age=now - created if created is not None else None, delete=delete,
+        reasons=reasons, credentials=manager.openstack_credentials, decided_by=decided_by, eligible_at=eligible_at))
+
+
+class _ManagerDelete:
+    """
+    Deletes items using a manager, which is exposed so that the credentials used to delete the items are known.
+    """
+    def __init__(self, manager: Manager):
+        """
+        Constructor.
+        :param manager: the manager that will perform the deletes
+        """
+        self.manager = manager
+
+    def __call__(self, to_delete: OpenstackItem):
         try:
-            assert manager.item_type == type(to_delete)
-            manager.delete(item=to_delete)
+            assert self.manager.item_type == type(to_delete)
+            self.manager.delete(item=to_delete)
         except Exception as e:
             _logger.error(e)
             raise
-    return delete
+
+
+def _create_delete(manager: Manager) -> Callable[[OpenstackItem], None]:
+    """
+    Creates a method that will use the given manager to delete a given item.
+    :param manager: the manager that will perform the delete
+    :return: the created method
+    """
+    return _ManagerDelete(manager)
+
+
+def _get_in_flight_deletes(delete_journal: DeleteJournal) -> Set[JournalKey]:
+    """
+    Gets the deletes in the given journal that are still in progress: those of items that OpenStack carries on deleting
+    after accepting the delete, which were issued within `IN_FLIGHT_EXPIRY` but have not been confirmed.
+    :param delete_journal: the delete journal
+    :return: the keys of the journal entries of the deletes
+    """
+    manager_types = {item_type.__name__: manager_type for item_type, manager_type in ITEM_MANAGER_TYPES.items()}
+    cutoff = datetime.now() - IN_FLIGHT_EXPIRY
+    return {get_journal_key(entry.planned_delete) for entry in delete_journal.get_unconfirmed()
+            if entry.state == DeleteState.ISSUED and entry.updated >= cutoff
+            and manager_types[entry.planned_delete.item_type].DELETES_ASYNCHRONOUSLY}
@@ -0,0 +1,294 @@
+from datetime import timedelta, datetime
+from enum import Enum, unique
+from threading import Lock
+
+from typing import Iterable, Optional, FrozenSet, Type, Set, List, Iterator, Dict, Tuple
+
+from openstacktenantcleaner.common import create_item_fingerprint
+from openstacktenantcleaner.detectors import PreventDeleteDetector, InstanceIndex, ShouldPreventDeleteAndReason
+from openstacktenantcleaner.external.hgicommon.models import Model
+from openstacktenantcleaner.models import OpenstackItem, OpenstackCredentials, ListingFilter, OpenstackIdentifier
+from openstacktenantcleaner.tracking import Tracker
+
+
+@unique
+class PredicateInput(Enum):
+    """
+    Input that a predicate depends on to decide whether an item's delete should be prevented.
+    """
+    # The item's own attributes
+    ITEM = "item"
+    # The item's age, from the tracker
+    AGE = "age"
+    # The instances that may be using the item
+    INSTANCES = "instances"
+    # The decisions already made on items in other areas
+    DECISIONS = "decisions"
+
+
+# Relative cost of getting each input for an item, used to order the evaluation of predicates
+_INPUT_COSTS = {
+    PredicateInput.ITEM: 1,
+    PredicateInput.DECISIONS: 1,
+    PredicateInput.AGE: 10,
+    PredicateInput.INSTANCES: 100
+}
+
+# Inputs that are fingerprinted, or (for age) that change predictably, so that the results of predicates that only
+# depend on them can be reused in later cycles
+_MEMOISABLE_INPUTS = frozenset({PredicateInput.ITEM, PredicateInput.AGE})
+
+
+class Predicate(Model):
+    """
+    Predicate of a policy, which decides whether an item's delete should be prevented using a detector.
+    """
+    def __init__(self, name: str, detector: PreventDeleteDetector, inputs: Iterable[PredicateInput],
+                 item_types: Iterable[Type[OpenstackItem]]=None, listing_filter: ListingFilter=None,
+                 flips_after: timedelta=None):
+        """
+        Constructor.
+        :param name: name of the predicate (e.g. the configuration property that it was compiled from)
+        :param detector: the detector that evaluates the predicate
+        :param inputs: the inputs that the detector depends on
+        :param item_types: the types of item that the predicate applies to (all types if `None`)
+        :param listing_filter: filter that items must pass not to be prevented from deletion by the predicate, which
+        can be applied by OpenStack when listing items (`None` if the predicate cannot be pushed down)
+        :param flips_after: for a predicate that depends on the age of an item, the age after which it stops preventing
+        deletion, so that its result can be reused until then (its result is not reused if `None`)
+        """
+        self.name = name
+        self.detector = detector
+        self.inputs: FrozenSet[PredicateInput] = frozenset(inputs)
+        self.item_types: Optional[FrozenSet[Type[OpenstackItem]]] = \
+            frozenset(item_types) if item_types is not None else None
+        self.listing_filter = listing_filter
+        self.flips_after = flips_after
+
+    @property
+    def cost(self) -> int:
+        """
+        Relative cost of evaluating the predicate for an item.
+        """
+        return max((_INPUT_COSTS[predicate_input] for predicate_input in self.inputs), default=0)
+
+    @property
+    def memoisable(self) -> bool:
+        """
+        Whether the predicate's result for an item can be reused in later cycles, whilst the item is unchanged.
+        """
+        return self.inputs <= _MEMOISABLE_INPUTS \
+            and (PredicateInput.AGE not in self.inputs or self.flips_after is not None)
+
+    def applies_to(self, item: OpenstackItem) -> bool:
+        """
+        Gets whether the predicate applies to the given item.
+        :param item: the item of interest
+        :return: whether the predicate applies
+        """
+        return self.item_types is None or type(item) in self.item_types
+
+
+class PolicyDecision(Model):
+    """
+    Decision made by a policy on whether an item is to be deleted.
+    """
+    def __init__(self, delete: bool, reasons: List[str], decided_by: Optional[str]=None,
+                 eligible_at: Optional[datetime]=None):
+        """
+        Constructor.
+        :param delete: whether the item is to be deleted
+        :param reasons: the reasons for the decision
+        :param decided_by: name of the predicate that prevented the item from being deleted (`None` if it is to be
+        deleted)
+        :param eligible_at: when the predicate that prevented the item from being deleted stops doing so, if that is
+        known (i.e. it depends on the item's age)
+        """
+        self.delete = delete
+        self.reasons = reasons
+        self.decided_by = decided_by
+        self.eligible_at = eligible_at
+
+
+class _Verdicts:
+    """
+    Results of the memoisable predicates of a policy for an item.
+    """
+    def __init__(self, fingerprint: str):
+        """
+        Constructor.
+        :param fingerprint: fingerprint of the item that the results are for
+        """
+        self.fingerprint = fingerprint
+        self.results: Dict[str, ShouldPreventDeleteAndReason] = {}
+        # When the results of predicates that depend on age flip (absent if they never do)
+        self.flip_times: Dict[str, datetime] = {}
+        self.last_used: Optional[datetime] = None
+
+
+# Scope of memoised verdicts: auth URL, tenant and user of the credentials, and the item type
+_VerdictScope = Tuple[str, str, str, str]
+
+
+class Policy:
+    """
+    Compiled clean-up policy of an area: a decision table of predicates, all of which must not prevent an item's delete
+    for the item to be deleted. Predicates are evaluated cheapest first and evaluation stops at the first predicate that
+    prevents the delete. Iterating a policy gives its detectors in evaluation order.
+
+    The results of memoisable predicates are remembered, so that they are not evaluated again for an item that is
+    unchanged (results of age predicates are reused until the time that they flip).
+    """
+    def __init__(self, predicates: Iterable[Predicate]):
+        """
+        Constructor.
+        :param predicates: the policy's predicates
+        """
+        # Sorting is stable, so predicates of the same cost are evaluated in the order given
+        self.predicates: List[Predicate] = sorted(predicates, key=lambda predicate: predicate.cost)
+        self._verdicts: Dict[_VerdictScope, Dict[OpenstackIdentifier, _Verdicts]] = {}
+        self._verdicts_lock = Lock()
+
+    def __iter__(self) -> Iterator[PreventDeleteDetector]:
+        return iter([predicate.detector for predicate in self.predicates])
+
+    def __len__(self) -> int:
+        return len(self.predicates)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({[predicate.name for predicate in self.predicates]})"
+
+    @property
+    def inputs(self) -> Set[PredicateInput]:
+        """
+        The inputs that the policy's predicates depend on.
+        """
+        return {predicate_input for predicate in self.predicates for predicate_input in predicate.inputs}
+
+    @property
+    def listing_filter(self) -> Optional[ListingFilter]:
+        """
+        The filter that items must pass not to be prevented from deletion by any of the policy's predicates.
+        """
+        listing_filters = [predicate.listing_filter for predicate in self.predicates
+                           if predicate.listing_filter is not None]
+        if len(listing_filters) == 0:
+            return None
+        combined = ListingFilter()
+        for listing_filter in listing_filters:
+            if listing_filter.older_than is not None:
+                combined.older_than = max(combined.older_than or listing_filter.older_than, listing_filter.older_than)
+            if listing_filter.protected is not None:
+                combined.protected = listing_filter.protected
+        return combined
+
+    def evaluate(self, item: OpenstackItem, credentials: OpenstackCredentials, tracker: Tracker,
+                 already_marked_for_deletion: Set[OpenstackItem], instance_index: InstanceIndex=None,
+                 now: datetime=None) -> PolicyDecision:
+        """
+        Decides whether the given item is to be deleted. Predicates that do not apply to the item are skipped.
+        :param item: the item of interest
+        :param credentials: credentials to access OpenStack
+        :param tracker: OpenStack item tracker
+        :param already_marked_for_deletion: OpenStack items already marked for deletion
+        :param instance_index: index of the instances in the tenants that are cleaned up
+        :param now: the time of the cycle that the decision is made in, which allows the results of memoisable
+        predicates to be reused (not reused if `None`)
+        :return: the decision, with the reasons of all the predicates if the item is to be deleted, else the reason of
+        the predicate that prevented the delete and, if it depends on the item's age, when it stops doing so
+        """
+        verdicts = self._get_verdicts(item, credentials, now) if now is not None else None
+        reasons: List[str] = []
+        for predicate in self.predicates:
+            if not predicate.applies_to(item):
+                continue
+            result = verdicts.results.get(predicate.name) if verdicts is not None and predicate.memoisable else None
+            flip_time = verdicts.flip_times.get(predicate.name) if result is not None else None
+            if result is None or (flip_time is not None and (now > flip_time) == result[0]):
+                result = predicate.detector(item, credentials, tracker, already_marked_for_deletion, instance_index)
+                if verdicts is not None and predicate.memoisable:
+                    self._memoise(verdicts, predicate, item, tracker, result)
+            delete_prevented, reason = result
+            if delete_prevented:
+                eligible_at = None
+                if predicate.flips_after is not None:
+                    eligible_at = verdicts.flip_times.get(predicate.name) if verdicts is not None else None
+                    if eligible_at is None:
+                        eligible_at = self._get_flip_time(predicate, item, tracker)
+                return PolicyDecision(False, [reason], predicate.name, eligible_at)
+            reasons.append(reason)
+        return PolicyDecision(True, reasons)
+
+    def forget_verdicts(self, credentials: OpenstackCredentials, item_type: Type[OpenstackItem],
+                        not_used_since: datetime):
+        """
+        Forgets the remembered results for items of the given type, accessed with the given credentials, that have not
+        been evaluated since the given time (e.g. as they no longer exist).
+        :param credentials: the credentials
+        :param item_type: the type of the items
+        :param not_used_since: the time (e.g. the start of the current cycle)
+        """
+        with self._verdicts_lock:
+            scope = self._verdicts.get(self._get_scope(credentials, item_type), {})
+            for identifier, verdicts in list(scope.items()):
+                if verdicts.last_used < not_used_since:
+                    del scope[identifier]
+
+    def _get_verdicts(self, item: OpenstackItem, credentials: OpenstackCredentials, now: datetime) -> _Verdicts:
+        """
+        Gets the remembered results of the memoisable predicates for the given item, which are reset if the item has
+        changed.
+        :param item: the item
+        :param credentials: the credentials used to access the item
+        :param now: the time of the current cycle
+        :return: the remembered results
+        """
+        fingerprint = create_item_fingerprint(item)
+        with self._verdicts_lock:
+            scope = self._verdicts.setdefault(self._get_scope(credentials, type(item)), {})
+            verdicts = scope.get(item.identifier)
+            if verdicts is None or verdicts.fingerprint != fingerprint:
+                verdicts = _Verdicts(fingerprint)
+                scope[item.identifier] = verdicts
+        verdicts.last_used = now
+        return verdicts
+
+    @staticmethod
+    def _memoise(verdicts: _Verdicts, predicate: Predicate, item: OpenstackItem, tracker: Tracker,
+                 result: ShouldPreventDeleteAndReason):
+        """
+        Remembers the result of the given memoisable predicate for an item.
+        :param verdicts: the remembered results for the item
+        :param predicate: the predicate
+        :param item: the item
+        :param tracker: OpenStack item tracker, used to find when the results of age predicates flip
+        :param result: the result of the predicate
+        """
+        if predicate.flips_after is not None:
+            flip_time = Policy._get_flip_time(predicate, item, tracker)
+            if flip_time is None:
+                return
+            verdicts.flip_times[predicate.name] = flip_time
+        verdicts.results[predicate.name] = result
+
+    @staticmethod
+    def _get_flip_time(predicate: Predicate, item: OpenstackItem, tracker: Tracker) -> Optional[datetime]:
+        """
+        Gets when the result of the given predicate, which depends on age, flips for an item.
+        :param predicate: the predicate
+        :param item: the item
+        :param tracker: OpenStack item tracker, which holds when the item was created
+        :return: when the result flips (`None` if the item is not tracked)
+        """
+        created = tracker.get_created_time(item)
+        return created + predicate.flips_after if created is not None else None
+
+    @staticmethod
+    def _get_scope(credentials: OpenstackCredentials, item_type: Type[OpenstackItem]) -> _VerdictScope:
+        """
+        Gets the scope of the remembered results for items of the given type, accessed with the given credentials.
+        :param credentials: the credentials
+        :param item_type: the type of the items
+        :return: the scope
+        """
+        return credentials.auth_url, credentials.tenant, credentials.username, item_type.__name__
@@ -0,0 +1,323 @@
+import heapq
+import logging
+import math
+from datetime import timedelta, datetime
+from threading import Lock
+
+from typing import Callable, Dict, Optional, TYPE_CHECKING, Iterable, List, Hashable, Any, Tuple
+
+from openstacktenantcleaner.external.hgicommon.models import Model
+
+if TYPE_CHECKING:
+    from apscheduler.schedulers.base import BaseScheduler
+
+# Runs of a tenant are made more frequent if at least this fraction of its items appeared or disappeared since the
+# previous run...
+HIGH_CHURN = 0.1
+# ...or if at least this fraction of one of its quotas is used
+NEAR_QUOTA_USAGE = 0.8
+
+# A run of a tenant is triggered by the quota watcher if at least this fraction of one of its quotas is used
+DEFAULT_QUOTA_TRIGGER_USAGE = 0.9
+
+# Items that become eligible for deletion within the same slot of this length are revalidated together
+DEFAULT_ELIGIBILITY_RESOLUTION = timedelta(minutes=1)
+DEFAULT_ELIGIBILITY_JOB_ID = "eligibility"
+
+_SPEED_UP_FACTOR = 0.5
+_SLOW_DOWN_FACTOR = 1.5
+
+_logger = logging.getLogger(__name__)
+
+
+class RunStatistics(Model):
+    """
+    Statistics about a run, used to decide when to next run.
+    """
+    def __init__(self, churn: Optional[float]=None, quota_usage: Optional[float]=None, duration: timedelta=None):
+        """
+        Constructor.
+        :param churn: fraction of items that appeared or disappeared since the previous run (`None` if unknown)
+        :param quota_usage: fraction of the most used quota that is used (`None` if unknown)
+        :param duration: how long the run took
+        """
+        self.churn = churn
+        self.quota_usage = quota_usage
+        self.duration = duration
+
+
+def calculate_run_period(current_period: timedelta, statistics: RunStatistics, min_period: timedelta,
+                         max_period: timedelta) -> timedelta:
+    """
+    Calculates how long to wait until the next run, given statistics about the last run. The period is shortened if
+    there is high churn or a quota is nearly used up, and lengthened if nothing has changed. It is never shorter than
+    the last run took, so that runs are not missed.
+    :param current_period: the current period between runs
+    :param statistics: statistics about the last run
+    :param min_period: the minimum period between runs
+    :param max_period: the maximum period between runs
+    :return: the period to wait until the next run
+    """
+    period = current_period
+    if (statistics.churn is not None and statistics.churn >= HIGH_CHURN) \
+            or (statistics.quota_usage is not None and statistics.quota_usage >= NEAR_QUOTA_USAGE):
+        period = current_period * _SPEED_UP_FACTOR
+    elif statistics.churn == 0:
+        period = current_period * _SLOW_DOWN_FACTOR
+
+    lower_bound = max(min_period, statistics.duration) if statistics.duration is not None else min_period
+    return max(min(period, max_period), min(lower_bound, max_period))
+
+
+class AdaptiveRunScheduler:
+    """
+    Schedules separate runs for each tenant, adapting how often each tenant is run to how much it is changing.
+    """
+    def __init__(self, scheduler: "BaseScheduler", initial_period: timedelta, min_period: timedelta,
+                 max_period: timedelta):
+        """
+        Constructor.
+        :param scheduler: the underlying scheduler, which the runs are added to as jobs
+        :param initial_period: the period between runs before any statistics are known
+        :param min_period: the minimum period between runs
+        :param max_period: the maximum period between runs
+        """
+        self.scheduler = scheduler
+        self.initial_period = initial_period
+        self.min_period = min_period
+        self.max_period = max_period
+        self._periods: Dict[str, timedelta] = {}
+
+    def add(self, name: str, run: Callable[[], RunStatistics]):
+        """
+        Adds the given run, which is to be started immediately then rescheduled after each time it is run.
+        :param name: unique name of the run (e.g. the tenant that it is for)
+        :param run: the run, which returns statistics about itself (its duration is measured by the scheduler)
+        """
+        self._periods[name] = self.initial_period
+        self.scheduler.add_job(self._run, args=(name, run), id=name, trigger="interval",
+                               seconds=self.initial_period.total_seconds(), coalesce=True, max_instances=1,
+                               next_run_time=datetime.now())
+
+    def remove(self, name: str):
+        """
+        Removes the run with the given name.
+        :param name: name of the run
+        """
+        self.scheduler.remove_job(name)
+        del self._periods[name]
+
+    def get_next_run_times(self) -> Dict[str, Optional[datetime]]:
+        """
+        Gets when each run is next scheduled for.
+        :return: map between the name of each run and when it is next scheduled for
+        """
+        return {name: self.scheduler.get_job(name).next_run_time for name in self._periods.keys()}
+
+    def get_run_periods(self) -> Dict[str, timedelta]:
+        """
+        Gets the current period between each run.
+        :return: map between the name of each run and its period
+        """
+        return dict(self._periods)
+
+    def run_now(self, name: str):
+        """
+        Runs the run with the given name as soon as possible, after which it continues to be rescheduled as normal.
+        :param name: name of the run
+        """
+        self.scheduler.modify_job(name, next_run_time=datetime.now())
+
+    def _run(self, name: str, run: Callable[[], RunStatistics]):
+        """
+        Executes the given run then reschedules it.
+        :param name: name of the run
+        :param run: the run
+        """
+        started = datetime.now()
+        statistics = RunStatistics()
+        try:
+            statistics = run()
+        finally:
+            statistics.duration = datetime.now() - started
+            period = calculate_run_period(self._periods[name], statistics, self.min_period, self.max_period)
+            self._periods[name] = period
+            self.scheduler.reschedule_job(name, trigger="interval", seconds=period.total_seconds())
+            _logger.info(f"Next run of \"{name}\" in {period} (at {self.get_next_run_times()[name]})")
+
+
+class QuotaWatcher:
+    """
+    Triggers runs of tenants whose quota usage has crossed a threshold, so that a tenant that fills up between its
+    scheduled runs is cleaned up without waiting for its next run. Each tenant is triggered at most once per debounce
+    period.
+    """
+    def __init__(self, get_quota_usage: Callable[[str], Optional[float]], trigger: Callable[[str], None],
+                 debounce_period: timedelta, threshold: float=DEFAULT_QUOTA_TRIGGER_USAGE):
+        """
+        Constructor.
+        :param get_quota_usage: gets the fraction of the most used quota of the tenant run with the given name that is
+        used (`None` if unknown). Should be cheap, as it is called every check
+        :param trigger: triggers the tenant run with the given name
+        :param debounce_period: the minimum time between triggers of the same tenant run
+        :param threshold: the fraction of a quota that must be used for a run to be triggered
+        """
+        self.get_quota_usage = get_quota_usage
+        self.trigger = trigger
+        self.debounce_period = debounce_period
+        self.threshold = threshold
+        self._last_triggered: Dict[str, datetime] = {}
+
+    def check(self, names: Iterable[str]) -> List[str]:
+        """
+        Checks the quota usage of each of the tenant runs with the given names, triggering those that are over the
+        threshold and have not been triggered within the debounce period.
+        :param names: names of the tenant runs to check
+        :return: names of the tenant runs that were triggered
+        """
+        triggered = []
+        for name in names:
+            last_triggered = self._last_triggered.get(name)
+            if last_triggered is not None and datetime.now() - last_triggered < self.debounce_period:
+                continue
+            quota_usage = self.get_quota_usage(name)
+            if quota_usage is None or quota_usage < self.threshold:
+                continue
+            _logger.info(f"Triggering run of \"{name}\" as {quota_usage:.0%} of a quota is used")
+            self._last_triggered[name] = datetime.now()
+            self.trigger(name)
+            triggered.append(name)
+        return triggered
+
+
+class EligibilityScheduler:
+    """
+    Schedules the revalidation of items at the time that they become eligible for deletion, so that they can be deleted
+    then, rather than at the next run. The upcoming eligibility times are held in a heap and only the earliest is
+    scheduled, as a single job, rounded up to the end of its slot so that items that become eligible close together are
+    revalidated together. Thread-safe.
+    """
+    def __init__(self, scheduler: "BaseScheduler", revalidate: Callable[[List[Any]], None],
+                 resolution: timedelta=DEFAULT_ELIGIBILITY_RESOLUTION, job_id: str=DEFAULT_ELIGIBILITY_JOB_ID):
+        """
+        Constructor.
+        :param scheduler: the underlying scheduler, which the revalidations are added to as jobs
+        :param revalidate: revalidates (and deletes, if still eligible) the given items, which have become eligible
+        :param resolution: the length of the slots that eligibility times are grouped into
+        :param job_id: identifier of the revalidation job in the underlying scheduler
+        """
+        self.scheduler = scheduler
+        self.revalidate = revalidate
+        self.resolution = resolution
+        self.job_id = job_id
+        self._eligible: Dict[Hashable, Tuple[datetime, Any]] = {}
+        # Entries that have since been removed or moved are left in the heap and skipped when they reach the top
+        self._heap: List[Tuple[datetime, int, Hashable]] = []
+        self._counter = 0
+        self._scheduled_for: Optional[datetime] = None
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._eligible)
+
+    def add(self, key: Hashable, eligible_at: Optional[datetime], item: Any):
+        """
+        Adds the given item, which becomes eligible at the given time, replacing any item with the same key. The item is
+        not revalidated until `reschedule` is next called (or a revalidation has run).
+        :param key: unique key of the item (e.g. its type and identifier)
+        :param eligible_at: when the item becomes eligible (the item is removed if `None`)
+        :param item: the item, which is passed to the revalidation when it is eligible
+        """
+        with self._lock:
+            if eligible_at is None:
+                self._eligible.pop(key, None)
+                return
+            existing = self._eligible.get(key)
+            self._eligible[key] = (eligible_at, item)
+            if existing is None or existing[0] != eligible_at:
+                heapq.heappush(self._heap, (eligible_at, self._counter, key))
+                self._counter += 1
+            if len(self._heap) > 2 * len(self._eligible):
+                self._heap = [(entry_eligible_at, i, entry_key)
+                              for i, (entry_key, (entry_eligible_at, _)) in enumerate(self._eligible.items())]
+                heapq.heapify(self._heap)
+                self._counter = len(self._heap)
+
+    def remove(self, key: Hashable):
+        """
+        Removes the item with the given key, if it has been added.
+        :param key: key of the item
+        """
+        self.add(key, None, None)
+
+    def get_next_eligible_time(self) -> Optional[datetime]:
+        """
+        Gets when the next item becomes eligible.
+        :return: the next eligibility time (`None` if there are no items)
+        """
+        with self._lock:
+            self._discard_stale()
+            return self._heap[0][0] if len(self._heap) > 0 else None
+
+    def pop_eligible(self, now: datetime=None) -> List[Any]:
+        """
+        Removes and returns the items that are eligible at the given time.
+        :param now: the time (the current time if `None`)
+        :return: the eligible items, in the order that they became eligible
+        """
+        if now is None:
+            now = datetime.now()
+        eligible = []
+        with self._lock:
+            self._discard_stale()
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                _, _, key = heapq.heappop(self._heap)
+                eligible.append(self._eligible.pop(key)[1])
+                self._discard_stale()
+        return eligible
+
+    def reschedule(self):
+        """
+        Schedules the revalidation job for the end of the slot of the next eligibility time, if it is not already
+        scheduled then.
+        """
+        next_eligible_time = self.get_next_eligible_time()
+        if next_eligible_time is None:
+            if self._scheduled_for is not None and self.scheduler.get_job(self.job_id) is not None:
+                self.scheduler.remove_job(self.job_id)
+            self._scheduled_for = None
+            return
+        resolution = self.resolution.total_seconds()
+        run_time = datetime.fromtimestamp(math.ceil(next_eligible_time.timestamp() / resolution) * resolution)
+        if run_time == self._scheduled_for:
+            return
+        # Revalidations that are late (e.g. as a run was in progress) are still run
+        self.scheduler.add_job(self._run, id=self.job_id, trigger="date", run_date=run_time, replace_existing=True,
+                               misfire_grace_time=None, coalesce=True)
+        self._scheduled_for = run_time
+        _logger.debug(f"{len(self)} item(s) to become eligible for deletion, the next of which is to be revalidated at "
+                      f"{run_time}")
+
+    def _run(self):
+        """
+        Revalidates the items that are eligible, then schedules the next revalidation.
+        """
+        self._scheduled_for = None
+        try:
+            eligible = self.pop_eligible()
+            if len(eligible) > 0:
+                _logger.info(f"Revalidating {len(eligible)} item(s) that have become eligible for deletion")
+                self.revalidate(eligible)
+        finally:
+            self.reschedule()
+
+    def _discard_stale(self):
+        """
+        Discards the entries at the top of the heap that have been removed or moved. Called whilst holding the lock.
+        """
+        while len(self._heap) > 0:
+            eligible_at, _, key = self._heap[0]
+            entry = self._eligible.get(key)
+            if entry is not None and entry[0] == eligible_at:
+                return
+            heapq.heappop(self._heap)
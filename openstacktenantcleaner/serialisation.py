@@ -0,0 +1,116 @@
+import json
+from datetime import datetime
+from threading import Lock
+
+from typing import Dict, Any, TextIO, List
+
+from openstacktenantcleaner.common import create_item_fingerprint
+from openstacktenantcleaner.models import ItemDecision, PlannedDelete
+
+DELETE_VERDICT = "delete"
+KEEP_VERDICT = "keep"
+
+PLAN_FILE_VERSION = 1
+
+
+def decision_to_json(decision: ItemDecision) -> Dict[str, Any]:
+    """
+    Converts the given decision to its JSON representation.
+    :param decision: the decision to convert
+    :return: the JSON representation
+    """
+    return {
+        "tenant": decision.tenant,
+        "type": type(decision.item).__name__,
+        "id": decision.item.identifier,
+        "name": decision.item.name,
+        "age": decision.age.total_seconds() if decision.age is not None else None,
+        "verdict": DELETE_VERDICT if decision.delete else KEEP_VERDICT,
+        "reasons": list(decision.reasons),
+        "decided_by": decision.decided_by
+    }
+
+
+class JsonLinesDecisionWriter:
+    """
+    Writes decisions to a stream as JSON lines, one record per decision, as they are made.
+    """
+    def __init__(self, stream: TextIO):
+        """
+        Constructor.
+        :param stream: the stream to write to (e.g. an open file or a pipe)
+        """
+        self._stream = stream
+        self._lock = Lock()
+
+    def __call__(self, decision: ItemDecision):
+        """
+        Writes the given decision. Thread-safe.
+        :param decision: the decision to write
+        """
+        line = json.dumps(decision_to_json(decision), separators=(",", ":"))
+        with self._lock:
+            self._stream.write(f"{line}\n")
+            self._stream.flush()
+
+
+class PlanFileWriter:
+    """
+    Writes the deletes in plans to a versioned plan file, as they are planned, so that they can be applied later.
+    """
+    def __init__(self, stream: TextIO):
+        """
+        Constructor, which writes the plan file's header.
+        :param stream: the stream to write the plan file to
+        """
+        self._stream = stream
+        self._lock = Lock()
+        self._write({"version": PLAN_FILE_VERSION, "created": datetime.now().isoformat()})
+
+    def __call__(self, decision: ItemDecision):
+        """
+        Writes the given decision if it is to delete the item. Thread-safe.
+        :param decision: the decision
+        """
+        if decision.delete:
+            self._write({
+                "auth_url": decision.credentials.auth_url,
+                "tenant": decision.credentials.tenant,
+                "username": decision.credentials.username,
+                "type": type(decision.item).__name__,
+                "id": decision.item.identifier,
+                "name": decision.item.name,
+                "fingerprint": create_item_fingerprint(decision.item)
+            })
+
+    def _write(self, record: Dict[str, Any]):
+        """
+        Writes the given record as a line.
+        :param record: the record to write
+        """
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._stream.write(f"{line}\n")
+            self._stream.flush()
+
+
+def read_plan_file(stream: TextIO) -> List[PlannedDelete]:
+    """
+    Reads the planned deletes from a plan file written by `PlanFileWriter`.
+    :param stream: the stream to read the plan file from
+    :return: the planned deletes
+    :raises ValueError: if the plan file is not of a supported version
+    """
+    header = json.loads(stream.readline() or "{}")
+    if header.get("version") != PLAN_FILE_VERSION:
+        raise ValueError(f"Unsupported plan file version: {header.get('version')} (expected {PLAN_FILE_VERSION})")
+    planned_deletes: List[PlannedDelete] = []
+    for line in stream:
+        if line.strip() == "":
+            continue
+        record = json.loads(line)
+        planned_deletes.append(PlannedDelete(
+            auth_url=record["auth_url"], tenant=record["tenant"], username=record["username"],
+            item_type=record["type"], identifier=record["id"], name=record["name"],
+            fingerprint=record["fingerprint"]))
+    return planned_deletes
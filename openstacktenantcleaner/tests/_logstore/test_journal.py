@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from openstacktenantcleaner._logstore.journal import LogDeleteJournal
+from openstacktenantcleaner.journal import DeleteState, create_planned_delete
+from openstacktenantcleaner.models import OpenstackCredentials, OpenstackImage, OpenstackKeypair
+
+
+class TestLogDeleteJournal(unittest.TestCase):
+    """
+    Tests for `LogDeleteJournal`.
+    """
+    def setUp(self):
+        file_handle, self.log_location = tempfile.mkstemp()
+        os.close(file_handle)
+        self.journal = LogDeleteJournal(self.log_location)
+        credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+        self.image_delete = create_planned_delete(OpenstackImage(identifier="1", name="image"), credentials)
+        self.key_pair_delete = create_planned_delete(OpenstackKeypair(identifier="2", name="key-pair"), credentials)
+
+    def tearDown(self):
+        self.journal.close()
+        os.remove(self.log_location)
+
+    def test_get_unconfirmed(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.record([self.image_delete], DeleteState.ISSUED)
+        self.journal.record([self.key_pair_delete], DeleteState.CONFIRMED)
+        unconfirmed = self.journal.get_unconfirmed()
+        self.assertEqual([(self.image_delete, DeleteState.ISSUED)],
+                         [(entry.planned_delete, entry.state) for entry in unconfirmed])
+
+    def test_forget(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.forget([self.image_delete])
+        self.assertEqual([self.key_pair_delete], [entry.planned_delete for entry in self.journal.get_unconfirmed()])
+
+    def test_rebuilt_when_reopened(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.ISSUED)
+        self.journal.record([self.key_pair_delete], DeleteState.CONFIRMED)
+        self.journal.close()
+        self.journal = LogDeleteJournal(self.log_location)
+        self.assertEqual([self.image_delete], [entry.planned_delete for entry in self.journal.get_unconfirmed()])
+
+    def test_partial_record_truncated_when_reopened(self):
+        self.journal.record([self.image_delete], DeleteState.INTENT)
+        self.journal.close()
+        with open(self.log_location, "ab") as file:
+            file.write(b"\x00\x01")
+        self.journal = LogDeleteJournal(self.log_location)
+        self.journal.record([self.key_pair_delete], DeleteState.INTENT)
+        self.journal.close()
+        self.journal = LogDeleteJournal(self.log_location)
+        self.assertEqual({self.image_delete, self.key_pair_delete},
+                         {entry.planned_delete for entry in self.journal.get_unconfirmed()})
+
+    def test_compact(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.record([self.image_delete], DeleteState.CONFIRMED)
+        self.journal.compact()
+        self.journal.close()
+        self.journal = LogDeleteJournal(self.log_location)
+        self.assertEqual([self.key_pair_delete], [entry.planned_delete for entry in self.journal.get_unconfirmed()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from openstacktenantcleaner._logstore.tracking import LogTracker, RecordLog
+from openstacktenantcleaner.models import OpenstackKeypair, OpenstackImage, OpenstackInstance
+
+
+class TestLogTracker(unittest.TestCase):
+    """
+    Tests for `LogTracker`.
+    """
+    def setUp(self):
+        file_handle, self.log_location = tempfile.mkstemp()
+        os.close(file_handle)
+        self.tracker = LogTracker(self.log_location)
+
+    def tearDown(self):
+        os.remove(self.log_location)
+
+    def test_get_age_when_does_not_exist(self):
+        item = OpenstackKeypair(identifier="123")
+        self.assertIsNone(self.tracker.get_age(item))
+
+    def test_get_registered_identifiers(self):
+        items = [OpenstackKeypair(identifier="1"), OpenstackImage(identifier="2"), OpenstackInstance(identifier="3")]
+        self.tracker.register(items)
+        registered = self.tracker.get_registered_identifiers()
+        self.assertEqual(set(registered), {item.identifier for item in items})
+
+    def test_get_registered_identifiers_of_type(self):
+        items = {OpenstackKeypair(identifier=str(i)) for i in range(10)}
+        self.tracker.register(items | {OpenstackImage(identifier="image")})
+        registered = self.tracker.get_registered_identifiers(item_type=OpenstackKeypair)
+        self.assertEqual(set(registered), {item.identifier for item in items})
+
+    def test_get_created_before(self):
+        old_item = OpenstackImage(identifier="old", created_at=datetime(2016, 1, 1))
+        new_item = OpenstackImage(identifier="new", created_at=datetime(2018, 1, 1))
+        removed_item = OpenstackImage(identifier="removed", created_at=datetime(2016, 1, 1))
+        self.tracker.register([old_item, new_item, removed_item, OpenstackKeypair(identifier="key-pair")])
+        self.tracker.unregister(removed_item)
+        self.assertEqual({old_item.identifier}, self.tracker.get_created_before(OpenstackImage, datetime(2017, 1, 1)))
+        self.assertEqual(set(), self.tracker.get_created_before(
+            OpenstackImage, datetime(2017, 1, 1), [new_item.identifier]))
+
+    def test_snapshot_is_older_than(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.register(item)
+        snapshot = self.tracker.get_snapshot(datetime(2016, 1, 3))
+        self.assertTrue(snapshot.is_older_than(item, timedelta(days=1)))
+        self.assertFalse(snapshot.is_older_than(item, timedelta(days=2)))
+        self.assertFalse(snapshot.is_older_than(OpenstackImage(identifier="456"), timedelta(0)))
+
+    def test_register_with_created_time(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        start_time = datetime.now()
+        self.tracker.register(item)
+        age = self.tracker.get_age(item)
+        end_time = datetime.now()
+        self.assertGreaterEqual(age, start_time - item.created_at)
+        self.assertLessEqual(age, end_time - item.created_at)
+
+    def test_unregister(self):
+        item = OpenstackKeypair(identifier="123")
+        self.tracker.register(item)
+        self.tracker.unregister(item.identifier, item_type=OpenstackKeypair)
+        self.assertIsNone(self.tracker.get_age(item))
+
+    def test_synchronise(self):
+        old_item, existing_item, new_item = [OpenstackKeypair(identifier=str(i)) for i in range(3)]
+        self.tracker.register([old_item, existing_item])
+        self.tracker.synchronise([existing_item, new_item], OpenstackKeypair)
+        self.assertEqual({existing_item.identifier, new_item.identifier},
+                         set(self.tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+
+    def test_synchronise_in_pages(self):
+        old_item, existing_item, *new_items = [OpenstackKeypair(identifier=str(i)) for i in range(5)]
+        self.tracker.register([old_item, existing_item])
+        existing_item_age = self.tracker.get_age(existing_item)
+
+        synchronisation = self.tracker.create_synchronisation(OpenstackKeypair)
+        synchronisation.add([existing_item, new_items[0]])
+        synchronisation.add(new_items[1:])
+        self.assertIsNotNone(self.tracker.get_age(old_item))
+        synchronisation.finish()
+
+        self.assertEqual({item.identifier for item in [existing_item] + new_items},
+                         set(self.tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+        self.assertGreaterEqual(self.tracker.get_age(existing_item), existing_item_age)
+
+    def test_unregistered_item_keeps_age_when_reappears_within_grace_period(self):
+        item = OpenstackKeypair(identifier="123")
+        self.tracker.register(item)
+        age = self.tracker.get_age(item)
+        self.tracker.synchronise([], OpenstackKeypair)
+        self.assertIsNone(self.tracker.get_age(item))
+        self.tracker.synchronise([item], OpenstackKeypair)
+        self.assertGreaterEqual(self.tracker.get_age(item), age)
+
+    def test_unregistered_item_is_new_when_reappears_after_grace_period(self):
+        self.tracker.grace_period = timedelta(0)
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.register(OpenstackImage(identifier=item.identifier, created_at=datetime(2015, 1, 1)))
+        self.tracker.unregister(item)
+        self.tracker.register(item)
+        self.assertLess(self.tracker.get_age(item), datetime.now() - datetime(2015, 1, 1))
+
+    def test_register_when_concurrently_registered(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.register(item)
+        # Another thread may register the item between `register` checking that it is not registered and registering it
+        self.tracker._register(item, datetime(2017, 1, 1))
+        self.assertEqual({item.identifier}, set(self.tracker.get_registered_identifiers(item_type=OpenstackImage)))
+
+    def test_compact_purges_tombstones_after_grace_period(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(3)]
+        self.tracker.register(items)
+        self.tracker.unregister(items[1:])
+        self.tracker.grace_period = timedelta(0)
+        self.tracker.compact()
+        self.tracker.grace_period = timedelta(days=1)
+        self.tracker.register(items[1])
+        self.assertLess(self.tracker.get_age(items[1]), self.tracker.get_age(items[0]))
+
+    def test_partitions_are_independent(self):
+        item = OpenstackKeypair(identifier="123")
+        partition_tracker = self.tracker.get_partition("other")
+        partition_tracker.register(item)
+        self.assertIsNone(self.tracker.get_age(item))
+        self.tracker.synchronise([], OpenstackKeypair)
+        self.assertEqual([item.identifier], partition_tracker.get_registered_identifiers())
+
+    def test_index_rebuilt_when_reopened(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        removed_item = OpenstackKeypair(identifier="456")
+        self.tracker.register([item, removed_item])
+        self.tracker.unregister(removed_item)
+
+        tracker = LogTracker(self.log_location)
+        self.assertEqual({item.identifier}, set(tracker.get_registered_identifiers()))
+        self.assertGreater(tracker.get_age(item), datetime.now() - item.created_at - timedelta(seconds=1))
+
+    def test_truncated_record_discarded_when_reopened(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(2)]
+        self.tracker.register(items)
+        with open(self.log_location, "r+b") as file:
+            file.truncate(os.path.getsize(self.log_location) - 1)
+
+        tracker = LogTracker(self.log_location)
+        self.assertEqual({items[0].identifier}, set(tracker.get_registered_identifiers()))
+        tracker.register(items[1])
+        self.assertEqual({item.identifier for item in items},
+                         set(LogTracker(self.log_location).get_registered_identifiers()))
+
+    def test_compact(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(10)]
+        self.tracker.register(items)
+        self.tracker.unregister(items[1:])
+        size_before_compaction = os.path.getsize(self.log_location)
+        self.tracker.compact()
+        self.assertLess(os.path.getsize(self.log_location), size_before_compaction)
+        self.assertEqual([items[0].identifier], LogTracker(self.log_location).get_registered_identifiers())
+
+
+class TestRecordLog(unittest.TestCase):
+    """
+    Tests for `RecordLog`.
+    """
+    def setUp(self):
+        file_handle, self.log_location = tempfile.mkstemp()
+        os.close(file_handle)
+
+    def tearDown(self):
+        os.remove(self.log_location)
+
+    def test_compacts_automatically(self):
+        log = RecordLog(self.log_location, compaction_ratio=2, minimum_records_to_compact=4)
+        for i in range(3):
+            log.append([dict(op="r", tenant="", type="OpenstackKeypair", identifier="1", created=i)])
+        self.assertEqual(3, self._count_records())
+        log.append([dict(op="r", tenant="", type="OpenstackKeypair", identifier="1", created=3)])
+        self.assertEqual(1, self._count_records())
+        self.assertEqual({("", "OpenstackKeypair"): {"1": (3, None)}}, RecordLog(self.log_location).index)
+
+    def _count_records(self) -> int:
+        with open(self.log_location, "rb") as file:
+            return len(list(RecordLog._read(file)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from openstacktenantcleaner._sqlalchemy.journal import SqlDeleteJournal
+from openstacktenantcleaner.external.sequencescape.stub_database import create_stub_database
+from openstacktenantcleaner.journal import DeleteState, create_planned_delete
+from openstacktenantcleaner.models import OpenstackCredentials, OpenstackImage, OpenstackKeypair
+
+
+class TestSqlDeleteJournal(unittest.TestCase):
+    """
+    Tests for `SqlDeleteJournal`.
+    """
+    def setUp(self):
+        database_location, dialect = create_stub_database()
+        self.journal = SqlDeleteJournal(f"{dialect}:///{database_location}")
+        credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+        self.image_delete = create_planned_delete(OpenstackImage(identifier="1", name="image"), credentials)
+        self.key_pair_delete = create_planned_delete(OpenstackKeypair(identifier="2", name="key-pair"), credentials)
+
+    def test_get_unconfirmed(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.record([self.image_delete], DeleteState.ISSUED)
+        self.journal.record([self.key_pair_delete], DeleteState.CONFIRMED)
+        unconfirmed = self.journal.get_unconfirmed()
+        self.assertEqual([(self.image_delete, DeleteState.ISSUED)],
+                         [(entry.planned_delete, entry.state) for entry in unconfirmed])
+
+    def test_forget(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.forget([self.image_delete])
+        self.assertEqual([self.key_pair_delete], [entry.planned_delete for entry in self.journal.get_unconfirmed()])
+
+    def test_compact(self):
+        self.journal.record([self.image_delete, self.key_pair_delete], DeleteState.INTENT)
+        self.journal.record([self.image_delete], DeleteState.CONFIRMED)
+        self.journal.compact()
+        self.journal.record([self.key_pair_delete], DeleteState.CONFIRMED)
+        self.assertEqual([], self.journal.get_unconfirmed())
+
+
+if __name__ == "__main__":
+    unittest.main()
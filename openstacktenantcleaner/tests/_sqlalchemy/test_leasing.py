@@ -0,0 +1,58 @@
+import unittest
+from datetime import datetime, timedelta
+
+from openstacktenantcleaner._sqlalchemy.leasing import SqlLeaseStore
+from openstacktenantcleaner.external.sequencescape.stub_database import create_stub_database
+
+_NOW = datetime(2018, 1, 1)
+_LATER = _NOW + timedelta(minutes=1)
+_EXPIRES = _NOW + timedelta(minutes=2)
+
+
+class TestSqlLeaseStore(unittest.TestCase):
+    """
+    Tests for `SqlLeaseStore`.
+    """
+    def setUp(self):
+        database_location, dialect = create_stub_database()
+        self.lease_store = SqlLeaseStore(f"{dialect}:///{database_location}")
+
+    def test_get_live_nodes(self):
+        self.lease_store.heartbeat("node-1", _NOW, _LATER)
+        self.lease_store.heartbeat("node-2", _NOW, _EXPIRES)
+        self.assertEqual({"node-1", "node-2"}, self.lease_store.get_live_nodes(_NOW))
+        self.assertEqual({"node-2"}, self.lease_store.get_live_nodes(_LATER))
+
+    def test_acquire_when_free(self):
+        self.assertTrue(self.lease_store.acquire("tenant", "node-1", _NOW, _EXPIRES))
+        self.assertEqual({"tenant": "node-1"}, self.lease_store.get_owners(_NOW))
+
+    def test_acquire_when_held_by_other_node(self):
+        self.lease_store.acquire("tenant", "node-1", _NOW, _EXPIRES)
+        self.assertFalse(self.lease_store.acquire("tenant", "node-2", _LATER, _LATER + timedelta(minutes=2)))
+        self.assertEqual({"tenant": "node-1"}, self.lease_store.get_owners(_LATER))
+
+    def test_acquire_when_expired(self):
+        self.lease_store.acquire("tenant", "node-1", _NOW, _LATER)
+        self.assertTrue(self.lease_store.acquire("tenant", "node-2", _LATER, _EXPIRES))
+        self.assertEqual({"tenant": "node-2"}, self.lease_store.get_owners(_LATER))
+
+    def test_renew(self):
+        self.lease_store.acquire("held", "node-1", _NOW, _EXPIRES)
+        self.lease_store.acquire("expired", "node-1", _NOW, _LATER)
+        self.lease_store.acquire("other", "node-2", _NOW, _EXPIRES)
+        renewed = self.lease_store.renew({"held", "expired", "other"}, "node-1", _LATER, _LATER + timedelta(minutes=2))
+        self.assertEqual({"held"}, renewed)
+        self.assertEqual({"held": "node-1", "other": "node-2"}, self.lease_store.get_owners(_LATER))
+
+    def test_leave(self):
+        self.lease_store.heartbeat("node-1", _NOW, _EXPIRES)
+        self.lease_store.acquire("tenant-1", "node-1", _NOW, _EXPIRES)
+        self.lease_store.acquire("tenant-2", "node-2", _NOW, _EXPIRES)
+        self.lease_store.leave("node-1")
+        self.assertEqual(set(), self.lease_store.get_live_nodes(_NOW))
+        self.assertEqual({"tenant-2": "node-2"}, self.lease_store.get_owners(_NOW))
+
+
+if __name__ == "__main__":
+    unittest.main()
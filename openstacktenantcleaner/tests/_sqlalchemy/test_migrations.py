@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from openstacktenantcleaner._sqlalchemy.migrations import migrate, get_schema_version, SCHEMA_VERSION, \
+    LEGACY_SCHEMA_VERSION
+from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
+from openstacktenantcleaner.models import OpenstackKeypair, OpenstackImage
+
+
+class TestMigrate(unittest.TestCase):
+    """
+    Tests for `migrate`.
+    """
+    def setUp(self):
+        file_handle, self.database_file = tempfile.mkstemp()
+        os.close(file_handle)
+        os.remove(self.database_file)
+        self.database_location = f"sqlite:///{self.database_file}"
+        self.engine = create_engine(self.database_location)
+
+    def tearDown(self):
+        self.engine.dispose()
+        if os.path.exists(self.database_file):
+            os.remove(self.database_file)
+
+    def test_migrate_when_no_database(self):
+        self.assertIsNone(migrate(self.database_location))
+        self.assertEqual(SCHEMA_VERSION, get_schema_version(self.engine))
+
+    def test_migrate_when_latest_version(self):
+        migrate(self.database_location)
+        self.assertEqual(SCHEMA_VERSION, migrate(self.database_location))
+        self.assertEqual(SCHEMA_VERSION, get_schema_version(self.engine))
+
+    def test_migrate_from_legacy_schema(self):
+        created = datetime(2017, 1, 1)
+        self.engine.execute("CREATE TABLE Item (id VARCHAR NOT NULL PRIMARY KEY, type VARCHAR(16))")
+        self.engine.execute("CREATE TABLE ItemTracking (id VARCHAR NOT NULL PRIMARY KEY REFERENCES Item (id), "
+                            "created DATETIME)")
+        self.engine.execute("INSERT INTO Item VALUES ('1', 'OpenstackKeypair'), ('2', 'OpenstackImage')")
+        self.engine.execute("INSERT INTO ItemTracking VALUES ('1', ?), ('2', ?)", created, created)
+
+        self.assertEqual(LEGACY_SCHEMA_VERSION, migrate(self.database_location))
+        self.assertEqual(SCHEMA_VERSION, get_schema_version(self.engine))
+
+        tracker = SqlTracker(self.database_location)
+        self.assertEqual(["1"], tracker.get_registered_identifiers(item_type=OpenstackKeypair))
+        self.assertGreater(tracker.get_age(OpenstackImage(identifier="2")), datetime.now() - created - timedelta(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,52 @@
 import unittest
 from datetime import datetime, timedelta
 
+from sqlalchemy.orm import Session
+from typing import Collection, Optional, Type, Dict
+
+from openstacktenantcleaner._sqlalchemy._models import SqlAlchemyTrackedItem
 from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
 from openstacktenantcleaner.external.sequencescape.stub_database import create_stub_database
-from openstacktenantcleaner.models import OpenstackKeypair, OpenstackImage, OpenstackInstance
+from openstacktenantcleaner.models import OpenstackKeypair, OpenstackImage, OpenstackInstance, OpenstackItem, \
+    OpenstackIdentifier
+
+
+class _ConcurrentlyRegisteringSqlTracker(SqlTracker):
+    """
+    SQL tracker that registers an item, as another tracker would concurrently, the first time that it is read which
+    items are registered.
+    """
+    def __init__(self, *args, concurrently_registered: OpenstackItem, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrently_registered: Optional[OpenstackItem] = concurrently_registered
+
+    def get_registered_identifiers(self, item_type: Optional[Type[OpenstackItem]]=None) \
+            -> Collection[OpenstackIdentifier]:
+        registered_identifiers = super().get_registered_identifiers(item_type)
+        if self.concurrently_registered is not None:
+            self._register(self.concurrently_registered, datetime.now())
+            self.concurrently_registered = None
+        return registered_identifiers
+
+
+class _ConflictingSqlTracker(SqlTracker):
+    """
+    SQL tracker whose first synchronisation inserts an item just before inserting the new items, as a concurrent
+    registration of the item would.
+    """
+    def __init__(self, *args, conflicting: OpenstackItem, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conflicting: Optional[OpenstackItem] = conflicting
+
+    def _adopt_unpartitioned(self, session: Session, item_type: Type[OpenstackItem],
+                             identifiers: Collection[OpenstackIdentifier]) -> Dict[OpenstackIdentifier, datetime]:
+        if self.conflicting is not None:
+            session.add(SqlAlchemyTrackedItem(tenant=self._partition, type=item_type.__name__,
+                                              identifier=self.conflicting.identifier, created=datetime.now(),
+                                              last_seen=datetime.now()))
+            session.flush()
+            self.conflicting = None
+        return super()._adopt_unpartitioned(session, item_type, identifiers)
 
 
 class TestSqlTracker(unittest.TestCase):
@@ -18,6 +61,149 @@ class TestSqlTracker(unittest.TestCase):
         item = OpenstackKeypair(identifier="123")
         self.assertIsNone(self.tracker.get_age(item))
 
+    def test_synchronise(self):
+        old_item, existing_item, new_item = [OpenstackKeypair(identifier=str(i)) for i in range(3)]
+        other_type_item = OpenstackImage(identifier="4", created_at=datetime(2016, 1, 1))
+        self.tracker.register([old_item, existing_item, other_type_item])
+        existing_item_age = self.tracker.get_age(existing_item)
+
+        self.tracker.synchronise([existing_item, new_item], OpenstackKeypair)
+
+        self.assertEqual({existing_item.identifier, new_item.identifier},
+                         set(self.tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+        self.assertGreaterEqual(self.tracker.get_age(existing_item), existing_item_age)
+        self.assertIsNotNone(self.tracker.get_age(other_type_item))
+
+    def test_synchronise_when_concurrently_registered(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(2)]
+        database_location, dialect = create_stub_database()
+        tracker = _ConcurrentlyRegisteringSqlTracker(f"{dialect}:///{database_location}",
+                                                     concurrently_registered=items[0])
+        tracker.synchronise(items, OpenstackKeypair)
+        self.assertIsNone(tracker.concurrently_registered)
+        self.assertEqual({item.identifier for item in items},
+                         set(tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+
+    def test_synchronise_when_insert_conflicts(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(2)]
+        database_location, dialect = create_stub_database()
+        tracker = _ConflictingSqlTracker(f"{dialect}:///{database_location}", conflicting=items[0])
+        tracker.synchronise(items, OpenstackKeypair)
+        self.assertIsNone(tracker.conflicting)
+        self.assertEqual({item.identifier for item in items},
+                         set(tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+
+    def test_synchronise_in_pages(self):
+        old_item, existing_item, *new_items = [OpenstackKeypair(identifier=str(i)) for i in range(5)]
+        self.tracker.register([old_item, existing_item])
+        existing_item_age = self.tracker.get_age(existing_item)
+
+        synchronisation = self.tracker.create_synchronisation(OpenstackKeypair)
+        synchronisation.add([existing_item, new_items[0]])
+        synchronisation.add(new_items[1:])
+        self.assertIsNotNone(self.tracker.get_age(old_item))
+        synchronisation.finish()
+
+        self.assertEqual({item.identifier for item in [existing_item] + new_items},
+                         set(self.tracker.get_registered_identifiers(item_type=OpenstackKeypair)))
+        self.assertGreaterEqual(self.tracker.get_age(existing_item), existing_item_age)
+
+    def test_unregistered_item_keeps_age_when_reappears_within_grace_period(self):
+        item = OpenstackKeypair(identifier="123")
+        self.tracker.register(item)
+        age = self.tracker.get_age(item)
+        self.tracker.synchronise([], OpenstackKeypair)
+        self.assertIsNone(self.tracker.get_age(item))
+        self.tracker.synchronise([item], OpenstackKeypair)
+        self.assertGreaterEqual(self.tracker.get_age(item), age)
+
+    def test_unregistered_item_is_new_when_reappears_after_grace_period(self):
+        self.tracker.grace_period = timedelta(0)
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.register(OpenstackImage(identifier=item.identifier, created_at=datetime(2015, 1, 1)))
+        self.tracker.unregister(item)
+        self.tracker.register(item)
+        self.assertLess(self.tracker.get_age(item), datetime.now() - datetime(2015, 1, 1))
+
+    def test_synchronise_revives_tombstones_amongst_many_new_items(self):
+        revived = [OpenstackImage(identifier=str(i), created_at=datetime(2016, 1, 1)) for i in range(10)]
+        self.tracker.synchronise(revived, OpenstackImage)
+        self.tracker.synchronise([], OpenstackImage)
+        items = revived + [OpenstackImage(identifier=str(i), created_at=datetime(2018, 1, 1)) for i in range(10, 1200)]
+        self.tracker.synchronise(items, OpenstackImage)
+        self.assertEqual({item.identifier for item in items},
+                         set(self.tracker.get_registered_identifiers(item_type=OpenstackImage)))
+        self.assertGreater(self.tracker.get_age(revived[0]), datetime.now() - datetime(2017, 1, 1))
+
+    def test_compact_purges_tombstones_after_grace_period(self):
+        items = [OpenstackKeypair(identifier=str(i)) for i in range(3)]
+        self.tracker.register(items)
+        self.tracker.unregister(items[1:])
+        self.tracker.grace_period = timedelta(0)
+        self.tracker.compact()
+        self.tracker.grace_period = timedelta(days=1)
+        self.tracker.register(items[1])
+        self.assertLess(self.tracker.get_age(items[1]), self.tracker.get_age(items[0]))
+
+    def test_partitions_are_independent(self):
+        item = OpenstackKeypair(identifier="123")
+        partition_tracker = self.tracker.get_partition("other")
+        partition_tracker.register(item)
+        self.assertIsNone(self.tracker.get_age(item))
+        self.tracker.synchronise([], OpenstackKeypair)
+        self.assertEqual([item.identifier], partition_tracker.get_registered_identifiers())
+
+    def test_synchronise_adopts_unpartitioned(self):
+        item = OpenstackKeypair(identifier="123")
+        self.tracker.register(item)
+        unpartitioned_age = self.tracker.get_age(item)
+        partition_tracker = self.tracker.get_partition("other")
+        partition_tracker.synchronise([item], OpenstackKeypair)
+        self.assertIsNone(self.tracker.get_age(item))
+        self.assertGreaterEqual(partition_tracker.get_age(item), unpartitioned_age)
+
+    def test_synchronise_with_created_time(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.synchronise([item], OpenstackImage)
+        self.assertGreater(self.tracker.get_age(item), timedelta(days=365))
+
+    def test_get_created_before(self):
+        old_item = OpenstackImage(identifier="old", created_at=datetime(2016, 1, 1))
+        new_item = OpenstackImage(identifier="new", created_at=datetime(2018, 1, 1))
+        removed_item = OpenstackImage(identifier="removed", created_at=datetime(2016, 1, 1))
+        self.tracker.register([old_item, new_item, removed_item, OpenstackKeypair(identifier="key-pair")])
+        self.tracker.unregister(removed_item)
+        self.assertEqual({old_item.identifier}, self.tracker.get_created_before(OpenstackImage, datetime(2017, 1, 1)))
+        self.assertEqual(set(), self.tracker.get_created_before(
+            OpenstackImage, datetime(2017, 1, 1), [new_item.identifier]))
+
+    def test_get_created_times_of_more_identifiers_than_a_query_takes(self):
+        items = [OpenstackImage(identifier=str(i), created_at=datetime(2016, 1, 1)) for i in range(1200)]
+        self.tracker.synchronise(items, OpenstackImage)
+        identifiers = [item.identifier for item in items[::2]] + ["unregistered"]
+        self.assertEqual({item.identifier: datetime(2016, 1, 1) for item in items[::2]},
+                         self.tracker.get_created_times(OpenstackImage, identifiers))
+        self.assertEqual({item.identifier for item in items[::2]},
+                         self.tracker.get_created_before(OpenstackImage, datetime(2017, 1, 1), identifiers))
+
+    def test_snapshot_is_older_than(self):
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.tracker.register(item)
+        snapshot = self.tracker.get_snapshot(datetime(2016, 1, 3))
+        self.assertTrue(snapshot.is_older_than(item, timedelta(days=1)))
+        self.assertFalse(snapshot.is_older_than(item, timedelta(days=2)))
+        self.assertFalse(snapshot.is_older_than(OpenstackImage(identifier="456"), timedelta(0)))
+
+    def test_snapshot_sees_fetched_items(self):
+        snapshot = self.tracker.get_snapshot(datetime(2016, 1, 3))
+        item = OpenstackImage(identifier="123", created_at=datetime(2016, 1, 1))
+        self.assertFalse(snapshot.is_older_than(item, timedelta(days=1)))
+        self.tracker.register([item, OpenstackImage(identifier="456", created_at=datetime(2016, 1, 1))])
+        snapshot.fetch(OpenstackImage, [item.identifier])
+        self.assertTrue(snapshot.is_older_than(item, timedelta(days=1)))
+        self.assertEqual(datetime(2016, 1, 1), snapshot.get_created_time(item))
+        self.assertIsNone(snapshot.get_created_time(OpenstackImage(identifier="456")))
+
     def test_get_registered_identifiers(self):
         items = [OpenstackKeypair(identifier="1"), OpenstackImage(identifier="2"), OpenstackInstance(identifier="3")]
         self.tracker.register(items)
@@ -71,6 +257,16 @@ class TestSqlTracker(unittest.TestCase):
         self.tracker.unregister(item)
         self.assertIsNone(self.tracker.get_age(item))
 
+    def test_unregister_identifier_of_type(self):
+        key_pair, image = OpenstackKeypair(identifier="123"), OpenstackImage(identifier="123")
+        self.tracker.register([key_pair, image])
+        self.tracker.unregister("123", item_type=OpenstackKeypair)
+        self.assertIsNone(self.tracker.get_age(key_pair))
+        self.assertIsNotNone(self.tracker.get_age(image))
+
+    def test_unregister_identifier_without_type(self):
+        self.assertRaises(ValueError, self.tracker.unregister, "123")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 
-from openstacktenantcleaner.common import create_human_identifier, get_absolute_path_relative_to
-from openstacktenantcleaner.models import OpenstackInstance
+from datetime import datetime
+
+from openstacktenantcleaner.common import create_human_identifier, get_absolute_path_relative_to, \
+    create_item_fingerprint, chunk
+from openstacktenantcleaner.models import OpenstackInstance, OpenstackImage
 
 _IDENTIFIER = "my-identifier"
 _NAME = "my-name"
@@ -40,5 +43,33 @@ class TestGetAbsolutePathRelativeTo(unittest.TestCase):
         self.assertEquals("/path/file", get_absolute_path_relative_to("file", "/path/file"))
 
 
+class TestChunk(unittest.TestCase):
+    """
+    Tests for `chunk`.
+    """
+    def test_with_no_values(self):
+        self.assertEqual([], list(chunk([], 2)))
+
+    def test_with_partial_last_chunk(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(chunk(iter(range(5)), 2)))
+
+
+class TestCreateItemFingerprint(unittest.TestCase):
+    """
+    Tests for `create_item_fingerprint`.
+    """
+    def setUp(self):
+        self.item = OpenstackImage(identifier=_IDENTIFIER, name=_NAME, created_at=datetime(2017, 1, 1))
+
+    def test_same_when_unchanged(self):
+        same_item = OpenstackImage(identifier=_IDENTIFIER, name=_NAME, created_at=datetime(2017, 1, 1))
+        self.assertEqual(create_item_fingerprint(self.item), create_item_fingerprint(same_item))
+
+    def test_different_when_changed(self):
+        fingerprint = create_item_fingerprint(self.item)
+        self.item.protected = True
+        self.assertNotEqual(fingerprint, create_item_fingerprint(self.item))
+
+
 if __name__ == "__main__":
     unittest.main()
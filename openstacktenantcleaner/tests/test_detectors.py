@@ -1,7 +1,12 @@
 import unittest
 
-from openstacktenantcleaner.detectors import prevent_delete_protected_image_detector
-from openstacktenantcleaner.models import OpenstackImage, OpenstackCredentials
+from openstacktenantcleaner.detectors import prevent_delete_protected_image_detector, InstanceIndex, \
+    prevent_delete_image_in_use_detector, prevent_delete_key_pair_in_use_detector
+from openstacktenantcleaner.models import OpenstackImage, OpenstackCredentials, OpenstackInstance, OpenstackKeypair
+from openstacktenantcleaner.tracking import create_partition_key
+
+_CREDENTIALS = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+_OTHER_CREDENTIALS = OpenstackCredentials("http://example.com", "other", "user", "password")
 
 
 class TestPreventDeleteProtectedImageDetector(unittest.TestCase):
@@ -17,5 +22,37 @@ class TestPreventDeleteProtectedImageDetector(unittest.TestCase):
         self.assertTrue(prevented)
 
 
+class TestPreventDeleteInUseDetectors(unittest.TestCase):
+    """
+    Tests for `prevent_delete_image_in_use_detector` and `prevent_delete_key_pair_in_use_detector` with an
+    `InstanceIndex`.
+    """
+    def setUp(self):
+        self.image = OpenstackImage(identifier="image")
+        self.key_pair = OpenstackKeypair(identifier="key", name="key")
+        self.instance = OpenstackInstance(
+            identifier="instance", image=self.image.identifier, key_name=self.key_pair.name)
+        self.instance_index = InstanceIndex()
+        self.instance_index.add(create_partition_key(_CREDENTIALS), [])
+        self.instance_index.add(create_partition_key(_OTHER_CREDENTIALS), [self.instance])
+
+    def test_image_in_use_in_other_tenant(self):
+        prevented, _ = prevent_delete_image_in_use_detector(self.image, _CREDENTIALS, None, set(), self.instance_index)
+        self.assertTrue(prevented)
+
+    def test_image_used_by_instance_marked_for_deletion(self):
+        prevented, _ = prevent_delete_image_in_use_detector(
+            self.image, _CREDENTIALS, None, {self.instance}, self.instance_index)
+        self.assertFalse(prevented)
+
+    def test_key_pair_only_in_use_in_own_tenant(self):
+        prevented, _ = prevent_delete_key_pair_in_use_detector(
+            self.key_pair, _CREDENTIALS, None, set(), self.instance_index)
+        self.assertFalse(prevented)
+        prevented, _ = prevent_delete_key_pair_in_use_detector(
+            self.key_pair, _OTHER_CREDENTIALS, None, set(), self.instance_index)
+        self.assertTrue(prevented)
+
+
 if __name__ == "__main__":
     unittest.main()
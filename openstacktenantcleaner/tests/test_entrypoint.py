@@ -0,0 +1,20 @@
+import subprocess
+import sys
+import unittest
+
+_LAZILY_IMPORTED_MODULES = ["apscheduler", "sqlalchemy", "novaclient", "glanceclient", "keystoneclient", "dateutil"]
+
+
+class TestEntrypoint(unittest.TestCase):
+    """
+    Tests for the `entrypoint` module.
+    """
+    def test_heavy_libraries_not_imported_on_start_up(self):
+        imported = subprocess.run(
+            [sys.executable, "-c", "import sys, openstacktenantcleaner.entrypoint; print(' '.join(sys.modules))"],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout.split()
+        self.assertEqual([], [module for module in _LAZILY_IMPORTED_MODULES if module in imported])
+
+
+if __name__ == "__main__":
+    unittest.main()
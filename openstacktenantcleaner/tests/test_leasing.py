@@ -0,0 +1,64 @@
+import unittest
+from datetime import timedelta
+
+from openstacktenantcleaner._sqlalchemy.leasing import SqlLeaseStore
+from openstacktenantcleaner.external.sequencescape.stub_database import create_stub_database
+from openstacktenantcleaner.leasing import ShardCoordinator
+
+_LEASE_DURATION = timedelta(minutes=1)
+
+
+class TestShardCoordinator(unittest.TestCase):
+    """
+    Tests for `ShardCoordinator`.
+    """
+    def setUp(self):
+        database_location, dialect = create_stub_database()
+        self.lease_store = SqlLeaseStore(f"{dialect}:///{database_location}")
+        self.tenants = {f"tenant-{i}" for i in range(7)}
+        self.nodes = [self._create_node(f"node-{i}") for i in range(3)]
+
+    def test_single_node_holds_all_tenants(self):
+        self.nodes[0].heartbeat()
+        self.assertEqual(self.tenants, self.nodes[0].get_owned())
+
+    def test_tenants_shared_between_nodes(self):
+        self._heartbeat_all(self.nodes)
+        self._assert_shared(self.nodes)
+
+    def test_rebalanced_when_node_joins(self):
+        self._heartbeat_all(self.nodes[:2])
+        self._heartbeat_all(self.nodes)
+        self._assert_shared(self.nodes)
+
+    def test_rebalanced_when_node_leaves(self):
+        self._heartbeat_all(self.nodes)
+        self.nodes[2].stop()
+        self._heartbeat_all(self.nodes[:2])
+        self._assert_shared(self.nodes[:2])
+
+    def test_rebalanced_when_tenant_removed(self):
+        self._heartbeat_all(self.nodes)
+        removed = next(iter(self.nodes[0].get_owned()))
+        self.tenants.remove(removed)
+        self._heartbeat_all(self.nodes)
+        self._assert_shared(self.nodes)
+
+    def _create_node(self, name: str) -> ShardCoordinator:
+        return ShardCoordinator(self.lease_store, _LEASE_DURATION, lambda: self.tenants, name)
+
+    def _heartbeat_all(self, nodes):
+        # Nodes only learn of each other on their heartbeats, so rebalancing takes a few rounds
+        for _ in range(3):
+            for node in nodes:
+                node.heartbeat()
+
+    def _assert_shared(self, nodes):
+        shards = [node.get_owned() for node in nodes]
+        self.assertEqual(self.tenants, set.union(*shards))
+        self.assertEqual(len(self.tenants), sum(len(shard) for shard in shards))
+        self.assertLessEqual(max(len(shard) for shard in shards) - min(len(shard) for shard in shards), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+
+from openstacktenantcleaner.managers import ManagerCache, Manager, AllTenantsListing, AdminManagerCache, \
+    OpenstackImageManager
+from openstacktenantcleaner.models import OpenstackCredentials, OpenstackKeypair
+
+_CREDENTIALS = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+_OTHER_CREDENTIALS = OpenstackCredentials("http://example.com", "other", "user", "password")
+
+
+class _NoClientManager(Manager):
+    """
+    Manager that does not connect to OpenStack.
+    """
+    item_type = OpenstackKeypair
+
+    def _get_by_id_raw(self, identifier=None):
+        raise NotImplementedError()
+
+    def __init__(self, openstack_credentials, raw_items=()):
+        super().__init__(openstack_credentials)
+        self.raw_items = list(raw_items)
+        self.number_of_listed_items = 0
+
+    def _get_all_raw(self):
+        for raw_item in self.raw_items:
+            self.number_of_listed_items += 1
+            yield raw_item
+
+    def _convert_raw(self, model):
+        return OpenstackKeypair(identifier=model)
+
+    def _delete(self, item=None):
+        raise NotImplementedError()
+
+
+class TestManager(unittest.TestCase):
+    """
+    Tests for `Manager`.
+    """
+    def test_iterate_all(self):
+        manager = _NoClientManager(_CREDENTIALS, [str(i) for i in range(5)])
+        pages = list(manager.iterate_all(page_size=2))
+        self.assertEqual([["0", "1"], ["2", "3"], ["4"]],
+                         [[item.identifier for item in page] for page in pages])
+
+    def test_iterate_all_lists_next_page_before_returning_page(self):
+        manager = _NoClientManager(_CREDENTIALS, [str(i) for i in range(5)])
+        pages = manager.iterate_all(page_size=2)
+        next(pages)
+        self.assertEqual(4, manager.number_of_listed_items)
+
+
+class TestManagerCache(unittest.TestCase):
+    """
+    Tests for `ManagerCache`.
+    """
+    def setUp(self):
+        self.cache = ManagerCache()
+
+    def test_get_reuses_manager(self):
+        manager = self.cache.get(_NoClientManager, _CREDENTIALS)
+        self.assertEqual(_CREDENTIALS, manager.openstack_credentials)
+        self.assertIs(manager, self.cache.get(_NoClientManager, _CREDENTIALS))
+        self.assertIsNot(manager, self.cache.get(_NoClientManager, _OTHER_CREDENTIALS))
+
+    def test_get_after_expiry(self):
+        self.cache.expiry = timedelta(0)
+        manager = self.cache.get(_NoClientManager, _CREDENTIALS)
+        self.assertIsNot(manager, self.cache.get(_NoClientManager, _CREDENTIALS))
+
+    def test_retain(self):
+        manager = self.cache.get(_NoClientManager, _CREDENTIALS)
+        other_manager = self.cache.get(_NoClientManager, _OTHER_CREDENTIALS)
+        self.cache.retain([_CREDENTIALS])
+        self.assertIs(manager, self.cache.get(_NoClientManager, _CREDENTIALS))
+        self.assertIsNot(other_manager, self.cache.get(_NoClientManager, _OTHER_CREDENTIALS))
+
+
+class _FakeServers:
+    """
+    Nova servers API that pages through the given servers.
+    """
+    def __init__(self, servers):
+        self.servers = servers
+        self.number_of_requests = 0
+
+    def list(self, search_opts=None, limit=None, marker=None):
+        assert search_opts == {"all_tenants": 1}
+        self.number_of_requests += 1
+        start = 0 if marker is None else [server.id for server in self.servers].index(marker) + 1
+        return self.servers[start:start + limit]
+
+
+class TestAllTenantsListing(unittest.TestCase):
+    """
+    Tests for `AllTenantsListing`.
+    """
+    def setUp(self):
+        tenants = [SimpleNamespace(name="tenant", id="1"), SimpleNamespace(name="other", id="2")]
+        self.servers = _FakeServers([SimpleNamespace(id=str(i), tenant_id="1" if i % 2 == 0 else "2")
+                                     for i in range(5)])
+        images = [SimpleNamespace(id="image", owner="2"), SimpleNamespace(id="public-image", owner="3")]
+        self.listing = AllTenantsListing(
+            SimpleNamespace(tenants=SimpleNamespace(list=lambda: tenants)),
+            SimpleNamespace(servers=self.servers),
+            SimpleNamespace(images=SimpleNamespace(list=lambda page_size: images)),
+            page_size=2)
+
+    def test_get_instances(self):
+        self.assertEqual(["0", "2", "4"], [server.id for server in self.listing.get_instances("tenant")])
+        self.assertEqual(["1", "3"], [server.id for server in self.listing.get_instances("other")])
+        self.assertEqual(3, self.servers.number_of_requests)
+
+    def test_get_instances_after_refresh(self):
+        self.listing.get_instances("tenant")
+        self.listing.refresh()
+        self.listing.get_instances("tenant")
+        self.assertEqual(6, self.servers.number_of_requests)
+
+    def test_get_instances_after_refresh_within_max_age(self):
+        self.listing.get_instances("tenant")
+        self.listing.refresh(max_age=timedelta(hours=1))
+        self.listing.get_instances("tenant")
+        self.assertEqual(3, self.servers.number_of_requests)
+
+    def test_get_images(self):
+        self.assertEqual([], self.listing.get_images("tenant"))
+        self.assertEqual(["image"], [image.id for image in self.listing.get_images("other")])
+
+
+class _StubAdminManagerCache(AdminManagerCache):
+    """
+    Admin manager cache whose listings each list a single, new image in the tenant, rather than listing OpenStack.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.number_of_listings = 0
+
+    def _create_listing(self) -> AllTenantsListing:
+        self.number_of_listings += 1
+        tenants = [SimpleNamespace(name=_CREDENTIALS.tenant, id="1")]
+        images = [SimpleNamespace(id=f"image-{self.number_of_listings}", name="image", owner="1", protected=False,
+                                  created_at="2016-01-01T00:00:00Z", updated_at="2016-01-01T00:00:00Z")]
+        return AllTenantsListing(SimpleNamespace(tenants=SimpleNamespace(list=lambda: tenants)), SimpleNamespace(),
+                                 SimpleNamespace(images=SimpleNamespace(list=lambda page_size: images)))
+
+
+class TestAdminManagerCache(unittest.TestCase):
+    """
+    Tests for `AdminManagerCache`.
+    """
+    def setUp(self):
+        self.cache = _StubAdminManagerCache(_CREDENTIALS, expiry=timedelta(hours=1))
+
+    def test_get_reuses_listing(self):
+        manager = self.cache.get(OpenstackImageManager, _CREDENTIALS)
+        self.assertEqual(["image-1"], [image.identifier for image in manager.get_all()])
+        self.assertEqual(["image-1"], [image.identifier for image in manager.get_all()])
+        self.assertEqual(1, self.cache.number_of_listings)
+
+    def test_manager_uses_new_listing_after_expiry(self):
+        manager = self.cache.get(OpenstackImageManager, _CREDENTIALS)
+        manager.get_all()
+        self.cache._listing_created -= self.cache.expiry
+        self.assertIs(manager, self.cache.get(OpenstackImageManager, _CREDENTIALS))
+        self.assertEqual(["image-2"], [image.identifier for image in manager.get_all()])
+
+
+if __name__ == "__main__":
+    unittest.main()
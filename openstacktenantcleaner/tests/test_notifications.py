@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from threading import Event
+
+from openstacktenantcleaner._logstore.tracking import LogTracker
+from openstacktenantcleaner.models import OpenstackInstance, OpenstackImage
+from openstacktenantcleaner.notifications import NotificationConsumer, QueueNotificationSource, Notification, \
+    parse_notification, INSTANCE_CREATED_EVENT, INSTANCE_DELETED_EVENT, IMAGE_CREATED_EVENT, IMAGE_DELETED_EVENT, \
+    NotificationHandler, _handle_message
+
+_TENANT_ID = "tenant-id"
+_PARTITION = "http://example.com#tenant"
+
+
+class TestParseNotification(unittest.TestCase):
+    """
+    Tests for `parse_notification`.
+    """
+    def test_parse(self):
+        notification = parse_notification(json.dumps({"event_type": IMAGE_DELETED_EVENT, "payload": {"id": "123"}}))
+        self.assertEqual(Notification(IMAGE_DELETED_EVENT, {"id": "123"}), notification)
+
+    def test_parse_in_envelope(self):
+        body = {"oslo.version": "2.0", "oslo.message": json.dumps({"event_type": IMAGE_DELETED_EVENT, "payload": {}})}
+        self.assertEqual(IMAGE_DELETED_EVENT, parse_notification(body).event_type)
+
+
+class _StubMessage:
+    """
+    AMQP message that records whether it has been acknowledged.
+    """
+    def __init__(self):
+        self.acknowledged = False
+
+    def ack(self):
+        self.acknowledged = True
+
+
+class TestHandleMessage(unittest.TestCase):
+    """
+    Tests for `_handle_message`.
+    """
+    def test_handle_malformed_message(self):
+        notifications = []
+        message = _StubMessage()
+        _handle_message(notifications.append, "not JSON", message)
+        self.assertEqual([], notifications)
+        self.assertTrue(message.acknowledged)
+
+
+class _FailOnceNotificationSource(QueueNotificationSource):
+    """
+    Queue notification source whose first consumption fails, as if its connection were lost.
+    """
+    def __init__(self):
+        super().__init__()
+        self.failed = False
+
+    def consume(self, handler: NotificationHandler, stop: Event):
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError("Connection lost")
+        super().consume(handler, stop)
+
+
+class TestNotificationConsumer(unittest.TestCase):
+    """
+    Tests for `NotificationConsumer`.
+    """
+    def setUp(self):
+        file_handle, self.log_location = tempfile.mkstemp()
+        os.close(file_handle)
+        self.tracker = LogTracker(self.log_location)
+        self.source = QueueNotificationSource()
+        self.consumer = NotificationConsumer(self.source, self.tracker, {_TENANT_ID: _PARTITION})
+
+    def tearDown(self):
+        self.consumer.stop()
+        os.remove(self.log_location)
+
+    def test_instance_created_and_deleted(self):
+        instance = OpenstackInstance(identifier="123")
+        self.consumer.handle(Notification(INSTANCE_CREATED_EVENT, {
+            "instance_id": instance.identifier, "tenant_id": _TENANT_ID, "created_at": "2017-01-01 00:00:00+00:00"}))
+        partition_tracker = self.tracker.get_partition(_PARTITION)
+        self.assertGreater(partition_tracker.get_age(instance), datetime.now() - datetime(2017, 1, 2))
+        self.consumer.handle(Notification(INSTANCE_DELETED_EVENT, {
+            "instance_id": instance.identifier, "tenant_id": _TENANT_ID}))
+        self.assertIsNone(partition_tracker.get_age(instance))
+
+    def test_other_tenant_ignored(self):
+        self.consumer.handle(Notification(IMAGE_CREATED_EVENT, {"id": "123", "owner": "other"}))
+        self.assertEqual([], self.tracker.get_partition(_PARTITION).get_registered_identifiers())
+
+    def test_consume_from_source(self):
+        self.consumer.start()
+        self.source.queue.put(Notification("unrelated.event", {}))
+        self.source.queue.put(Notification(IMAGE_CREATED_EVENT, {"id": "123", "owner": _TENANT_ID}))
+        self.source.queue.join()
+        self.assertIsNotNone(self.tracker.get_partition(_PARTITION).get_age(OpenstackImage(identifier="123")))
+
+    def test_consume_from_source_after_failure(self):
+        self.consumer.source = source = _FailOnceNotificationSource()
+        self.consumer.start()
+        source.queue.put(Notification(IMAGE_CREATED_EVENT, {"id": "123", "owner": _TENANT_ID}))
+        source.queue.join()
+        self.assertTrue(source.failed)
+        self.assertIsNotNone(self.tracker.get_partition(_PARTITION).get_age(OpenstackImage(identifier="123")))
+
+
+if __name__ == "__main__":
+    unittest.main()
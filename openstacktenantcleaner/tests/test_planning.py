@@ -1,7 +1,24 @@
 import unittest
+from datetime import timedelta, datetime
 
-from openstacktenantcleaner.managers import OpenstackInstanceManager, OpenstackImageManager, OpenstackKeypairManager
-from openstacktenantcleaner.planning import sort_clean_up_areas
+from typing import Collection, Iterable, List, Dict, Set, Type
+
+from openstacktenantcleaner._sqlalchemy.tracking import SqlTracker
+from openstacktenantcleaner.configuration import NotDeletedDetail, DeletePriority, ImageQuotaConfiguration, \
+    Configuration, GeneralConfiguration, CleanUpConfiguration
+from openstacktenantcleaner.journal import DeleteJournal, JournalEntry, JournalKey, DeleteState, get_journal_key, \
+    create_planned_delete
+from openstacktenantcleaner.managers import OpenstackInstanceManager, OpenstackImageManager, OpenstackKeypairManager, \
+    Manager, ITEM_MANAGER_TYPES
+from openstacktenantcleaner.models import OpenstackImage, OpenstackInstance, OpenstackKeypair, OpenstackCredentials, \
+    PlannedDelete, OpenstackItem, ItemDecision
+from openstacktenantcleaner.planning import sort_clean_up_areas, generate_human_explanation, \
+    create_human_explanation, write_human_explanation, DecisionHistory, execute_plans, select_images_to_free_quota, \
+    _create_delete, create_clean_up_plans_from_planned_deletes, InstanceIndexCache, filter_plan_deletes, \
+    _create_area_report
+from openstacktenantcleaner.external.sequencescape.stub_database import create_stub_database
+from openstacktenantcleaner.policies import Policy
+from openstacktenantcleaner.tracking import create_partition_key
 
 
 class TestSortCleanUpAreas(unittest.TestCase):
@@ -26,5 +43,430 @@ class TestSortCleanUpAreas(unittest.TestCase):
         self.assertEquals(OpenstackInstanceManager, ordered[0][0])
 
 
+class TestGenerateHumanExplanation(unittest.TestCase):
+    """
+    Tests for `generate_human_explanation`.
+    """
+    def setUp(self):
+        self.deleted_item = OpenstackImage(identifier="deleted", name="deleted")
+        self.not_deleted_items = [OpenstackImage(identifier=f"not-deleted-{i}", name="not-deleted") for i in range(5)]
+        self.plans = [{OpenstackImageManager: (
+            [], [(self.deleted_item, ["reason"])], [(item, ["reason"]) for item in self.not_deleted_items])}]
+
+    def test_with_all_not_deleted(self):
+        lines = list(generate_human_explanation(self.plans, not_deleted_detail=NotDeletedDetail.ALL))
+        self.assertEqual(1 + 1 + len(self.not_deleted_items) + 1, len(lines))
+        for item in [self.deleted_item] + self.not_deleted_items:
+            self.assertEqual(1, len([line for line in lines if f"\"{item.identifier}\"" in line]))
+
+    def test_with_summary_of_not_deleted(self):
+        lines = list(generate_human_explanation(self.plans, not_deleted_detail=NotDeletedDetail.SUMMARY))
+        self.assertEqual(1 + 1 + 1 + 1, len(lines))
+        self.assertIn(f" {len(self.not_deleted_items)} item(s)", lines[2])
+
+    def test_with_sample_of_not_deleted(self):
+        lines = list(generate_human_explanation(
+            self.plans, not_deleted_detail=NotDeletedDetail.SAMPLE, not_deleted_sample_size=2))
+        self.assertEqual(1 + 1 + 2 + 1 + 1, len(lines))
+        self.assertIn(f" {len(self.not_deleted_items) - 2} other item(s)", lines[4])
+
+    def test_create_and_write_equivalent(self):
+        lines = []
+        write_human_explanation(self.plans, lines.append)
+        self.assertEqual(create_human_explanation(self.plans), "\n".join(lines))
+
+
+class TestDecisionHistory(unittest.TestCase):
+    """
+    Tests for `DecisionHistory`.
+    """
+    def setUp(self):
+        self.history = DecisionHistory()
+        self.items = [OpenstackImage(identifier=str(i), name="image") for i in range(3)]
+
+    def test_first_diff_all_new(self):
+        changed_plans, changes = self.history.diff(*self._create_plans([self.items[0]], self.items[1:]))
+        self.assertEqual(3, changes.new)
+        self.assertEqual(self._create_plans([self.items[0]], self.items[1:])[0], changed_plans)
+
+    def test_diff_when_unchanged_other_than_age(self):
+        self.history.diff(*self._create_plans([], self.items, age=timedelta(minutes=1)))
+        changed_plans, changes = self.history.diff(*self._create_plans([], self.items, age=timedelta(minutes=2)))
+        self.assertEqual(3, changes.unchanged)
+        self.assertEqual([{OpenstackImageManager: ([], [], [])}], changed_plans)
+
+    def test_diff_with_changes(self):
+        self.history.diff(*self._create_plans([], self.items[1:]))
+        self.items[2].protected = True
+        changed_plans, changes = self.history.diff(*self._create_plans(
+            [self.items[1]], [self.items[0]], protected_reason_items=[self.items[2]]))
+        self.assertEqual((1, 1, 0), (changes.new, changes.newly_deletable, changes.unchanged))
+        self.assertEqual((1, 0), (changes.changed, changes.gone))
+        self.assertEqual(2, len(changed_plans[0][OpenstackImageManager][2]))
+
+    def test_diff_when_plans_reordered(self):
+        plans, tenants = self._create_plans([], self.items)
+        other_plans, other_tenants = self._create_plans([], self.items, tenant="other")
+        self.history.diff(plans + other_plans, tenants + other_tenants)
+        _, changes = self.history.diff(other_plans + plans, other_tenants + tenants)
+        self.assertEqual((6, 0, 0), (changes.unchanged, changes.changed, changes.new))
+
+    def _create_plans(self, marked, not_marked, age: timedelta=timedelta(0), protected_reason_items=(),
+                      tenant: str="tenant"):
+        reasons = [f"Item age: {age} - not older than: 7 days, 0:00:00"]
+        return [{OpenstackImageManager: (
+            [], [(item, ["Excludes not matched: []"]) for item in marked],
+            [(item, reasons) for item in not_marked]
+            + [(item, reasons + ["Image is marked on OpenStack as protected"]) for item in protected_reason_items])}], \
+            [tenant]
+
+
+class TestExecutePlans(unittest.TestCase):
+    """
+    Tests for `execute_plans`.
+    """
+    def setUp(self):
+        self.old_image = OpenstackImage(identifier="old-image", created_at=datetime(2016, 1, 1), size=1)
+        self.large_image = OpenstackImage(identifier="large-image", created_at=datetime(2017, 1, 1), size=100)
+        self.instance = OpenstackInstance(identifier="instance", created_at=datetime(2018, 1, 1))
+        self.key_pair = OpenstackKeypair(identifier="key-pair")
+        self.deleted = []
+
+    def test_deletes_oldest_first(self):
+        self._execute(DeletePriority.AGE)
+        self.assertEqual([self.old_image, self.large_image, self.instance, self.key_pair], self.deleted)
+
+    def test_deletes_largest_first(self):
+        self._execute(DeletePriority.SIZE)
+        self.assertEqual([self.large_image, self.old_image, self.instance, self.key_pair], self.deleted)
+
+    def test_deletes_by_quota_impact(self):
+        self._execute(DeletePriority.QUOTA_IMPACT)
+        self.assertEqual([self.instance, self.large_image, self.old_image, self.key_pair], self.deleted)
+
+    def test_deletes_up_to_limit(self):
+        self._execute(DeletePriority.AGE, max_deletes=2)
+        self.assertEqual([self.old_image, self.large_image], self.deleted)
+
+    def test_deletes_up_to_limit_after_instances_using_items(self):
+        self.key_pair.name = "key-pair"
+        self.instance = OpenstackInstance(identifier="user", created_at=datetime(2018, 1, 1),
+                                          image=self.old_image.identifier, key_name=self.key_pair.name)
+        self._execute(DeletePriority.AGE, max_deletes=2)
+        self.assertEqual([self.large_image, self.instance], self.deleted)
+        self.deleted.clear()
+        self._execute(DeletePriority.AGE, max_deletes=3)
+        self.assertEqual([self.large_image, self.instance, self.old_image], self.deleted)
+
+    def _execute(self, delete_priority: DeletePriority, max_deletes: int=None):
+        items = [self.key_pair, self.instance, self.large_image, self.old_image]
+        plans = [{OpenstackImageManager: ([(item, self.deleted.append) for item in items], [], [])}]
+        execute_plans(plans, 1, delete_priority, max_deletes)
+
+
+class _StubKeypairManager(Manager):
+    """
+    Manager of key pairs that records the identifiers of deletes, rather than making them, and fails to delete the key
+    pair with the identifier "fail".
+    """
+    @property
+    def item_type(self):
+        return OpenstackKeypair
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deleted: List[str] = []
+
+    def _get_by_id_raw(self, identifier=None):
+        raise NotImplementedError()
+
+    def _get_all_raw(self):
+        return []
+
+    def _convert_raw(self, model):
+        return model
+
+    def _delete(self, item=None):
+        if item == "fail":
+            raise RuntimeError("Delete failed")
+        self.deleted.append(item)
+
+
+class TestFilterPlanDeletes(unittest.TestCase):
+    """
+    Tests for `filter_plan_deletes`.
+    """
+    def test_removes_deletes_that_cannot_be_made(self):
+        manager = _StubKeypairManager(OpenstackCredentials("http://example.com", "tenant", "user", "password"))
+        other_manager = _StubKeypairManager(OpenstackCredentials("http://example.com", "other", "user", "password"))
+        key_pair = OpenstackKeypair(identifier="key-pair")
+        other_key_pair = OpenstackKeypair(identifier="other-key-pair")
+        marked_for_deletion = [(key_pair, []), (other_key_pair, [])]
+        delete_setups = [(key_pair, _create_delete(manager)), (other_key_pair, _create_delete(other_manager))]
+        plans = [{OpenstackKeypairManager: (delete_setups, marked_for_deletion, [])}]
+        filtered_plans = filter_plan_deletes(plans, lambda credentials: credentials.tenant == "tenant")
+        delete_setups, filtered_marked_for_deletion, _ = filtered_plans[0][OpenstackKeypairManager]
+        self.assertEqual([key_pair], [item for item, _ in delete_setups])
+        self.assertEqual(marked_for_deletion, filtered_marked_for_deletion)
+
+
+class _StubDeleteJournal(DeleteJournal):
+    """
+    In-memory delete journal that records the states that each delete reaches.
+    """
+    def __init__(self):
+        self.entries: Dict[JournalKey, JournalEntry] = {}
+        self.states: Dict[JournalKey, List[DeleteState]] = {}
+
+    def forget(self, planned_deletes: Iterable[PlannedDelete]):
+        for planned_delete in planned_deletes:
+            self.entries.pop(get_journal_key(planned_delete), None)
+
+    def get_unconfirmed(self) -> List[JournalEntry]:
+        return [entry for entry in self.entries.values() if entry.state != DeleteState.CONFIRMED]
+
+    def compact(self):
+        self.entries = {key: entry for key, entry in self.entries.items() if entry.state != DeleteState.CONFIRMED}
+
+    def _write(self, entries: Collection[JournalEntry]):
+        for entry in entries:
+            key = get_journal_key(entry.planned_delete)
+            self.entries[key] = entry
+            self.states.setdefault(key, []).append(entry.state)
+
+
+class TestExecutePlansWithDeleteJournal(unittest.TestCase):
+    """
+    Tests for `execute_plans` when deletes are journalled.
+    """
+    def setUp(self):
+        self.manager = _StubKeypairManager(OpenstackCredentials("http://example.com", "tenant", "user", "password"))
+        self.journal = _StubDeleteJournal()
+
+    def test_deletes_journalled_until_confirmed(self):
+        key_pairs = [OpenstackKeypair(identifier=str(i), name=f"key-pair-{i}") for i in range(5)]
+        plans = [{OpenstackKeypairManager: ([(key_pair, _create_delete(self.manager)) for key_pair in key_pairs],
+                                            [], [])}]
+        execute_plans(plans, 2, delete_journal=self.journal)
+        self.assertCountEqual([key_pair.identifier for key_pair in key_pairs], self.manager.deleted)
+        self.assertEqual([], self.journal.get_unconfirmed())
+        for key_pair in key_pairs:
+            key = get_journal_key(create_planned_delete(key_pair, self.manager.openstack_credentials))
+            self.assertEqual([DeleteState.INTENT, DeleteState.ISSUED, DeleteState.CONFIRMED], self.journal.states[key])
+
+    def test_failed_deletes_forgotten(self):
+        key_pair = OpenstackKeypair(identifier="fail")
+        plans = [{OpenstackKeypairManager: ([(key_pair, _create_delete(self.manager))], [], [])}]
+        execute_plans(plans, 1, delete_journal=self.journal)
+        self.assertEqual({}, self.journal.entries)
+
+
+class _StubListingManager:
+    """
+    Manager that gets items from a fixed collection, rather than from OpenStack.
+    """
+    def __init__(self, items: Iterable[OpenstackItem]):
+        self.items = {item.identifier: item for item in items}
+
+    def get_by_id(self, identifier: str) -> OpenstackItem:
+        return self.items[identifier]
+
+    def get_by_ids(self, identifiers: Iterable[str]) -> Dict[str, OpenstackItem]:
+        return {identifier: self.items[identifier] for identifier in identifiers if identifier in self.items}
+
+    def get_all(self) -> Set[OpenstackItem]:
+        return set(self.items.values())
+
+
+class _StubFetchRecordingManager(_StubListingManager):
+    """
+    Listing manager that records the identifiers of each fetch and cannot fetch items one by one.
+    """
+    def __init__(self, items: Iterable[OpenstackItem], fetched: List[Collection[str]]):
+        super().__init__(items)
+        self.fetched = fetched
+
+    def get_by_id(self, identifier: str) -> OpenstackItem:
+        raise AssertionError(f"Item \"{identifier}\" fetched by its identifier")
+
+    def get_by_ids(self, identifiers: Iterable[str]) -> Dict[str, OpenstackItem]:
+        self.fetched.append(set(identifiers))
+        return super().get_by_ids(identifiers)
+
+
+class _StubManagerCache:
+    """
+    Manager cache that gets stub managers of fixed collections of items in each tenant.
+    """
+    def __init__(self, tenant_items: Dict[str, Iterable[OpenstackItem]]):
+        self.tenant_items = {tenant: list(items) for tenant, items in tenant_items.items()}
+
+    def get(self, manager_type: Type[Manager], credentials: OpenstackCredentials) -> _StubListingManager:
+        return _StubListingManager(item for item in self.tenant_items.get(credentials.tenant, [])
+                                   if ITEM_MANAGER_TYPES[type(item)] == manager_type)
+
+
+class TestCreateCleanUpPlansFromPlannedDeletes(unittest.TestCase):
+    """
+    Tests for `create_clean_up_plans_from_planned_deletes`.
+    """
+    def setUp(self):
+        self.credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+        self.other_credentials = OpenstackCredentials("http://example.com", "other-tenant", "user", "password")
+        self.configuration = Configuration(GeneralConfiguration(), [
+            CleanUpConfiguration([self.credentials]), CleanUpConfiguration([self.other_credentials])])
+        self.image = OpenstackImage(identifier="image", name="image")
+        self.instance = OpenstackInstance(identifier="instance", name="instance", image=self.image.identifier)
+        self.other_tenant_items: List[OpenstackItem] = []
+
+    def test_image_used_by_instance_to_delete_is_deleted(self):
+        planned_deletes = [create_planned_delete(item, self.credentials) for item in (self.image, self.instance)]
+        self.assertCountEqual([self.image, self.instance], self._get_marked_for_deletion(planned_deletes))
+
+    def test_image_used_by_instance_with_invalid_delete_is_not_deleted(self):
+        planned_instance_delete = create_planned_delete(self.instance, self.credentials)
+        planned_instance_delete.fingerprint = "changed"
+        planned_deletes = [create_planned_delete(self.image, self.credentials), planned_instance_delete]
+        self.assertEqual([], self._get_marked_for_deletion(planned_deletes))
+
+    def test_image_used_by_instance_in_other_tenant_is_not_deleted(self):
+        self.other_tenant_items.append(OpenstackInstance(identifier="other", image=self.image.identifier))
+        planned_deletes = [create_planned_delete(item, self.credentials) for item in (self.image, self.instance)]
+        self.assertEqual([self.instance], self._get_marked_for_deletion(planned_deletes))
+
+    def test_item_that_no_longer_exists_is_skipped(self):
+        planned_deletes = [create_planned_delete(OpenstackImage(identifier="gone"), self.credentials)]
+        self.assertEqual([], self._get_marked_for_deletion(planned_deletes))
+
+    def test_items_are_not_fetched_one_by_one(self):
+        other_image = OpenstackImage(identifier="other-image", name="other-image")
+        self.other_tenant_items.append(other_image)
+        planned_deletes = [create_planned_delete(self.image, self.credentials),
+                           create_planned_delete(self.instance, self.credentials),
+                           create_planned_delete(other_image, self.other_credentials)]
+        manager_cache = _StubManagerCache({self.credentials.tenant: [self.image, self.instance],
+                                           self.other_credentials.tenant: self.other_tenant_items})
+        fetched: List[Collection[str]] = []
+        manager_cache.get = lambda manager_type, credentials: _StubFetchRecordingManager(
+            _StubManagerCache.get(manager_cache, manager_type, credentials).items.values(), fetched)
+        plans = create_clean_up_plans_from_planned_deletes(planned_deletes, self.configuration,
+                                                           manager_cache=manager_cache)
+        self.assertCountEqual([self.image, self.instance, other_image], [
+            item for plan in plans for _, marked_for_deletion, _ in plan.values() for item, _ in marked_for_deletion])
+        self.assertCountEqual([{self.image.identifier}, {other_image.identifier}], fetched)
+
+    def _get_marked_for_deletion(self, planned_deletes: List[PlannedDelete]) -> List[OpenstackItem]:
+        plans = create_clean_up_plans_from_planned_deletes(
+            planned_deletes, self.configuration, manager_cache=_StubManagerCache({
+                self.credentials.tenant: [self.image, self.instance],
+                self.other_credentials.tenant: self.other_tenant_items}))
+        return [item for plan in plans for _, marked_for_deletion, _ in plan.values()
+                for item, _ in marked_for_deletion]
+
+
+class TestInstanceIndexCache(unittest.TestCase):
+    """
+    Tests for `InstanceIndexCache`.
+    """
+    def setUp(self):
+        self.credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+        self.other_credentials = OpenstackCredentials("http://example.com", "other-tenant", "user", "password")
+        self.configuration = Configuration(GeneralConfiguration(), [
+            CleanUpConfiguration([self.credentials]), CleanUpConfiguration([self.other_credentials])])
+        self.manager_cache = _StubManagerCache({
+            self.credentials.tenant: [OpenstackInstance(identifier="1")],
+            self.other_credentials.tenant: [OpenstackInstance(identifier="2")]})
+
+    def test_reuses_instances_of_tenants_not_being_run(self):
+        cache = InstanceIndexCache(timedelta(hours=1))
+        cache.get(self.configuration, {create_partition_key(self.credentials)}, self.manager_cache)
+        self.manager_cache.tenant_items = {self.credentials.tenant: [OpenstackInstance(identifier="3")],
+                                           self.other_credentials.tenant: [OpenstackInstance(identifier="4")]}
+        instance_index = cache.get(self.configuration, {create_partition_key(self.credentials)}, self.manager_cache)
+        self.assertEqual({"3"}, {instance.identifier for instance in instance_index.get_instances(
+            create_partition_key(self.credentials))})
+        self.assertEqual({"2"}, {instance.identifier for instance in instance_index.get_instances(
+            create_partition_key(self.other_credentials))})
+
+    def test_lists_all_tenants_when_expired(self):
+        cache = InstanceIndexCache(timedelta(0))
+        cache.get(self.configuration, {create_partition_key(self.credentials)}, self.manager_cache)
+        self.manager_cache.tenant_items[self.other_credentials.tenant] = [OpenstackInstance(identifier="4")]
+        instance_index = cache.get(self.configuration, {create_partition_key(self.credentials)}, self.manager_cache)
+        self.assertEqual({"4"}, {instance.identifier for instance in instance_index.get_instances(
+            create_partition_key(self.other_credentials))})
+
+
+class TestSelectImagesToFreeQuota(unittest.TestCase):
+    """
+    Tests for `select_images_to_free_quota`.
+    """
+    def setUp(self):
+        gigabyte = 1024 ** 3
+        self.images = [OpenstackImage(identifier=str(i), size=size * gigabyte, created_at=datetime(2016, 1, 1 + i))
+                       for i, size in enumerate([1, 5, 2, 3])]
+
+    def test_within_quota(self):
+        image_quota = ImageQuotaConfiguration(max_gigabytes=20, max_images=10)
+        self.assertEqual(set(), select_images_to_free_quota(self.images, self.images, image_quota))
+
+    def test_over_size_quota_selects_largest(self):
+        image_quota = ImageQuotaConfiguration(max_gigabytes=5, headroom=0.2)
+        self.assertEqual({self.images[1], self.images[3]},
+                         select_images_to_free_quota(self.images, self.images, image_quota))
+
+    def test_over_image_quota_selects_oldest(self):
+        image_quota = ImageQuotaConfiguration(max_images=4, headroom=0.25)
+        self.assertEqual({self.images[0]}, select_images_to_free_quota(self.images, self.images, image_quota))
+
+    def test_only_selects_eligible(self):
+        image_quota = ImageQuotaConfiguration(max_gigabytes=1, headroom=0)
+        self.assertEqual({self.images[0], self.images[2]},
+                         select_images_to_free_quota(self.images, self.images[::2], image_quota))
+
+
+class _StubImageManager(_StubListingManager):
+    """
+    Listing manager of the images visible to a tenant.
+    """
+    item_type = OpenstackImage
+
+    def __init__(self, items: Iterable[OpenstackItem], tenant_id: str):
+        super().__init__(items)
+        self.tenant_id = tenant_id
+        self.openstack_credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+
+
+class TestCreateAreaReport(unittest.TestCase):
+    """
+    Tests for `_create_area_report`.
+    """
+    def setUp(self):
+        database_location, dialect = create_stub_database()
+        self.tracker = SqlTracker(f"{dialect}:///{database_location}")
+
+    def test_image_not_owned_by_tenant_over_quota_is_not_deleted(self):
+        gigabyte = 1024 ** 3
+        owned = OpenstackImage(identifier="owned", size=2 * gigabyte, owner="tenant-id",
+                               created_at=datetime(2016, 1, 1))
+        not_owned = OpenstackImage(identifier="not-owned", size=5 * gigabyte, owner="other-tenant-id",
+                                   created_at=datetime(2015, 1, 1))
+        marked_for_deletion, not_marked_for_deletion = _create_area_report(
+            _StubImageManager([owned, not_owned], "tenant-id"), Policy([]), self.tracker, set(),
+            image_quota=ImageQuotaConfiguration(max_gigabytes=1, headroom=0))
+        self.assertEqual([owned], [item for item, _ in marked_for_deletion])
+        self.assertEqual([not_owned], [item for item, _ in not_marked_for_deletion])
+        self.assertIn("Not owned by the tenant so deleting it does not free the tenant's quota",
+                      not_marked_for_deletion[0][1])
+
+    def test_decision_ages_are_measured_at_cycle_time(self):
+        image = OpenstackImage(identifier="image", owner="tenant-id", created_at=datetime(2016, 1, 1))
+        decisions: List[ItemDecision] = []
+        _create_area_report(_StubImageManager([image], "tenant-id"), Policy([]), self.tracker, set(),
+                            decision_listener=decisions.append, now=datetime(2016, 1, 2))
+        self.assertEqual(1, len(decisions))
+        self.assertAlmostEqual(timedelta(days=1), decisions[0].age, delta=timedelta(seconds=1))
+
+
 if __name__ == "__main__":
     unittest.main()
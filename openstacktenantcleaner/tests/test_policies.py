@@ -0,0 +1,131 @@
+import unittest
+from datetime import timedelta, datetime
+from types import SimpleNamespace
+
+from openstacktenantcleaner.models import OpenstackImage, ListingFilter, OpenstackKeypair, OpenstackCredentials
+from openstacktenantcleaner.policies import Policy, Predicate, PredicateInput
+
+
+def _create_predicate(name: str, prevent_delete: bool, inputs=(PredicateInput.ITEM, ), evaluated=None, **kwargs) \
+        -> Predicate:
+    """
+    Creates a predicate that always makes the same decision, recording that it was evaluated.
+    :param name: name of the predicate
+    :param prevent_delete: whether the predicate prevents deletion
+    :param inputs: the predicate's inputs
+    :param evaluated: list that the name of the predicate is appended to when it is evaluated
+    :param kwargs: other arguments to pass to the predicate's constructor
+    :return: the created predicate
+    """
+    def detector(item, credentials, tracker, already_marked_for_deletion, instance_index=None):
+        if evaluated is not None:
+            evaluated.append(name)
+        return prevent_delete, name
+
+    return Predicate(name, detector, inputs, **kwargs)
+
+
+class TestPolicy(unittest.TestCase):
+    """
+    Tests for `Policy`.
+    """
+    def setUp(self):
+        self.evaluated = []
+
+    def test_evaluates_cheapest_predicates_first(self):
+        policy = Policy([
+            _create_predicate("in-use", False, [PredicateInput.INSTANCES], self.evaluated),
+            _create_predicate("age", False, [PredicateInput.AGE], self.evaluated),
+            _create_predicate("exclude", False, [PredicateInput.ITEM], self.evaluated)])
+        decision = policy.evaluate(OpenstackImage(), None, None, set())
+        self.assertEqual(["exclude", "age", "in-use"], self.evaluated)
+        self.assertTrue(decision.delete)
+        self.assertEqual(["exclude", "age", "in-use"], decision.reasons)
+
+    def test_stops_at_predicate_that_prevents_delete(self):
+        policy = Policy([
+            _create_predicate("in-use", True, [PredicateInput.INSTANCES], self.evaluated),
+            _create_predicate("age", True, [PredicateInput.AGE], self.evaluated)])
+        decision = policy.evaluate(OpenstackImage(), None, None, set())
+        self.assertEqual(["age"], self.evaluated)
+        self.assertFalse(decision.delete)
+        self.assertEqual("age", decision.decided_by)
+
+    def test_skips_predicates_that_do_not_apply(self):
+        policy = Policy([_create_predicate("protected", True, evaluated=self.evaluated, item_types=[OpenstackImage])])
+        self.assertTrue(policy.evaluate(OpenstackKeypair(), None, None, set()).delete)
+        self.assertEqual([], self.evaluated)
+
+    def test_no_listing_filter(self):
+        self.assertIsNone(Policy([_create_predicate("in-use", False)]).listing_filter)
+
+    def test_combines_listing_filters(self):
+        policy = Policy([
+            _create_predicate("age", False, listing_filter=ListingFilter(older_than=timedelta(days=1))),
+            _create_predicate("in-use", False),
+            _create_predicate("age", False, listing_filter=ListingFilter(older_than=timedelta(days=2))),
+            _create_predicate("protected", False, listing_filter=ListingFilter(protected=False))])
+        self.assertEqual(ListingFilter(older_than=timedelta(days=2), protected=False), policy.listing_filter)
+
+
+class TestPolicyMemoisation(unittest.TestCase):
+    """
+    Tests for the memoisation of predicate results by `Policy`.
+    """
+    def setUp(self):
+        self.credentials = OpenstackCredentials("http://example.com", "tenant", "user", "password")
+        self.item = OpenstackImage(identifier="123", name="image", created_at=datetime(2016, 1, 1))
+        self.tracker = SimpleNamespace(get_created_time=lambda item: item.created_at)
+        self.evaluated = []
+
+    def test_item_predicate_not_evaluated_again_when_unchanged(self):
+        policy = Policy([_create_predicate("exclude", False, evaluated=self.evaluated)])
+        policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 2))
+        policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 3))
+        self.assertEqual(["exclude"], self.evaluated)
+        self.item.name = "renamed"
+        policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 4))
+        self.assertEqual(["exclude", "exclude"], self.evaluated)
+
+    def test_age_predicate_evaluated_again_after_flip_time(self):
+        prevent_delete = True
+
+        def detector(item, credentials, tracker, already_marked_for_deletion, instance_index=None):
+            self.evaluated.append("age")
+            return prevent_delete, "age"
+
+        policy = Policy([Predicate("age", detector, [PredicateInput.AGE], flips_after=timedelta(days=7))])
+        self.assertFalse(policy.evaluate(
+            self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 2)).delete)
+        self.assertFalse(policy.evaluate(
+            self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 8)).delete)
+        self.assertEqual(1, len(self.evaluated))
+        prevent_delete = False
+        self.assertTrue(policy.evaluate(
+            self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 9)).delete)
+        self.assertEqual(2, len(self.evaluated))
+
+    def test_eligible_time_given_when_kept_by_age_predicate(self):
+        policy = Policy([_create_predicate("age", True, [PredicateInput.AGE], flips_after=timedelta(days=7))])
+        for day in range(2, 4):
+            decision = policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, day))
+            self.assertEqual(datetime(2016, 1, 8), decision.eligible_at)
+        self.assertIsNone(Policy([_create_predicate("exclude", True)]).evaluate(
+            self.item, self.credentials, self.tracker, set()).eligible_at)
+
+    def test_instance_predicate_always_evaluated(self):
+        policy = Policy([_create_predicate("in-use", False, [PredicateInput.INSTANCES], self.evaluated)])
+        for day in range(2, 4):
+            policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, day))
+        self.assertEqual(["in-use", "in-use"], self.evaluated)
+
+    def test_forget_verdicts(self):
+        policy = Policy([_create_predicate("exclude", False, evaluated=self.evaluated)])
+        policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 2))
+        policy.forget_verdicts(self.credentials, OpenstackImage, datetime(2016, 1, 3))
+        policy.evaluate(self.item, self.credentials, self.tracker, set(), now=datetime(2016, 1, 3))
+        self.assertEqual(["exclude", "exclude"], self.evaluated)
+
+
+if __name__ == "__main__":
+    unittest.main()
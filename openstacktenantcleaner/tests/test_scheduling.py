@@ -0,0 +1,136 @@
+import unittest
+from datetime import timedelta, datetime
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from pytz import utc
+
+from openstacktenantcleaner.scheduling import calculate_run_period, RunStatistics, AdaptiveRunScheduler, \
+    QuotaWatcher, EligibilityScheduler
+
+_PERIOD = timedelta(hours=1)
+_MIN_PERIOD = timedelta(minutes=20)
+_MAX_PERIOD = timedelta(hours=4)
+
+
+class TestCalculateRunPeriod(unittest.TestCase):
+    """
+    Tests for `calculate_run_period`.
+    """
+    def test_unchanged_when_unknown(self):
+        self.assertEqual(_PERIOD, calculate_run_period(_PERIOD, RunStatistics(), _MIN_PERIOD, _MAX_PERIOD))
+
+    def test_shortened_when_high_churn(self):
+        self.assertLess(calculate_run_period(_PERIOD, RunStatistics(churn=0.5), _MIN_PERIOD, _MAX_PERIOD), _PERIOD)
+
+    def test_shortened_when_near_quota(self):
+        period = calculate_run_period(_PERIOD, RunStatistics(churn=0, quota_usage=0.9), _MIN_PERIOD, _MAX_PERIOD)
+        self.assertLess(period, _PERIOD)
+
+    def test_lengthened_when_idle(self):
+        self.assertGreater(calculate_run_period(_PERIOD, RunStatistics(churn=0), _MIN_PERIOD, _MAX_PERIOD), _PERIOD)
+
+    def test_bounded(self):
+        self.assertEqual(_MIN_PERIOD, calculate_run_period(
+            _MIN_PERIOD, RunStatistics(churn=1), _MIN_PERIOD, _MAX_PERIOD))
+        self.assertEqual(_MAX_PERIOD, calculate_run_period(
+            _MAX_PERIOD, RunStatistics(churn=0), _MIN_PERIOD, _MAX_PERIOD))
+
+    def test_not_shorter_than_run(self):
+        duration = timedelta(minutes=50)
+        self.assertEqual(duration, calculate_run_period(
+            _PERIOD, RunStatistics(churn=1, duration=duration), _MIN_PERIOD, _MAX_PERIOD))
+
+
+class TestAdaptiveRunScheduler(unittest.TestCase):
+    """
+    Tests for `AdaptiveRunScheduler`.
+    """
+    def setUp(self):
+        self.run_scheduler = AdaptiveRunScheduler(BlockingScheduler(timezone=utc), _PERIOD, _MIN_PERIOD, _MAX_PERIOD)
+
+    def test_add(self):
+        self.run_scheduler.add("tenant", lambda: RunStatistics())
+        self.assertEqual({"tenant"}, self.run_scheduler.get_next_run_times().keys())
+        self.assertEqual({"tenant": _PERIOD}, self.run_scheduler.get_run_periods())
+
+    def test_rescheduled_after_run(self):
+        self.run_scheduler.add("busy", lambda: RunStatistics(churn=1))
+        self.run_scheduler.add("idle", lambda: RunStatistics(churn=0))
+        for name in ("busy", "idle"):
+            job = self.run_scheduler.scheduler.get_job(name)
+            job.func(*job.args)
+        periods = self.run_scheduler.get_run_periods()
+        self.assertLess(periods["busy"], _PERIOD)
+        self.assertGreater(periods["idle"], _PERIOD)
+
+    def test_run_now(self):
+        self.run_scheduler.add("tenant", lambda: RunStatistics())
+        job = self.run_scheduler.scheduler.get_job("tenant")
+        job.func(*job.args)
+        self.run_scheduler.run_now("tenant")
+        self.assertLessEqual(self.run_scheduler.get_next_run_times()["tenant"], datetime.now(utc))
+
+
+class TestQuotaWatcher(unittest.TestCase):
+    """
+    Tests for `QuotaWatcher`.
+    """
+    def setUp(self):
+        self.quota_usages = {"full": 0.95, "empty": 0.1, "unknown": None}
+        self.triggered = []
+        self.quota_watcher = QuotaWatcher(self.quota_usages.get, self.triggered.append, _MIN_PERIOD)
+
+    def test_triggers_when_over_threshold(self):
+        self.assertEqual(["full"], self.quota_watcher.check(self.quota_usages.keys()))
+        self.assertEqual(["full"], self.triggered)
+
+    def test_debounced(self):
+        self.quota_watcher.check(["full"])
+        self.assertEqual([], self.quota_watcher.check(["full"]))
+        self.quota_watcher.debounce_period = timedelta(0)
+        self.assertEqual(["full"], self.quota_watcher.check(["full"]))
+
+
+class TestEligibilityScheduler(unittest.TestCase):
+    """
+    Tests for `EligibilityScheduler`.
+    """
+    def setUp(self):
+        self.revalidated = []
+        self.eligibility_scheduler = EligibilityScheduler(
+            BlockingScheduler(timezone=utc), self.revalidated.extend, resolution=timedelta(minutes=1))
+
+    def test_pop_eligible_in_order(self):
+        self.eligibility_scheduler.add("later", datetime(2016, 1, 3), "later")
+        self.eligibility_scheduler.add("earlier", datetime(2016, 1, 2), "earlier")
+        self.eligibility_scheduler.add("future", datetime(2016, 1, 5), "future")
+        self.assertEqual(datetime(2016, 1, 2), self.eligibility_scheduler.get_next_eligible_time())
+        self.assertEqual(["earlier", "later"], self.eligibility_scheduler.pop_eligible(datetime(2016, 1, 4)))
+        self.assertEqual(1, len(self.eligibility_scheduler))
+
+    def test_add_replaces_and_removes(self):
+        self.eligibility_scheduler.add("moved", datetime(2016, 1, 2), "old")
+        self.eligibility_scheduler.add("moved", datetime(2016, 1, 5), "new")
+        self.eligibility_scheduler.add("removed", datetime(2016, 1, 3), "removed")
+        self.eligibility_scheduler.add("removed", None, None)
+        self.assertEqual([], self.eligibility_scheduler.pop_eligible(datetime(2016, 1, 4)))
+        self.assertEqual(["new"], self.eligibility_scheduler.pop_eligible(datetime(2016, 1, 5)))
+
+    def test_reschedule_at_end_of_slot(self):
+        self.eligibility_scheduler.add("item", datetime(2016, 1, 2, 0, 0, 30), "item")
+        self.eligibility_scheduler.reschedule()
+        job = self.eligibility_scheduler.scheduler.get_job(self.eligibility_scheduler.job_id)
+        self.assertEqual(datetime(2016, 1, 2, 0, 1), job.trigger.run_date.replace(tzinfo=None))
+
+    def test_run_revalidates_eligible(self):
+        self.eligibility_scheduler.add("eligible", datetime.now() - timedelta(seconds=1), "eligible")
+        self.eligibility_scheduler.add("not-eligible", datetime.now() + timedelta(days=1), "not-eligible")
+        self.eligibility_scheduler.reschedule()
+        job = self.eligibility_scheduler.scheduler.get_job(self.eligibility_scheduler.job_id)
+        job.func(*job.args)
+        self.assertEqual(["eligible"], self.revalidated)
+        self.assertIsNotNone(self.eligibility_scheduler.scheduler.get_job(self.eligibility_scheduler.job_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import unittest
+from datetime import timedelta
+from io import StringIO
+
+from openstacktenantcleaner.common import create_item_fingerprint
+from openstacktenantcleaner.models import ItemDecision, OpenstackImage, OpenstackKeypair, OpenstackCredentials, \
+    PlannedDelete
+from openstacktenantcleaner.serialisation import decision_to_json, JsonLinesDecisionWriter, DELETE_VERDICT, \
+    KEEP_VERDICT, PlanFileWriter, read_plan_file
+
+_TENANT = "my-tenant"
+
+
+class TestDecisionToJson(unittest.TestCase):
+    """
+    Tests for `decision_to_json`.
+    """
+    def test_with_delete(self):
+        decision = ItemDecision(tenant=_TENANT, item=OpenstackImage(identifier="123", name="my-image"),
+                                age=timedelta(minutes=1), delete=True, reasons=["reason"])
+        self.assertEqual({"tenant": _TENANT, "type": OpenstackImage.__name__, "id": "123", "name": "my-image",
+                          "age": 60.0, "verdict": DELETE_VERDICT, "reasons": ["reason"], "decided_by": None},
+                         decision_to_json(decision))
+
+    def test_with_keep_and_unknown_age(self):
+        decision = ItemDecision(tenant=_TENANT, item=OpenstackKeypair(identifier="123", name="my-key"), delete=False)
+        json_decision = decision_to_json(decision)
+        self.assertEqual(KEEP_VERDICT, json_decision["verdict"])
+        self.assertIsNone(json_decision["age"])
+
+
+class TestJsonLinesDecisionWriter(unittest.TestCase):
+    """
+    Tests for `JsonLinesDecisionWriter`.
+    """
+    def test_write(self):
+        stream = StringIO()
+        writer = JsonLinesDecisionWriter(stream)
+        decisions = [ItemDecision(tenant=_TENANT, item=OpenstackImage(identifier=str(i)), delete=i % 2 == 0)
+                     for i in range(3)]
+        for decision in decisions:
+            writer(decision)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([decision_to_json(decision) for decision in decisions], [json.loads(line) for line in lines])
+
+
+class TestPlanFile(unittest.TestCase):
+    """
+    Tests for `PlanFileWriter` and `read_plan_file`.
+    """
+    def setUp(self):
+        self.credentials = OpenstackCredentials("http://example.com", _TENANT, "user", "password")
+
+    def test_write_then_read(self):
+        stream = StringIO()
+        writer = PlanFileWriter(stream)
+        items = [OpenstackImage(identifier=str(i), name=f"image-{i}") for i in range(3)]
+        for item in items:
+            writer(ItemDecision(tenant=_TENANT, item=item, delete=item.identifier != "1", credentials=self.credentials))
+        self.assertNotIn(self.credentials.password, stream.getvalue())
+
+        stream.seek(0)
+        self.assertEqual([PlannedDelete(
+            auth_url=self.credentials.auth_url, tenant=_TENANT, username=self.credentials.username,
+            item_type=OpenstackImage.__name__, identifier=item.identifier, name=item.name,
+            fingerprint=create_item_fingerprint(item)) for item in (items[0], items[2])], read_plan_file(stream))
+
+    def test_read_unsupported_version(self):
+        self.assertRaises(ValueError, read_plan_file, StringIO('{"version": 0}\n'))
+
+
+if __name__ == "__main__":
+    unittest.main()
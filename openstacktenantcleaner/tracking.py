@@ -1,15 +1,98 @@
+import copy
 from abc import ABCMeta, abstractmethod
 from datetime import timedelta, datetime
 
-from typing import Optional, Type, Iterable, Union, Collection
+from typing import Optional, Type, Iterable, Union, Collection, Set, Dict, Tuple
 
-from openstacktenantcleaner.models import OpenstackItem, Timestamped, OpenstackIdentifier
+from openstacktenantcleaner.journal import DeleteJournal
+from openstacktenantcleaner.leasing import LeaseStore
+from openstacktenantcleaner.models import OpenstackItem, Timestamped, OpenstackIdentifier, OpenstackCredentials
+
+# Partition of items tracked before the tracker was partitioned
+UNPARTITIONED = ""
+
+# How long the tracking of an item that no longer exists is retained, such that if it reappears it keeps its age
+DEFAULT_GRACE_PERIOD = timedelta(days=1)
+
+
+def get_created(item: OpenstackItem, default: datetime) -> datetime:
+    """
+    Gets when the given item was created, according to OpenStack.
+    :param item: the item of interest
+    :param default: the value to return if OpenStack does not provide the item's created time
+    :return: when the item was created
+    """
+    if isinstance(item, Timestamped) and item.created_at is not None:
+        return item.created_at
+    return default
+
+
+def create_partition_key(credentials: OpenstackCredentials, include_user: bool=False) -> str:
+    """
+    Creates the key of the tracker partition that holds items belonging to the tenant of the given credentials.
+    :param credentials: credentials for the tenant
+    :param include_user: whether the partition should be specific to the user of the credentials (e.g. for items that
+    are owned by the user, such as key-pairs)
+    :return: the partition key
+    """
+    key = f"{credentials.auth_url}#{credentials.tenant}"
+    return f"{key}#{credentials.username}" if include_user else key
+
+
+class TrackerSynchronisation:
+    """
+    Synchronisation of a tracker's items of a type with a listing of all the items of that type on OpenStack, which is
+    given page by page so that the listing does not have to be held in memory. Items that were not in the listing are
+    un-registered when the synchronisation is finished. This implementation remembers the identifiers of the items in
+    the listing; tracker implementations can provide a synchronisation that does not.
+    """
+    def __init__(self, tracker: "Tracker", item_type: Type[OpenstackItem]):
+        """
+        Constructor.
+        :param tracker: the tracker to synchronise
+        :param item_type: the type of the items in the listing
+        """
+        self.tracker = tracker
+        self.item_type = item_type
+        self.started = datetime.now()
+        self._seen: Set[OpenstackIdentifier] = set()
+
+    def add(self, items: Iterable[OpenstackItem]):
+        """
+        Registers the given page of items in the listing, if they are new.
+        :param items: the page of items
+        """
+        items = list(items)
+        self.tracker.register(items)
+        self._seen.update(item.identifier for item in items)
+
+    def finish(self):
+        """
+        Un-registers the items that were not in the listing.
+        """
+        self.tracker.unregister(set(self.tracker.get_registered_identifiers(item_type=self.item_type)) - self._seen,
+                                item_type=self.item_type)
 
 
 class Tracker(metaclass=ABCMeta):
     """
-    Item age tracker.
+    Item age tracker. Tracked items are partitioned (e.g. by tenant) and each tracker instance is a view of one
+    partition.
     """
+    # Set on snapshots (see `get_snapshot`)
+    _snapshot_time: Optional[datetime] = None
+    _created_before: Optional[Dict[Tuple[str, timedelta], Set[OpenstackIdentifier]]] = None
+    _created_times: Optional[Dict[str, Dict[OpenstackIdentifier, datetime]]] = None
+
+    @abstractmethod
+    def get_partition(self, partition: str) -> "Tracker":
+        """
+        Gets a tracker for the given partition, which shares this tracker's storage. Trackers of different partitions
+        can be used concurrently.
+        :param partition: the partition key, e.g. created with `create_partition_key`
+        :return: tracker for the partition
+        """
+
     @abstractmethod
     def get_age(self, item: OpenstackItem) -> Optional[timedelta]:
         """
@@ -27,9 +110,10 @@ class Tracker(metaclass=ABCMeta):
         """
 
     @abstractmethod
-    def _unregister(self, item: Union[OpenstackItem, OpenstackIdentifier]):
+    def _unregister(self, item: OpenstackItem):
         """
-        Un-register the existence of an item.
+        Un-register the existence of an item. If the item reappears within the tracker's grace period, it should keep
+        its original created time.
         :param item: the item that no longer exists
         """
 
@@ -42,6 +126,129 @@ class Tracker(metaclass=ABCMeta):
         :return: the registered items' identifiers
         """
 
+    def get_created_before(self, item_type: Type[OpenstackItem], cutoff: datetime,
+                           identifiers: Collection[OpenstackIdentifier]=None) -> Set[OpenstackIdentifier]:
+        """
+        Gets the identifiers of the registered items of the given type that were created before the given time. This
+        implementation gets the age of each item in turn; tracker implementations should use a single query.
+        :param item_type: the type of the items
+        :param cutoff: the time that items must have been created before
+        :param identifiers: the identifiers of the items of interest (all registered items if `None`)
+        :return: the identifiers of the items created before the cutoff
+        """
+        now = datetime.now()
+        if identifiers is None:
+            identifiers = self.get_registered_identifiers(item_type=item_type)
+        created_before = set()
+        for identifier in identifiers:
+            age = self.get_age(item_type(identifier=identifier))
+            if age is not None and now - age < cutoff:
+                created_before.add(identifier)
+        return created_before
+
+    def get_created_times(self, item_type: Type[OpenstackItem], identifiers: Collection[OpenstackIdentifier]=None) \
+            -> Dict[OpenstackIdentifier, datetime]:
+        """
+        Gets when the registered items of the given type were created. This implementation gets the age of each item in
+        turn; tracker implementations should use a single query.
+        :param item_type: the type of the items
+        :param identifiers: the identifiers of the items of interest (all registered items if `None`)
+        :return: map between the identifiers of the registered items and when they were created
+        """
+        now = datetime.now()
+        if identifiers is None:
+            identifiers = self.get_registered_identifiers(item_type=item_type)
+        created_times = {}
+        for identifier in identifiers:
+            age = self.get_age(item_type(identifier=identifier))
+            if age is not None:
+                created_times[identifier] = now - age
+        return created_times
+
+    def get_snapshot(self, now: datetime=None) -> "Tracker":
+        """
+        Gets a view of this tracker in which `is_older_than` measures ages at the given time and fetches the items of
+        each type that are older than each age once, using `get_created_before` (unless the created times of the type
+        have already been fetched), and `get_created_time` fetches the created times of the items of each type once.
+        Items registered after the items of their type are first fetched are not seen, unless they are fetched with
+        `fetch`.
+        :param now: the time that ages are measured at (the current time if `None`)
+        :return: the snapshot, which shares this tracker's storage
+        """
+        snapshot = copy.copy(self)
+        snapshot._snapshot_time = now if now is not None else datetime.now()
+        snapshot._created_before = {}
+        snapshot._created_times = {}
+        return snapshot
+
+    def fetch(self, item_type: Type[OpenstackItem], identifiers: Collection[OpenstackIdentifier]):
+        """
+        Fetches when the given items were created into this snapshot, using `get_created_times`, replacing any items of
+        their type that were fetched before. Only the given items of the type are seen by the snapshot after, which
+        allows a snapshot to be reused for each page of a listing without fetching every item of the type for each page.
+        :param item_type: the type of the items
+        :param identifiers: the identifiers of the items
+        :raises ValueError: if this tracker is not a snapshot
+        """
+        if self._snapshot_time is None:
+            raise ValueError("Only the items of a snapshot can be fetched")
+        self._created_times[item_type.__name__] = self.get_created_times(item_type, identifiers)
+
+    def is_older_than(self, item: OpenstackItem, age: timedelta) -> bool:
+        """
+        Gets whether the given item is older than the given age. Items that are not registered are not.
+        :param item: the item of interest
+        :param age: the age
+        :return: whether the item is older than the age
+        """
+        if self._snapshot_time is None:
+            item_age = self.get_age(item)
+            return item_age is not None and item_age > age
+        item_type = type(item).__name__
+        if item_type in self._created_times:
+            created = self._created_times[item_type].get(item.identifier)
+            return created is not None and created < self._snapshot_time - age
+        key = (item_type, age)
+        if key not in self._created_before:
+            self._created_before[key] = self.get_created_before(type(item), self._snapshot_time - age)
+        return item.identifier in self._created_before[key]
+
+    def get_created_time(self, item: OpenstackItem) -> Optional[datetime]:
+        """
+        Gets when the given item was created.
+        :param item: the item of interest
+        :return: when the item was created or `None` if it is not registered
+        """
+        if self._snapshot_time is None:
+            item_age = self.get_age(item)
+            return datetime.now() - item_age if item_age is not None else None
+        item_type = type(item).__name__
+        if item_type not in self._created_times:
+            self._created_times[item_type] = self.get_created_times(type(item))
+        return self._created_times[item_type].get(item.identifier)
+
+    def create_delete_journal(self) -> Optional[DeleteJournal]:
+        """
+        Creates a journal of deletes that is stored alongside the tracker's storage. This implementation does not
+        support a journal.
+        :return: the created journal (`None` if not supported)
+        """
+        return None
+
+    def create_lease_store(self) -> Optional[LeaseStore]:
+        """
+        Creates a store of the leases that nodes sharing the tracker's storage hold on tenants. This implementation does
+        not support sharing its storage between nodes.
+        :return: the created lease store (`None` if not supported)
+        """
+        return None
+
+    def compact(self):
+        """
+        Performs maintenance of the tracker's storage, such as purging the tracking of items that have not existed for
+        longer than the grace period.
+        """
+
     def register(self, item: Union[OpenstackItem, Iterable[OpenstackItem]]):
         """
         Register an item or items as having just come into existence.
@@ -50,14 +257,43 @@ class Tracker(metaclass=ABCMeta):
         items = [item] if isinstance(item, OpenstackItem) else item
         for item in items:
             if self.get_age(item) is None:
-                created = item.created_at if isinstance(item, Timestamped) else datetime.now()
+                created = get_created(item, datetime.now())
                 self._register(item, created)
 
-    def unregister(self, item: Union[OpenstackItem, Iterable[OpenstackItem], str, Iterable[str]]):
+    def unregister(self, item: Union[OpenstackItem, Iterable[OpenstackItem], str, Iterable[str]],
+                   item_type: Type[OpenstackItem]=None):
         """
         Un-register the existence of an item or items.
-        :param item: the item or items that no longer exists
+        :param item: the item or items that no longer exists, or their identifiers
+        :param item_type: the type of the items, which is required if identifiers are given (as items of different types
+        can have the same identifier)
+        :raises ValueError: if identifiers are given without the type of the items
         """
         items = [item] if isinstance(item, OpenstackItem) or isinstance(item, str) else item
         for item in items:
+            if not isinstance(item, OpenstackItem):
+                if item_type is None:
+                    raise ValueError(f"The type of the item with identifier \"{item}\" must be given to un-register it")
+                item = item_type(identifier=item)
             self._unregister(item)
+
+    def create_synchronisation(self, item_type: Type[OpenstackItem]) -> TrackerSynchronisation:
+        """
+        Creates a synchronisation of the tracked items of the given type with a listing of those that currently exist on
+        OpenStack, which is given page by page. Equivalent to `synchronise`, without requiring the complete listing.
+        :param item_type: the type of the items
+        :return: the synchronisation, which must be finished after all pages of the listing have been added
+        """
+        return TrackerSynchronisation(self, item_type)
+
+    def synchronise(self, items: Iterable[OpenstackItem], item_type: Type[OpenstackItem]):
+        """
+        Synchronises the tracked items of the given type with those that currently exist on OpenStack, registering new
+        items and un-registering those that no longer exist.
+        :param items: all the items of the given type that currently exist
+        :param item_type: the type of the items
+        """
+        items = list(items)
+        registered_identifiers = set(self.get_registered_identifiers(item_type=item_type))
+        self.register([item for item in items if item.identifier not in registered_identifiers])
+        self.unregister(registered_identifiers - {item.identifier for item in items}, item_type=item_type)